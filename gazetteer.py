@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+地名词典与选址意图解析
+    Aho-Corasick 自动机匹配城市/商圈标准名及别名，数字（客单价、预算、座位数）
+    在同一次逐字扫描中识别，解析耗时与词典规模无关、与输入长度成线性。
+
+词典文件为UTF-8 TSV，每行：类型<TAB>标准名<TAB>所属城市<TAB>别名（以|分隔，可空）
+类型为 city 或 district；# 开头的行为注释。
+"""
+
+import os
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.environ.get(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.tsv"))
+
+# 数字前后的提示词（向前最多看4个字、向后最多看3个字，扫描仍为线性）
+PRICE_HINTS = ('客单价', '人均', '单价')
+BUDGET_HINTS = ('预算', '投资', '资金')
+SEAT_HINTS = ('座位', '餐位')
+SEAT_UNITS = ('个座', '座', '个餐位', '餐位', '位')
+
+
+class Gazetteer:
+    """Aho-Corasick 地名自动机：词条为 (类型, 标准名, 所属城市)，每个词条可挂多个别名"""
+    def __init__(self):
+        self._goto = [{}]       # 节点 -> {字符: 子节点}
+        self._fail = [0]        # 失配链接
+        self._out = [None]      # 节点 -> (词长, [词条id])，以该节点结尾的词
+        self._dict_link = [0]   # 沿失配链最近的有输出节点（0表示无）
+        self.entries = []
+        self._built = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, kind, name, city=None, aliases=()):
+        """添加词条（标准名与别名都指向同一词条）"""
+        entry_id = len(self.entries)
+        self.entries.append((kind, name, city or (name if kind == 'city' else None)))
+        for term in (name, *aliases):
+            if term:
+                self._insert(term, entry_id)
+        self._built = False
+        return entry_id
+
+    def _insert(self, term, entry_id):
+        node = 0
+        for ch in term:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._dict_link.append(0)
+            node = nxt
+        if self._out[node] is None:
+            self._out[node] = (len(term), [])
+        if entry_id not in self._out[node][1]:
+            self._out[node][1].append(entry_id)
+
+    def build(self):
+        """按层BFS计算失配链接与输出链接"""
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        queue = deque(goto[0].values())  # 第一层失配链接均指向根
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0)
+                dict_link[child] = fail[child] if out[fail[child]] is not None else dict_link[fail[child]]
+                queue.append(child)
+        self._built = True
+        return self
+
+    def step(self, node, ch):
+        """自动机读入一个字符，返回新状态"""
+        goto, fail = self._goto, self._fail
+        while node and ch not in goto[node]:
+            node = fail[node]
+        return goto[node].get(ch, 0)
+
+    def outputs(self, node):
+        """当前状态命中的所有词：(词长, [词条id])"""
+        if self._out[node] is not None:
+            yield self._out[node]
+        node = self._dict_link[node]
+        while node:
+            yield self._out[node]
+            node = self._dict_link[node]
+
+    def scan(self, text):
+        """返回全部命中：(起点, 终点, [词条id])"""
+        if not self._built:
+            self.build()
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            node = self.step(node, ch)
+            for length, ids in self.outputs(node):
+                matches.append((i + 1 - length, i + 1, ids))
+        return matches
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        """从TSV词典文件构建自动机"""
+        gaz = cls()
+        with open(path, encoding='utf-8') as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.rstrip('\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                parts = line.split('\t')
+                if len(parts) < 2 or parts[0] not in ('city', 'district'):
+                    logger.warning("词典第%d行格式错误，已跳过：%s", lineno, line)
+                    continue
+                kind, name = parts[0], parts[1].strip()
+                city = parts[2].strip() if len(parts) > 2 and parts[2].strip() else None
+                aliases = [a.strip() for a in parts[3].split('|')] if len(parts) > 3 else []
+                gaz.add(kind, name, city, aliases)
+        return gaz.build()
+
+
+_default_gazetteer = None
+
+def get_gazetteer():
+    """进程内共享的默认词典（首次使用时加载；词典文件缺失时为空词典）"""
+    global _default_gazetteer
+    if _default_gazetteer is None:
+        if os.path.exists(GAZETTEER_PATH):
+            _default_gazetteer = Gazetteer.load(GAZETTEER_PATH)
+        else:
+            logger.warning("未找到地名词典 %s，仅使用正则回退解析", GAZETTEER_PATH)
+            _default_gazetteer = Gazetteer().build()
+    return _default_gazetteer
+
+
+def _leftmost_longest(spans):
+    """同类命中中取最靠前、同起点取最长的一个"""
+    return min(spans, key=lambda m: (m[0], m[0] - m[1])) if spans else None
+
+
+def _classify_number(text, start, end, value):
+    """按数字前后的提示词与单位判断含义，返回 (字段, 值) 或 None"""
+    before = text[max(0, start - 4):start]
+    after = text[end:end + 3]
+    if after.startswith('万'):
+        return 'budget', value
+    if after.startswith(SEAT_UNITS) or any(h in before for h in SEAT_HINTS):
+        return ('seat_count', int(value)) if value >= 10 else None
+    if any(h in before for h in BUDGET_HINTS):
+        # “预算200”默认单位为万元，“预算2000000元”按元换算
+        return 'budget', value / 10000 if value >= 10000 else value
+    if after.startswith(('元', '块')) or any(h in before for h in PRICE_HINTS):
+        return ('avg_price', int(value)) if 10 <= value <= 999 else None
+    return None
+
+
+def parse_intent(text, gazetteer=None):
+    """一次逐字扫描提取城市、商圈、客单价、预算（万元）、座位数；未识别的字段为None
+
+    同时返回 city_end（城市名结束位置），便于调用方对未收录商圈做回退识别。
+    """
+    gaz = gazetteer if gazetteer is not None else get_gazetteer()
+    if not gaz._built:
+        gaz.build()
+    result = {'city': None, 'district': None, 'avg_price': None, 'budget': None,
+              'seat_count': None, 'city_end': None}
+    cities, districts = [], []
+    numbers = []
+    node = 0
+    num_start = None
+    for i, ch in enumerate(text + ' '):  # 末尾哨兵用于收尾数字
+        if '0' <= ch <= '9' or (ch == '.' and num_start is not None):
+            if num_start is None:
+                num_start = i
+        elif num_start is not None:
+            numbers.append((num_start, i))
+            num_start = None
+        if i == len(text):
+            break
+        node = gaz.step(node, ch)
+        for length, ids in gaz.outputs(node):
+            city_ids = [e for e in ids if gaz.entries[e][0] == 'city']
+            if city_ids:
+                cities.append((i + 1 - length, i + 1, city_ids))
+            if len(city_ids) < len(ids):
+                districts.append((i + 1 - length, i + 1, [e for e in ids if gaz.entries[e][0] != 'city']))
+
+    # 地名：商圈优先（“南京西路”“北京路”不应被识别为城市），与商圈重叠的城市命中忽略
+    district = _leftmost_longest(districts)
+    if district:
+        cities = [c for c in cities if c[1] <= district[0] or c[0] >= district[1]]
+    city = _leftmost_longest(cities)
+    if city:
+        result['city'] = gaz.entries[city[2][0]][1]
+        result['city_end'] = city[1]
+    if district:
+        candidates = [gaz.entries[e] for e in district[2]]
+        chosen = next((e for e in candidates if e[2] == result['city']), candidates[0])
+        result['district'] = chosen[1]
+        result['city'] = result['city'] or chosen[2]
+
+    for start, end in numbers:
+        try:
+            value = float(text[start:end].rstrip('.'))
+        except ValueError:
+            continue
+        classified = _classify_number(text, start, end, value)
+        if classified and result[classified[0]] is None:
+            result[classified[0]] = classified[1]
+    return result
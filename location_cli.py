@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+湘菜品牌智能选址 - 命令行批量评分
+
+用法：
+    python location_cli.py candidates.csv -o ranked.parquet
+    python location_cli.py candidates.csv -o ranked.csv --workers 8 --brand-config brand.json
+    python location_cli.py --scan-city 苏州 --prices 39,49,59 --job     # 作为后台任务提交（界面可查看进度）
+    python location_cli.py --list-jobs
+    python location_cli.py --resume 20240301-101500-ab12cd -o ranked.parquet
+
+输入CSV需包含 city、district 两列，可选 avg_price 列；
+设置 AMAP_KEY 环境变量（或 --amap-key）使用高德真实数据，否则使用模拟数据。
+--job/--resume 在前台执行任务，进度与结果写入 LOCATION_JOBS_DIR（默认 .jobs/），与界面共享同一任务目录。
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+from location_core import DEFAULT_BRAND_CONFIG, score_candidates_parallel
+from location_jobs import JobQueue, city_scan_candidates
+
+
+def write_result(df, path):
+    """按扩展名写出结果：.parquet 需要 pyarrow，其余写 UTF-8 CSV"""
+    if path.lower().endswith('.parquet'):
+        try:
+            df.to_parquet(path, index=False)
+        except ImportError:
+            sys.exit("写出Parquet需要安装 pyarrow：pip install pyarrow")
+    else:
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def print_progress(job):
+    """任务进度回调：进度行输出到stderr"""
+    print(f"\r任务 {job['id']}：{job['done_chunks']}/{job['total_chunks']} 块", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量候选选址评分（多进程）")
+    parser.add_argument("candidates", nargs="?", help="候选清单CSV（列：city, district，可选 avg_price）")
+    parser.add_argument("--scan-city", help="全城扫描：以地名词典中该城市的全部商圈为候选（代替候选清单）")
+    parser.add_argument("--prices", help="全城扫描的客单价档位，逗号分隔，默认品牌客单价")
+    parser.add_argument("-o", "--output", default="ranked_candidates.parquet",
+                        help="输出文件（.parquet 或 .csv），默认 ranked_candidates.parquet")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="进程数，默认CPU核数")
+    parser.add_argument("--chunk-size", type=int, default=500, help="每个任务块的候选行数")
+    parser.add_argument("--brand-config", help="品牌参数JSON文件，缺省项取默认品牌配置")
+    parser.add_argument("--amap-key", default=os.environ.get("AMAP_KEY"),
+                        help="高德API Key，多个Key以逗号分隔（默认读取 AMAP_KEY 环境变量，留空使用模拟数据）")
+    parser.add_argument("--local-poi", action="store_true", help="优先使用 poi_index/ 下的本地POI索引")
+    parser.add_argument("--job", action="store_true", help="作为持久化任务执行：进度落盘，界面可查看，中断后可续跑")
+    parser.add_argument("--resume", metavar="JOB_ID", help="续跑中断的任务并写出结果")
+    parser.add_argument("--list-jobs", action="store_true", help="列出最近的扫描任务")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    brand_config = dict(DEFAULT_BRAND_CONFIG)
+    if args.brand_config:
+        with open(args.brand_config, encoding='utf-8') as f:
+            brand_config.update(json.load(f))
+
+    if args.list_jobs or args.resume or args.job:
+        queue = JobQueue(workers=args.workers or os.cpu_count() or 1, chunk_size=args.chunk_size)
+    if args.list_jobs:
+        for job in queue.list_jobs():
+            print(f"{job['id']}  {job['status']:<11} {job['done_chunks']}/{job['total_chunks']} 块  {job['name']}")
+        return
+
+    start = time.perf_counter()
+    if args.resume:
+        job_id = args.resume
+    else:
+        if args.scan_city:
+            prices = [float(p) for p in args.prices.split(',')] if args.prices else [brand_config['avg_price']]
+            candidates = city_scan_candidates(args.scan_city, prices)
+            if candidates.empty:
+                sys.exit(f"地名词典中没有 {args.scan_city} 的商圈")
+        elif args.candidates:
+            candidates = pd.read_csv(args.candidates)
+        else:
+            parser.error("需要提供候选清单CSV或 --scan-city")
+        missing = {'city', 'district'} - set(candidates.columns)
+        if missing:
+            sys.exit(f"候选清单缺少列：{', '.join(sorted(missing))}")
+        if not args.job:
+            ranked = score_candidates_parallel(candidates, brand_config, amap_key=args.amap_key,
+                                               workers=args.workers, chunk_size=args.chunk_size,
+                                               use_local_poi=args.local_poi)
+        else:
+            name = f"{args.scan_city} 全城扫描" if args.scan_city else os.path.basename(args.candidates)
+            job_id = queue.create(candidates, brand_config, amap_key=args.amap_key,
+                                  use_local_poi=args.local_poi, name=name)
+    if args.resume or args.job:
+        print(f"任务ID：{job_id}（Ctrl+C 中断后可用 --resume 续跑）", file=sys.stderr)
+        try:
+            status = queue.run(job_id, amap_key=args.amap_key, on_progress=print_progress)
+        except (KeyError, ValueError) as e:
+            sys.exit(f"无法执行任务 {job_id}：{e}")
+        print(file=sys.stderr)
+        if status != 'done':
+            sys.exit(f"任务 {job_id} 未完成（{status}）：{queue.status(job_id)['error'] or ''}")
+        ranked = queue.result(job_id)
+    write_result(ranked, args.output)
+    mode = "真实数据" if args.amap_key else "模拟数据"
+    print(f"已评分 {len(ranked)} 个候选（{mode}，耗时 {time.perf_counter() - start:.1f}s）-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
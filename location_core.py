@@ -0,0 +1,2683 @@
+# -*- coding: utf-8 -*-
+"""
+湘菜品牌智能选址决策系统 - 无界面核心库
+    高德数据接入、模拟数据、财务/风险/推荐模型、批量评分与对话顾问，
+    不依赖Streamlit，可在脚本、命令行与多进程任务中直接调用。
+"""
+
+import numpy as np
+import json
+import math
+import pickle
+import re
+import time
+import hashlib
+import os
+from collections import OrderedDict
+import copy
+import random
+import logging
+import sqlite3
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait
+
+from gazetteer import get_gazetteer, parse_intent
+
+logger = logging.getLogger(__name__)
+# pandas、requests 导入较慢（合计近1秒），只在真正用到的函数内导入，模拟模式首屏无需加载
+
+# ---------- 高德API本地持久化缓存 ----------
+AMAP_CACHE_PATH = ".amap_cache.sqlite"
+
+class AMapCache:
+    """高德API响应的SQLite持久化缓存（分接口TTL + 容量LRU淘汰）"""
+    # 各接口缓存有效期（秒）：行政区划极少变动，POI搜索变动较快
+    DEFAULT_TTLS = {
+        'config/district': 30 * 86400,
+        'geocode/geo': 7 * 86400,
+        'place/around': 86400,
+        'place/text': 6 * 3600,
+    }
+
+    def __init__(self, path=AMAP_CACHE_PATH, max_entries=5000, ttls=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """接口 + 规范化参数（剔除key）生成缓存键"""
+        normalized = {k: str(v).strip() for k, v in params.items() if k != 'key'}
+        raw = endpoint + '?' + json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, endpoint, params):
+        """读取未过期的缓存响应，未命中返回None"""
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttls.get(endpoint, 86400):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, endpoint, params, data):
+        """写入响应，超出容量时淘汰最久未访问的条目"""
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, payload, now, now)
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE cache_key IN "
+                    "(SELECT cache_key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (overflow,)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        """清空缓存与计数"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """命中/未命中计数与当前条目数"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': size,
+            'max_entries': self.max_entries
+        }
+
+# ---------- 高德API限流 / 重试 / 请求合并 ----------
+AMAP_QPS = float(os.environ.get("AMAP_QPS", "3"))  # 个人开发者Key默认并发上限
+AMAP_DAILY_QUOTA = int(os.environ.get("AMAP_DAILY_QUOTA", "5000"))  # 0表示不限
+AMAP_MAX_RETRIES = 3
+AMAP_RETRY_INFOCODES = {'10004', '10014', '10019', '10020', '10021'}  # 访问过频/QPS超限，可重试
+AMAP_QUOTA_INFOCODES = {'10003', '10044', '10045'}  # 日调用量超限，当天不再请求
+
+class AMapError(Exception):
+    """高德接口调用失败（重试后仍未成功）"""
+
+class AMapQuotaExceeded(AMapError):
+    """高德日配额耗尽（本地计数或服务端返回超限）"""
+
+class TokenBucket:
+    """令牌桶限流：按QPS匀速补充令牌，同时统计当日调用量"""
+    def __init__(self, rate, capacity=None, daily_quota=0):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.daily_quota = daily_quota
+        self.used_today = 0
+        self._day = time.strftime("%Y-%m-%d")
+        self.exhausted_day = None
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _roll_day(self):
+        today = time.strftime("%Y-%m-%d")
+        if today != self._day:
+            self._day = today
+            self.used_today = 0
+    
+    def remaining_today(self):
+        """当日剩余配额（不限配额时返回None）"""
+        with self._lock:
+            self._roll_day()
+            if not self.daily_quota:
+                return None
+            return max(0, self.daily_quota - self.used_today)
+    
+    def headroom(self):
+        """当前余量：(是否有可用令牌, 当日剩余配额, 当前令牌数)，用于多Key路由比较；不消耗令牌"""
+        with self._lock:
+            self._roll_day()
+            tokens = min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            remaining = self.daily_quota - self.used_today if self.daily_quota else math.inf
+            return (tokens >= 1, remaining, tokens)
+    
+    def mark_exhausted(self):
+        """服务端返回配额超限时，将当日用量记满"""
+        with self._lock:
+            self._roll_day()
+            self.used_today = max(self.used_today, self.daily_quota)
+            self.exhausted_day = self._day  # 不限配额的Key被服务端判定超限时，当天同样停用
+    
+    def exhausted(self):
+        """当日是否已不可用"""
+        with self._lock:
+            self._roll_day()
+            return (bool(self.daily_quota) and self.used_today >= self.daily_quota) or \
+                self.exhausted_day == self._day
+    
+    def acquire(self):
+        """取得一个令牌（预占后在锁外等待），当日配额耗尽时抛出AMapQuotaExceeded"""
+        with self._lock:
+            self._roll_day()
+            if (self.daily_quota and self.used_today >= self.daily_quota) or self.exhausted_day == self._day:
+                raise AMapQuotaExceeded(f"今日调用量已达上限 {self.daily_quota}")
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.used_today += 1
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+def parse_amap_keys(api_key):
+    """多个Key以逗号、分号或空白分隔（也可直接传列表），去重并保持顺序"""
+    if isinstance(api_key, str):
+        api_key = re.split(r'[\s,;，；]+', api_key)
+    return list(dict.fromkeys(k.strip() for k in api_key if k and k.strip()))
+
+def mask_key(key):
+    """界面与日志中显示的Key（只保留首尾4位）"""
+    return f"{key[:4]}…{key[-4:]}" if len(key) > 8 else "…"
+
+class AMapKeyPool:
+    """多Key配额池：每个Key独立的令牌桶（QPS + 日配额），请求路由到余量最大的Key，
+    服务端返回配额超限的Key当天自动停用，请求转发到其余Key
+    
+    bucket_for(key) 返回该Key的令牌桶；由 AMapClientRegistry 提供时同一Key在进程内只有一个桶，
+    Key组合不同（或顺序不同）的多个配额池共用同一份QPS与日配额。缺省时每个池自建令牌桶。
+    """
+    def __init__(self, keys, qps=AMAP_QPS, daily_quota=AMAP_DAILY_QUOTA, bucket_for=None):
+        if not keys:
+            raise ValueError("至少需要一个高德API Key")
+        self.buckets = {k: bucket_for(k) if bucket_for else TokenBucket(qps, daily_quota=daily_quota)
+                        for k in keys}
+        self.requests = dict.fromkeys(keys, 0)
+        self.failovers = 0
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """选出余量最大的Key并取得令牌，返回该Key：优先有可用令牌的Key，其次当日剩余配额多的；
+        全部Key耗尽时抛出AMapQuotaExceeded"""
+        while True:
+            with self._lock:
+                ranked = [(b.headroom(), k) for k, b in self.buckets.items() if not b.exhausted()]
+                if not ranked:
+                    raise AMapQuotaExceeded(f"{len(self.buckets)} 个Key今日调用量均已达上限")
+                key = max(ranked)[1]
+                self.requests[key] += 1
+            try:
+                self.buckets[key].acquire()
+                return key
+            except AMapQuotaExceeded:
+                continue  # 并发下该Key刚好用尽，换下一个
+    
+    def mark_exhausted(self, key):
+        """该Key被服务端判定超限：当天停用"""
+        self.buckets[key].mark_exhausted()
+        with self._lock:
+            self.failovers += 1
+        logger.warning("高德Key %s 今日配额耗尽，后续请求转由其余Key承担", mask_key(key))
+    
+    @property
+    def used_today(self):
+        return sum(b.used_today for b in self.buckets.values())
+    
+    def remaining_today(self):
+        """全部Key当日剩余配额之和（任一可用Key不限配额时返回None）"""
+        total = 0
+        for b in self.buckets.values():
+            if b.exhausted():
+                continue
+            remaining = b.remaining_today()
+            if remaining is None:
+                return None
+            total += remaining
+        return total
+    
+    def key_stats(self):
+        """逐Key用量：脱敏Key、今日已用、剩余配额、是否停用、累计路由次数"""
+        with self._lock:
+            requests = dict(self.requests)
+        return [{'key': mask_key(k), 'used_today': b.used_today, 'quota_remaining': b.remaining_today(),
+                 'daily_quota': b.daily_quota, 'exhausted': b.exhausted(), 'requests': requests[k]}
+                for k, b in self.buckets.items()]
+
+class SingleFlight:
+    """同键并发请求合并：首个调用者发起请求，其余调用者等待并共享同一结果"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+    
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return future.result()
+
+# ---------- 高德地图API封装（真实数据源）----------
+AMAP_POOL_SIZE = int(os.environ.get("AMAP_POOL_SIZE", "16"))  # 每个Key的HTTP连接池上限
+AMAP_BATCH_MAX_OPS = 20       # 批量接口（POST /v3/batch）单次最多子请求数
+AMAP_GEOCODE_BATCH_MAX = 10   # 地理编码 batch=true 时单次最多地址数（地址以|分隔）
+DENSITY_CACHE_BYTES = int(os.environ.get("DENSITY_CACHE_BYTES", str(64 << 20)))  # 竞品密度栅格缓存总字节上限
+DENSITY_CACHE_TTL = AMapCache.DEFAULT_TTLS['place/text']  # 栅格有效期（秒），与POI文本搜索缓存一致
+DENSITY_BUILD_WORKERS = 2     # 后台构建栅格的线程数
+
+class AMapService:
+    """高德地图开放平台API封装（api_key 可为单个Key，或以逗号分隔/列表形式的多个Key组成配额池）"""
+    def __init__(self, api_key, cache=None, bypass_cache=False, pool_size=AMAP_POOL_SIZE,
+                 qps=AMAP_QPS, daily_quota=AMAP_DAILY_QUOTA, max_retries=AMAP_MAX_RETRIES, bucket_for=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.keys = parse_amap_keys(api_key)
+        self.key = ",".join(self.keys)
+        self.base_url = "https://restapi.amap.com/v3"
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.cache = cache
+        self.bypass_cache = bypass_cache  # 跳过缓存读取（仍写回最新结果）
+        self.limiter = AMapKeyPool(self.keys, qps=qps, daily_quota=daily_quota, bucket_for=bucket_for)
+        self.max_retries = max_retries
+        self._flights = SingleFlight()
+        self._densities = OrderedDict()  # (竞品, 城市) -> CompetitorDensity，随客户端跨会话共享，按LRU淘汰
+        self._density_lock = threading.Lock()
+        self._density_flights = SingleFlight()
+        self._density_builds = {}  # (竞品, 城市) -> 进行中的后台构建 Future
+        self._density_pool = ThreadPoolExecutor(max_workers=DENSITY_BUILD_WORKERS, thread_name_prefix="amap-density")
+        self._usage = {'requests': 0, 'in_flight': 0, 'peak_in_flight': 0, 'retries': 0, 'errors': 0,
+                       'batched': 0}  # batched: 经批量请求发出的子查询数
+        self._usage_lock = threading.Lock()
+    
+    def with_options(self, bypass_cache=False):
+        """返回共享连接池、缓存与统计的浅拷贝，用于按会话设置选项"""
+        clone = copy.copy(self)
+        clone.bypass_cache = bypass_cache
+        return clone
+    
+    def pool_stats(self):
+        """连接池使用统计：累计请求、并发峰值、已建立连接数、重试/失败/合并/批量次数与剩余配额"""
+        with self._usage_lock:
+            stats = dict(self._usage)
+        connections = 0
+        pools = self.session.get_adapter(self.base_url).poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is not None:
+                connections += pool.num_connections
+        stats['connections'] = connections
+        stats['pool_size'] = self.pool_size
+        stats['coalesced'] = self._flights.shared
+        stats['used_today'] = self.limiter.used_today
+        stats['quota_remaining'] = self.limiter.remaining_today()
+        stats['failovers'] = self.limiter.failovers
+        stats['keys'] = self.limiter.key_stats()
+        return stats
+    
+    def _count(self, field, delta=1):
+        with self._usage_lock:
+            self._usage[field] += delta
+            if field == 'in_flight':
+                self._usage['peak_in_flight'] = max(self._usage['peak_in_flight'], self._usage['in_flight'])
+    
+    def _get(self, endpoint, params, timeout=None):
+        """发起GET请求：优先读本地缓存，同参数的并发请求合并为一次网络调用；
+        timeout 为含重试在内的总耗时上限（秒），缺省只受重试次数限制"""
+        if self.cache is not None and not self.bypass_cache:
+            cached = self.cache.get(endpoint, params)
+            if cached is not None:
+                return cached
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        return self._flights.do(AMapCache.make_key(endpoint, params),
+                                lambda: self._fetch(endpoint, params, deadline=deadline))
+    
+    def _fetch(self, endpoint, params, cache_result=True, deadline=None):
+        """限流 + 抖动指数退避重试；仅缓存status=1的成功响应；到达deadline后不再重试"""
+        import requests
+        error = None
+        attempt = 0
+        while attempt <= self.max_retries:
+            delay = min(4.0, 0.25 * 2 ** attempt) * random.uniform(0.5, 1.0) if attempt else 0.0
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                self._count('errors')
+                raise AMapError(f"高德接口 {endpoint} 超出耗时上限（已重试{max(0, attempt - 1)}次）: {error}")
+            if attempt:
+                self._count('retries')
+                time.sleep(delay)
+            key = self.limiter.acquire()  # 全部Key耗尽时抛出AMapQuotaExceeded
+            self._count('requests')
+            self._count('in_flight')
+            request_timeout = 10 if deadline is None else max(0.1, min(10, deadline - time.monotonic()))
+            try:
+                resp = self.session.get(f"{self.base_url}/{endpoint}", params=dict(params, key=key),
+                                        timeout=request_timeout)
+                if resp.status_code >= 500:
+                    raise AMapError(f"HTTP {resp.status_code}")
+                data = resp.json()
+            except (requests.RequestException, ValueError, AMapError) as e:
+                error = e
+                attempt += 1
+                continue
+            finally:
+                self._count('in_flight', -1)
+            infocode = str(data.get("infocode", ""))
+            if infocode in AMAP_QUOTA_INFOCODES:
+                # 该Key配额耗尽：立即换Key重发，不计入重试次数
+                self.limiter.mark_exhausted(key)
+                self._count('errors')
+                error = AMapQuotaExceeded(f"高德返回配额超限: {data.get('info')}")
+                continue
+            if infocode in AMAP_RETRY_INFOCODES:
+                error = AMapError(f"{infocode} {data.get('info')}")
+                attempt += 1
+                continue
+            if cache_result and self.cache is not None and data.get("status") == "1":
+                self.cache.set(endpoint, params, data)
+            return data
+        self._count('errors')
+        raise AMapError(f"高德接口 {endpoint} 重试{self.max_retries}次后仍失败: {error}")
+    
+    def _get_many(self, queries):
+        """批量GET：先逐个读缓存，未命中的子请求去重后按 AMAP_BATCH_MAX_OPS 打包，经批量接口一次往返；
+        返回与输入对齐的响应列表（失败项为None），配额耗尽时抛出AMapQuotaExceeded"""
+        results = [None] * len(queries)
+        pending = {}  # 缓存键 -> [下标]
+        for i, (endpoint, params) in enumerate(queries):
+            if self.cache is not None and not self.bypass_cache:
+                cached = self.cache.get(endpoint, params)
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            pending.setdefault(AMapCache.make_key(endpoint, params), []).append(i)
+        keys = list(pending)
+        if len(keys) == 1:  # 只剩一个子请求时直接GET，省去批量封装
+            endpoint, params = queries[pending[keys[0]][0]]
+            try:
+                data = self._get(endpoint, params)
+            except AMapQuotaExceeded:
+                raise
+            except AMapError as e:
+                logger.warning("高德接口 %s 调用失败: %s", endpoint, e)
+                data = None
+            for i in pending[keys[0]]:
+                results[i] = data
+            return results
+        for start in range(0, len(keys), AMAP_BATCH_MAX_OPS):
+            chunk = keys[start:start + AMAP_BATCH_MAX_OPS]
+            responses = self._fetch_batch([queries[pending[k][0]] for k in chunk])
+            for k, data in zip(chunk, responses):
+                for i in pending[k]:
+                    results[i] = data
+        return results
+    
+    def _fetch_batch(self, queries):
+        """一次POST /v3/batch 发出多个子请求（整批计一次限流令牌）；
+        限流类错误的子请求在下一轮重试，其余失败项返回None"""
+        import requests
+        from urllib.parse import urlencode
+        results = [None] * len(queries)
+        todo = list(range(len(queries)))
+        error = None
+        attempt = 0
+        while todo and attempt <= self.max_retries:
+            if attempt:
+                self._count('retries')
+                time.sleep(min(4.0, 0.25 * 2 ** attempt) * random.uniform(0.5, 1.0))
+            key = self.limiter.acquire()  # 全部Key耗尽时抛出AMapQuotaExceeded
+            ops = [{"url": f"/v3/{queries[i][0]}?{urlencode(dict(queries[i][1], key=key))}"} for i in todo]
+            self._count('requests')
+            self._count('batched', len(ops))
+            self._count('in_flight')
+            try:
+                resp = self.session.post(f"{self.base_url}/batch", params={"key": key},
+                                         json={"ops": ops}, timeout=10)
+                if resp.status_code >= 500:
+                    raise AMapError(f"HTTP {resp.status_code}")
+                items = resp.json()
+            except (requests.RequestException, ValueError, AMapError) as e:
+                error = e
+                attempt += 1
+                continue
+            finally:
+                self._count('in_flight', -1)
+            if isinstance(items, dict):  # 整批被拒绝（Key无效、超限等）
+                infocode = str(items.get("infocode", ""))
+                if infocode in AMAP_QUOTA_INFOCODES:
+                    self.limiter.mark_exhausted(key)  # 换Key重发整批，不计入重试次数
+                    self._count('errors')
+                    continue
+                error = AMapError(f"{infocode} {items.get('info')}")
+                if infocode in AMAP_RETRY_INFOCODES:
+                    attempt += 1
+                    continue
+                break
+            retry, failover = [], False
+            for i, item in zip(todo, items):
+                data = item.get("body") if isinstance(item, dict) else None
+                if not isinstance(data, dict):
+                    error = AMapError(f"子请求返回异常: {item}")
+                    retry.append(i)
+                    continue
+                infocode = str(data.get("infocode", ""))
+                if infocode in AMAP_QUOTA_INFOCODES:
+                    failover = True
+                    retry.append(i)
+                    continue
+                if infocode in AMAP_RETRY_INFOCODES:
+                    error = AMapError(f"{infocode} {data.get('info')}")
+                    retry.append(i)
+                    continue
+                if self.cache is not None and data.get("status") == "1":
+                    self.cache.set(*queries[i], data)
+                results[i] = data
+            todo = retry + todo[len(items):]  # 返回条数不足时，缺失的子请求也重试
+            if failover:
+                self.limiter.mark_exhausted(key)  # 超限的子请求换Key重发，不计入重试次数
+                self._count('errors')
+            else:
+                attempt += 1
+        if todo:
+            self._count('errors')
+            logger.warning("高德批量接口 %d 个子请求重试%d次后仍失败: %s", len(todo), self.max_retries, error)
+        return results
+    
+    def search_poi(self, keyword, city, offset=20, page=1):
+        """POI关键词搜索（限定在city内）"""
+        params = {
+            "keywords": keyword,
+            "city": city,
+            "citylimit": "true",
+            "offset": offset,
+            "page": page,
+            "extensions": "all",
+            "output": "JSON"
+        }
+        try:
+            data = self._get("place/text", params)
+        except AMapQuotaExceeded:
+            raise
+        except AMapError as e:
+            logger.warning("高德POI搜索失败: %s", e)
+            return None
+        if data.get("status") == "1":
+            return data
+        return None
+    
+    def iter_poi(self, keyword, city, page_size=25, limit=None, max_pages=100, strict=False):
+        """逐页惰性遍历POI搜索结果：消费当前页时后台预取下一页，达到limit后提前停止
+        
+        strict=True 时某页请求失败或因 max_pages 未取完全部结果会抛出AMapError，而不是静默结束。
+        """
+        if limit is not None and limit <= 0:
+            return
+        prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="amap-page")
+        try:
+            page, yielded = 1, 0
+            pending = prefetcher.submit(self.search_poi, keyword, city, page_size, page)
+            while pending is not None:
+                data = pending.result()
+                if data is None and strict:
+                    raise AMapError(f"POI搜索 {keyword}@{city} 第{page}页拉取失败")
+                pois = data.get('pois', []) if data else []
+                total = int(data.get('count', 0)) if data else 0
+                if strict and page >= max_pages and page * page_size < total:
+                    raise AMapError(f"POI搜索 {keyword}@{city} 共{total}条，超出 {max_pages} 页上限")
+                has_more = (len(pois) == page_size and page * page_size < total and page < max_pages
+                            and (limit is None or yielded + len(pois) < limit))
+                pending = (prefetcher.submit(self.search_poi, keyword, city, page_size, page + 1)
+                           if has_more else None)
+                page += 1
+                for poi in pois:
+                    yield poi
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+        finally:
+            prefetcher.shutdown(wait=False, cancel_futures=True)
+    
+    def competitor_density(self, keyword, city):
+        """拉取城市内全部竞品门店并构建密度栅格；同城同竞品只构建一次，过期后重建
+        
+        任一页拉取失败时抛出AMapError（不缓存残缺栅格，由调用方回退默认值）。
+        """
+        key = (keyword, city)
+        density = self._cached_density(key)
+        if density is not None:
+            return density
+        
+        def build():
+            lng, lat = [], []
+            for poi in self.iter_poi(keyword, city, strict=True):
+                if isinstance(poi.get('location'), str):
+                    x, y = parse_location(poi['location'])
+                    lng.append(x)
+                    lat.append(y)
+            info = self.district(city)
+            center = parse_location(info['center']) if info and isinstance(info.get('center'), str) else None
+            built = CompetitorDensity(lng, lat, center=center)
+            self._store_density(key, built)
+            return built
+        return self._density_flights.do(key, build)
+    
+    def warm_competitor_density(self, keyword, city):
+        """在后台线程构建竞品密度栅格（不占用单次商圈分析的耗时预算），返回 Future；已缓存时立即完成"""
+        key = (keyword, city)
+        density = self._cached_density(key)
+        if density is not None:
+            future = Future()
+            future.set_result(density)
+            return future
+        with self._density_lock:
+            future = self._density_builds.get(key)
+            if future is not None:
+                return future
+            future = self._density_pool.submit(self.competitor_density, keyword, city)
+            self._density_builds[key] = future
+        
+        def done(f):
+            with self._density_lock:
+                self._density_builds.pop(key, None)
+            if not f.cancelled() and f.exception() is not None:
+                logger.warning("竞品密度栅格构建失败 %s@%s: %s", keyword, city, f.exception())
+        future.add_done_callback(done)
+        return future
+    
+    def _cached_density(self, key):
+        with self._density_lock:
+            density = self._densities.get(key)
+            if density is None or time.time() - density.built_at >= DENSITY_CACHE_TTL:
+                return None
+            self._densities.move_to_end(key)
+            return density
+    
+    def _store_density(self, key, density):
+        """写入栅格缓存：先剔除过期栅格，再按最久未使用淘汰至总字节数不超过 DENSITY_CACHE_BYTES"""
+        with self._density_lock:
+            self._densities[key] = density
+            self._densities.move_to_end(key)
+            now = time.time()
+            for k in [k for k, d in self._densities.items() if now - d.built_at >= DENSITY_CACHE_TTL]:
+                del self._densities[k]
+            total = sum(d.nbytes for d in self._densities.values())
+            while total > DENSITY_CACHE_BYTES and len(self._densities) > 1:
+                _, evicted = self._densities.popitem(last=False)
+                total -= evicted.nbytes
+    
+    def _around_params(self, location, keywords, radius):
+        return {
+            "location": location,
+            "keywords": keywords,
+            "radius": radius,
+            "output": "JSON"
+        }
+    
+    def search_around(self, location, keywords, radius=1000):
+        """周边搜索"""
+        params = self._around_params(location, keywords, radius)
+        try:
+            return self._get("place/around", params)
+        except AMapQuotaExceeded:
+            raise
+        except AMapError as e:
+            logger.warning("高德周边搜索失败: %s", e)
+            return None
+    
+    def search_around_many(self, queries):
+        """批量周边搜索：queries 为 (location, keywords, radius) 列表，未缓存的查询合并为一次批量请求；
+        返回与输入对齐的响应列表（失败项为None）"""
+        return self._get_many([("place/around", self._around_params(*q)) for q in queries])
+    
+    def _geocode_params(self, address, city):
+        return {
+            "address": address,
+            "city": city,
+            "output": "JSON"
+        }
+    
+    def geocode(self, address, city, timeout=None):
+        """地理编码：地址转经纬度（timeout 为含重试的总耗时上限，超出时返回None）"""
+        params = self._geocode_params(address, city)
+        try:
+            data = self._get("geocode/geo", params, timeout=timeout)
+        except AMapQuotaExceeded:
+            raise
+        except AMapError as e:
+            logger.warning("高德地理编码失败: %s", e)
+            return None
+        if data.get("status") == "1" and data.get("geocodes"):
+            return data["geocodes"][0]["location"]
+        return None
+    
+    def geocode_many(self, addresses, city):
+        """批量地理编码：未缓存的地址每 AMAP_GEOCODE_BATCH_MAX 个以|拼接为一次请求（batch=true），
+        结果按单个地址写入缓存（之后的 geocode 调用直接命中）；返回与输入对齐的坐标列表（失败为None）"""
+        addresses = [a.replace('|', ' ') for a in addresses]
+        results = [None] * len(addresses)
+        pending = {}  # 地址 -> [下标]
+        for i, address in enumerate(addresses):
+            if self.cache is not None and not self.bypass_cache:
+                cached = self.cache.get("geocode/geo", self._geocode_params(address, city))
+                if cached is not None:
+                    geocodes = cached.get("geocodes") or [{}]
+                    results[i] = geocodes[0].get("location") or None
+                    continue
+            pending.setdefault(address, []).append(i)
+        names = list(pending)
+        for start in range(0, len(names), AMAP_GEOCODE_BATCH_MAX):
+            chunk = names[start:start + AMAP_GEOCODE_BATCH_MAX]
+            if len(chunk) == 1:
+                locations = [self.geocode(chunk[0], city)]
+            else:
+                params = dict(self._geocode_params("|".join(chunk), city), batch="true")
+                try:
+                    data = self._flights.do(AMapCache.make_key("geocode/geo", params),
+                                            lambda: self._fetch("geocode/geo", params, cache_result=False))
+                except AMapQuotaExceeded:
+                    raise
+                except AMapError as e:
+                    logger.warning("高德批量地理编码失败: %s", e)
+                    data = {}
+                geocodes = (data.get("geocodes") or []) if data.get("status") == "1" else []
+                self._count('batched', len(chunk))
+                locations = []
+                for j, address in enumerate(chunk):
+                    geo = geocodes[j] if j < len(geocodes) and isinstance(geocodes[j], dict) else {}
+                    location = geo.get("location") if isinstance(geo.get("location"), str) else None
+                    locations.append(location or None)
+                    if location and self.cache is not None:
+                        self.cache.set("geocode/geo", self._geocode_params(address, city),
+                                       {"status": "1", "info": "OK", "infocode": "10000",
+                                        "count": "1", "geocodes": [geo]})
+            for address, location in zip(chunk, locations):
+                for i in pending[address]:
+                    results[i] = location
+        return results
+    
+    def district(self, keywords):
+        """行政区划查询"""
+        params = {
+            "keywords": keywords,
+            "subdistrict": 0,
+            "output": "JSON"
+        }
+        try:
+            data = self._get("config/district", params)
+        except AMapQuotaExceeded:
+            raise
+        except AMapError as e:
+            logger.warning("高德行政区划查询失败: %s", e)
+            return None
+        if data.get("status") == "1" and data.get("districts"):
+            return data["districts"][0]
+        return None
+
+class AMapClientRegistry:
+    """进程级客户端注册表：同一API Key在所有会话间共享一个连接池化的AMapService；
+    令牌桶按单个Key登记，Key组合有重叠的客户端共用同一Key的限流与日配额"""
+    def __init__(self, cache=None, pool_size=AMAP_POOL_SIZE, qps=AMAP_QPS, daily_quota=AMAP_DAILY_QUOTA):
+        self.cache = cache
+        self.pool_size = pool_size
+        self.qps = qps
+        self.daily_quota = daily_quota
+        self._clients = {}
+        self._buckets = {}  # Key -> TokenBucket
+        self._lock = threading.Lock()
+        self._bucket_lock = threading.Lock()
+    
+    def bucket(self, key):
+        """该Key在进程内唯一的令牌桶"""
+        with self._bucket_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.qps, daily_quota=self.daily_quota)
+            return bucket
+    
+    def get(self, api_key):
+        """获取（必要时创建）该Key对应的共享客户端（多Key按排序后的组合共享，与输入顺序无关）"""
+        api_key = ",".join(sorted(parse_amap_keys(api_key)))
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = AMapService(api_key, cache=self.cache, pool_size=self.pool_size,
+                                     qps=self.qps, daily_quota=self.daily_quota, bucket_for=self.bucket)
+                self._clients[api_key] = client
+            return client
+    
+    def stats(self):
+        """汇总所有客户端的连接池使用情况"""
+        with self._lock:
+            clients = list(self._clients.values())
+        totals = {'clients': len(clients), 'requests': 0, 'in_flight': 0, 'peak_in_flight': 0,
+                  'connections': 0, 'pool_size': self.pool_size, 'retries': 0, 'errors': 0,
+                  'coalesced': 0, 'batched': 0, 'failovers': 0}
+        for client in clients:
+            s = client.pool_stats()
+            for field in ('requests', 'in_flight', 'connections', 'retries', 'errors', 'coalesced', 'batched', 'failovers'):
+                totals[field] += s[field]
+            totals['peak_in_flight'] = max(totals['peak_in_flight'], s['peak_in_flight'])
+        return totals
+
+# ---------- 模拟数据生成器（无API Key时使用）----------
+def generate_mock_city_data(city_name):
+    """模拟城市宏观数据"""
+    mock_db = {
+        '苏州': {
+            'population': 1280, 'gdp_growth': 6.8, 'disposable_income': 75000,
+            'rental_index': 85, 'spicy_acceptance': 65, 'dining_frequency': 8.5,
+            'competition_index': 62, 'logistics_score': 88, 'policy_score': 85,
+            'growth_potential': 92
+        },
+        '郑州': {
+            'population': 1260, 'gdp_growth': 7.2, 'disposable_income': 42000,
+            'rental_index': 72, 'spicy_acceptance': 85, 'dining_frequency': 7.8,
+            'competition_index': 68, 'logistics_score': 92, 'policy_score': 78,
+            'growth_potential': 88
+        },
+        '杭州': {
+            'population': 1220, 'gdp_growth': 7.0, 'disposable_income': 70000,
+            'rental_index': 88, 'spicy_acceptance': 60, 'dining_frequency': 8.2,
+            'competition_index': 70, 'logistics_score': 90, 'policy_score': 86,
+            'growth_potential': 90
+        },
+        '南京': {
+            'population': 930, 'gdp_growth': 6.5, 'disposable_income': 68000,
+            'rental_index': 80, 'spicy_acceptance': 55, 'dining_frequency': 7.5,
+            'competition_index': 65, 'logistics_score': 85, 'policy_score': 82,
+            'growth_potential': 84
+        }
+    }
+    return mock_db.get(city_name, mock_db['苏州'])
+
+# 模拟商圈样本库（预取器也以此作为各城市的热门商圈）
+MOCK_DISTRICT_DB = {
+    ('苏州', '工业园区湖东'): {
+        'daily_flow': 85000, 'weekend_multiplier': 1.8, 'office_ratio': 0.45,
+        'family_ratio': 0.35, 'youth_ratio': 0.55, 'avg_rent': 220,
+        'competitor_count': 3, 'visibility_score': 88, 'accessibility_score': 92,
+        'neighbor_quality': 85, 'parking_score': 78
+    },
+    ('苏州', '姑苏区观前街'): {
+        'daily_flow': 150000, 'weekend_multiplier': 2.2, 'office_ratio': 0.15,
+        'family_ratio': 0.25, 'youth_ratio': 0.40, 'avg_rent': 320,
+        'competitor_count': 7, 'visibility_score': 95, 'accessibility_score': 88,
+        'neighbor_quality': 82, 'parking_score': 65
+    },
+    ('郑州', '金水区花园路'): {
+        'daily_flow': 95000, 'weekend_multiplier': 1.6, 'office_ratio': 0.35,
+        'family_ratio': 0.45, 'youth_ratio': 0.50, 'avg_rent': 180,
+        'competitor_count': 5, 'visibility_score': 85, 'accessibility_score': 90,
+        'neighbor_quality': 80, 'parking_score': 82
+    }
+}
+
+def generate_mock_district_data(city, district_name):
+    """模拟商圈微观数据"""
+    key = (city, district_name)
+    if key in MOCK_DISTRICT_DB:
+        return dict(MOCK_DISTRICT_DB[key])
+    else:
+        # 返回一个默认值
+        return {
+            'daily_flow': 70000, 'weekend_multiplier': 1.7, 'office_ratio': 0.3,
+            'family_ratio': 0.3, 'youth_ratio': 0.4, 'avg_rent': 200,
+            'competitor_count': 4, 'visibility_score': 75, 'accessibility_score': 75,
+            'neighbor_quality': 70, 'parking_score': 70
+        }
+
+# ---------- 本地POI空间索引（离线周边查询）----------
+POI_INDEX_DIR = "poi_index"  # 按城市存放批量POI导出：<城市>.jsonl 或 <城市>.csv
+EARTH_RADIUS = 6371008.8
+
+def parse_location(location):
+    """高德 "lng,lat" 字符串转浮点坐标"""
+    lng, lat = location.split(",")
+    return float(lng), float(lat)
+
+class POISpatialIndex:
+    """网格哈希空间索引：点按网格排序成连续区段，半径计数/最近K查询只访问附近网格"""
+    def __init__(self, lng, lat, names=None, cell_size=500.0):
+        lng = np.asarray(lng, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        self.cell_size = cell_size
+        # 城市尺度下用等距圆柱投影换算为米，误差可忽略
+        self.lat0 = float(lat.mean()) if lat.size else 0.0
+        self._kx = np.radians(1.0) * EARTH_RADIUS * np.cos(np.radians(self.lat0))
+        self._ky = np.radians(1.0) * EARTH_RADIUS
+        x, y = lng * self._kx, lat * self._ky
+        cx = np.floor(x / cell_size).astype(np.int64)
+        cy = np.floor(y / cell_size).astype(np.int64)
+        order = np.lexsort((cy, cx))
+        self.lng, self.lat = lng[order], lat[order]
+        self.x, self.y = x[order], y[order]
+        self.names = np.asarray(names if names is not None else [''] * lng.size, dtype=object)[order]
+        cells = np.stack([cx[order], cy[order]], axis=1)
+        if cells.size:
+            change = np.flatnonzero(np.any(cells[1:] != cells[:-1], axis=1)) + 1
+            starts = np.concatenate([[0], change])
+            ends = np.concatenate([change, [len(cells)]])
+            self._cells = {(int(cells[a, 0]), int(cells[a, 1])): (int(a), int(b))
+                           for a, b in zip(starts, ends)}
+        else:
+            self._cells = {}
+    
+    def __len__(self):
+        return self.lng.size
+    
+    def _project(self, location):
+        lng, lat = parse_location(location) if isinstance(location, str) else location
+        return lng * self._kx, lat * self._ky
+    
+    def _candidates(self, qx, qy, radius):
+        """收集半径内网格：完全落入圆内的网格直接计数，边界网格返回待精算的区段"""
+        cs = self.cell_size
+        cells = self._cells
+        cx0, cx1 = math.floor((qx - radius) / cs), math.floor((qx + radius) / cs)
+        cy0, cy1 = math.floor((qy - radius) / cs), math.floor((qy + radius) / cs)
+        r2 = radius * radius
+        # 各行/列到查询点的最近、最远距离平方，预先算好避免内层重复计算
+        dy_near, dy_far = [], []
+        for cy in range(cy0, cy1 + 1):
+            lo, hi = cy * cs - qy, (cy + 1) * cs - qy
+            dy_near.append(max(lo, 0.0, -hi) ** 2)
+            dy_far.append(max(lo * lo, hi * hi))
+        inside, partial = [], []
+        for cx in range(cx0, cx1 + 1):
+            lo, hi = cx * cs - qx, (cx + 1) * cs - qx
+            dx_near, dx_far = max(lo, 0.0, -hi) ** 2, max(lo * lo, hi * hi)
+            for j, cy in enumerate(range(cy0, cy1 + 1)):
+                if dx_near + dy_near[j] > r2:
+                    continue
+                span = cells.get((cx, cy))
+                if span is not None:
+                    (inside if dx_far + dy_far[j] <= r2 else partial).append(span)
+        return inside, partial
+    
+    def radius_count(self, location, radius):
+        """半径内POI数量"""
+        qx, qy = self._project(location)
+        inside, partial = self._candidates(qx, qy, radius)
+        count = sum(b - a for a, b in inside)
+        if partial:
+            dx = np.concatenate([self.x[a:b] for a, b in partial]) - qx
+            dy = np.concatenate([self.y[a:b] for a, b in partial]) - qy
+            count += int(np.count_nonzero(dx * dx + dy * dy <= radius * radius))
+        return count
+    
+    def within(self, location, radius):
+        """半径内POI的(下标数组, 距离数组)，按距离升序"""
+        qx, qy = self._project(location)
+        inside, partial = self._candidates(qx, qy, radius)
+        spans = inside + partial
+        if not spans:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        idx = np.concatenate([np.arange(a, b) for a, b in spans])
+        dist = np.hypot(self.x[idx] - qx, self.y[idx] - qy)
+        keep = dist <= radius
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind='stable')
+        return idx[order], dist[order]
+    
+    def nearest(self, location, k=5):
+        """最近K个POI的(下标数组, 距离数组)：按网格环逐圈扩展，直到第K近距离不超过已搜索范围"""
+        if not len(self):
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        qx, qy = self._project(location)
+        cs = self.cell_size
+        cx, cy = math.floor(qx / cs), math.floor(qy / cs)
+        spans, seen, ring = [], 0, 0
+        while True:
+            for i in range(cx - ring, cx + ring + 1):
+                for j in range(cy - ring, cy + ring + 1):
+                    if max(abs(i - cx), abs(j - cy)) == ring and (i, j) in self._cells:
+                        a, b = self._cells[(i, j)]
+                        spans.append((a, b))
+                        seen += b - a
+            if seen >= min(k, len(self)):
+                idx = np.concatenate([np.arange(a, b) for a, b in spans])
+                dist = np.hypot(self.x[idx] - qx, self.y[idx] - qy)
+                order = np.argsort(dist, kind='stable')[:k]
+                if seen == len(self) or dist[order[-1]] <= ring * cs:
+                    return idx[order], dist[order]
+            ring += 1
+
+class LocalPOIBackend:
+    """本地POI索引后端：按关键词分类建索引，search_around 与 AMapService 同签名、同返回结构"""
+    PAGE_SIZE = 20  # 与高德周边搜索默认单页条数一致，保证 len(pois) 口径相同
+    
+    def __init__(self, points_by_keyword, cell_size=500.0):
+        self.indexes = {kw: POISpatialIndex(p['lng'], p['lat'], p.get('names'), cell_size)
+                        for kw, p in points_by_keyword.items()}
+    
+    def __contains__(self, keyword):
+        return keyword in self.indexes
+    
+    @classmethod
+    def from_dump(cls, path, cell_size=500.0):
+        """读取批量POI导出（JSONL或CSV，字段：keyword, name, location 或 lng/lat）"""
+        if path.endswith(".csv"):
+            import pandas as pd
+            rows = pd.read_csv(path).to_dict('records')
+        else:
+            with open(path, encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        points = {}
+        for row in rows:
+            if 'location' in row and isinstance(row['location'], str):
+                lng, lat = parse_location(row['location'])
+            else:
+                lng, lat = float(row['lng']), float(row['lat'])
+            bucket = points.setdefault(row['keyword'], {'lng': [], 'lat': [], 'names': []})
+            bucket['lng'].append(lng)
+            bucket['lat'].append(lat)
+            bucket['names'].append(row.get('name', ''))
+        return cls(points, cell_size)
+    
+    def radius_count(self, location, keywords, radius=1000):
+        index = self.indexes.get(keywords)
+        return index.radius_count(location, radius) if index is not None else 0
+    
+    def search_around(self, location, keywords, radius=1000):
+        """离线周边搜索，返回结构同高德 place/around（count为总数，pois为首页）"""
+        index = self.indexes.get(keywords)
+        if index is None:
+            return None
+        idx, dist = index.within(location, radius)
+        pois = [{'name': index.names[i], 'location': f"{index.lng[i]:.6f},{index.lat[i]:.6f}",
+                 'distance': str(int(round(d)))}
+                for i, d in zip(idx[:self.PAGE_SIZE], dist[:self.PAGE_SIZE])]
+        return {'status': '1', 'count': str(len(idx)), 'pois': pois}
+
+def build_poi_dump(amap, city, keywords, path, limit_per_keyword=None):
+    """用分页迭代器把城市内各类POI流式写入JSONL导出文件，返回各关键词条数"""
+    counts = {}
+    with open(path, 'w', encoding='utf-8') as f:
+        for kw in keywords:
+            counts[kw] = 0
+            for poi in amap.iter_poi(kw, city, limit=limit_per_keyword):
+                if not isinstance(poi.get('location'), str):
+                    continue
+                f.write(json.dumps({'keyword': kw, 'name': poi.get('name', ''),
+                                    'location': poi['location']}, ensure_ascii=False) + "\n")
+                counts[kw] += 1
+    return counts
+
+# ---------- 竞品密度栅格（半径1km竞品数）----------
+COMPETITOR_RADIUS = 1000.0   # 竞品统计半径（米），与侧边栏“可接受竞品数(半径1km)”口径一致
+DENSITY_CELL_SIZE = 50.0     # 栅格边长（米），点位误差不超过一个栅格
+DENSITY_MAX_CELLS = 2000     # 单边栅格数上限，范围过大时自动放大栅格
+DENSITY_CITY_RADIUS = 48000.0  # 距城市中心超过该距离（米）的门店不计入，避免个别远点放大栅格
+
+class CompetitorDensity:
+    """竞品密度栅格：建表时用FFT圆盘卷积算出每个栅格半径R内的竞品数，任意点查表O(1)
+    
+    center 为城市中心 (lng, lat)，缺省时取门店坐标中位数；距中心超过 clip_radius 的点先剔除。
+    """
+    def __init__(self, lng, lat, radius=COMPETITOR_RADIUS, cell_size=DENSITY_CELL_SIZE, center=None,
+                 clip_radius=DENSITY_CITY_RADIUS):
+        lng = np.asarray(lng, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        if lng.size and clip_radius:
+            c_lng, c_lat = center if center is not None else (float(np.median(lng)), float(np.median(lat)))
+            k = np.radians(1.0) * EARTH_RADIUS
+            dx = (lng - c_lng) * k * np.cos(np.radians(c_lat))
+            dy = (lat - c_lat) * k
+            inside = dx ** 2 + dy ** 2 <= clip_radius ** 2
+            lng, lat = lng[inside], lat[inside]
+        self.radius = radius
+        self.total = int(lng.size)
+        self.built_at = time.time()
+        if not lng.size:
+            self.grid = np.zeros((0, 0), dtype=np.int32)
+            self.cell_size, self.x0, self.y0, self._kx, self._ky = cell_size, 0.0, 0.0, 1.0, 1.0
+            return
+        lat0 = float(lat.mean())
+        self._kx = np.radians(1.0) * EARTH_RADIUS * np.cos(np.radians(lat0))
+        self._ky = np.radians(1.0) * EARTH_RADIUS
+        x, y = lng * self._kx, lat * self._ky
+        extent = max(x.max() - x.min(), y.max() - y.min()) + 2 * radius
+        self.cell_size = cs = max(cell_size, extent / DENSITY_MAX_CELLS)
+        pad = radius + cs
+        self.x0, self.y0 = x.min() - pad, y.min() - pad
+        nx = int((x.max() + pad - self.x0) // cs) + 1
+        ny = int((y.max() + pad - self.y0) // cs) + 1
+        counts = np.zeros((nx, ny))
+        np.add.at(counts, (((x - self.x0) // cs).astype(int), ((y - self.y0) // cs).astype(int)), 1)
+        
+        # 圆盘核：栅格中心距离不超过半径的偏移
+        r = int(radius // cs) + 1
+        offsets = np.arange(-r, r + 1) * cs
+        kernel = (offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius ** 2).astype(float)
+        shape = (nx + 2 * r, ny + 2 * r)
+        conv = np.fft.irfft2(np.fft.rfft2(counts, shape) * np.fft.rfft2(kernel, shape), shape)
+        self.grid = np.rint(conv[r:r + nx, r:r + ny]).astype(np.int32)
+    
+    @property
+    def nbytes(self):
+        return int(self.grid.nbytes)
+    
+    def count(self, location):
+        """任意点半径R内的竞品数（查表）"""
+        lng, lat = parse_location(location) if isinstance(location, str) else location
+        i = int((lng * self._kx - self.x0) // self.cell_size)
+        j = int((lat * self._ky - self.y0) // self.cell_size)
+        if 0 <= i < self.grid.shape[0] and 0 <= j < self.grid.shape[1]:
+            return int(self.grid[i, j])
+        return 0
+
+# ---------- 真实数据获取函数（使用高德API）----------
+def get_city_data_real(amap, city_name, city_stats):
+    """从高德+统计局数据库获取真实城市数据"""
+    # 1. 获取行政区信息（人口、面积）
+    district_info = amap.district(city_name)
+    population = 0
+    if district_info:
+        try:
+            population = int(district_info.get('population', '0'))
+        except:
+            population = 0
+    
+    # 2. 从统计年鉴读取（按城市最新年份索引定位）
+    city_row = (city_stats.get(city_name) if city_stats is not None else None) or {}
+    disposable_income = city_row.get('disposable_income', 60000)
+    gdp_growth = city_row.get('gdp_growth', 6.5)
+    if population <= 0:
+        # 高德行政区划接口通常不返回人口，取年鉴常住人口（万人）
+        population = int(city_row.get('population') or 0)
+    
+    # 3. 湘菜接受度（可根据口味大数据，这里用经验值）
+    spicy_dict = {'郑州': 85, '苏州': 65, '杭州': 60, '南京': 55, '武汉': 88, '长沙': 95}
+    spicy_acceptance = spicy_dict.get(city_name, 70)
+    
+    # 4. 返回标准格式
+    data = {
+        'population': population if population > 0 else 1000,  # 两个来源都没有时给个默认值
+        'gdp_growth': gdp_growth,
+        'disposable_income': disposable_income,
+        'rental_index': 80,  # 需其他数据源
+        'spicy_acceptance': spicy_acceptance,
+        'dining_frequency': 8.0,
+        'competition_index': 65,
+        'logistics_score': 80,
+        'policy_score': 80,
+        'growth_potential': 85
+    }
+    if population <= 0:
+        data['fallback_fields'] = ['population']
+    return data
+
+DISTRICT_QUERY_BUDGET = 8.0  # 单次商圈分析的总耗时预算（秒）
+
+def get_district_data_real(amap, city, district_name, budget=DISTRICT_QUERY_BUDGET, poi_backend=None,
+                           competitor='大米先生'):
+    """从高德API获取真实商圈数据（地理编码后的查询并发执行，失败或超时的字段回退默认值）
+    
+    budget 覆盖地理编码与后续全部查询；poi_backend 为本地POI索引时，其已收录类别的周边搜索
+    在本地完成，不再请求高德。
+    """
+    started = time.monotonic()
+    # 1. 地理编码得到中心点（重试退避也计入预算）
+    location = amap.geocode(f"{district_name},{city}", city, timeout=budget)
+    if not location:
+        fallback = dict(generate_mock_district_data(city, district_name))
+        fallback['fallback_fields'] = list(fallback)
+        return fallback
+    
+    # 2. 竞品密度（半径1km）与周边设施查询并发执行；
+    #    本地索引未收录的周边搜索合并为一次批量请求，一个往返取回全部结果
+    around_queries = {
+        'bus': ("公交车站", 500),
+        'subway': ("地铁站", 800),
+        'office': ("写字楼", 1000),
+        'residence': ("住宅小区", 1000),
+    }
+    local = [n for n, (kw, _) in around_queries.items() if poi_backend is not None and kw in poi_backend]
+    remote = [n for n in around_queries if n not in local]
+    
+    queries = {}
+    for name in local:
+        queries[name] = (poi_backend.search_around, (location, *around_queries[name]))
+    if remote:
+        queries['remote'] = (amap.search_around_many, ([(location, *around_queries[n]) for n in remote],))
+    executor = ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="amap")
+    futures = {name: executor.submit(fn, *args) for name, (fn, args) in queries.items()}
+    # 密度栅格在客户端的后台线程构建：超出预算时本次回退，构建继续完成并缓存供后续分析使用
+    futures['competitor'] = amap.warm_competitor_density(competitor, city)
+    remaining = max(0.0, budget - (time.monotonic() - started))
+    done, _ = wait(futures.values(), timeout=remaining)
+    executor.shutdown(wait=False, cancel_futures=True)  # 超时的请求不再等待
+    
+    outputs = {}
+    for name, future in futures.items():
+        if future in done and isinstance(future.exception(), AMapQuotaExceeded):
+            raise future.exception()
+        outputs[name] = future.result() if future in done and future.exception() is None else None
+    batch = outputs.pop('remote', None) or [None] * len(remote)
+    results = dict(outputs, **dict(zip(remote, batch)))
+    failed = {name for name, value in results.items() if value is None}
+    
+    density = results['competitor']
+    competitor_count = density.count(location) if density is not None else 0
+    
+    bus, subway, office = results['bus'], results['subway'], results['office']
+    bus_cnt = len(bus.get('pois', [])) if bus else 0
+    subway_cnt = len(subway.get('pois', [])) if subway else 0
+    office_cnt = len(office.get('pois', [])) if office else 0
+    
+    # 3. 估算人流（简易模型）
+    daily_flow = 30000 + office_cnt * 500 + subway_cnt * 2000
+    
+    data = {
+        'daily_flow': daily_flow,
+        'weekend_multiplier': 1.8,
+        'office_ratio': min(0.6, office_cnt / 100) if office_cnt else 0.3,
+        'family_ratio': 0.3,
+        'youth_ratio': 0.4,
+        'avg_rent': 200,  # 需租金API
+        'competitor_count': competitor_count,
+        'visibility_score': 75,
+        'accessibility_score': 85 if (bus_cnt+subway_cnt) > 10 else 70,
+        'neighbor_quality': 70,
+        'parking_score': 70
+    }
+    
+    # 4. 失败或超出预算的子查询：相关字段逐项回退为默认值
+    field_sources = {
+        'competitor_count': {'competitor'},
+        'daily_flow': {'office', 'subway'},
+        'office_ratio': {'office'},
+        'accessibility_score': {'bus', 'subway'},
+    }
+    fallback_fields = [f for f, deps in field_sources.items() if deps & failed]
+    if fallback_fields:
+        fallback = generate_mock_district_data(city, district_name)
+        for f in fallback_fields:
+            data[f] = fallback[f]
+        data['fallback_fields'] = fallback_fields
+    return data
+
+# ---------- 默认品牌参数 ----------
+DEFAULT_BRAND_CONFIG = {
+    'brand_name': '湘味小炒',
+    'store_count': 120,
+    'avg_price': 49,
+    'seat_count': 120,
+    'target_groups': ['年轻白领', '家庭聚餐', '朋友聚会'],
+    'main_competitor': '大米先生',
+    'budget_min': 150,
+    'budget_max': 200,
+    'roi_target': 18,
+    'expansion_strategy': '谨慎测试(先开1-2家)'
+}
+
+# ---------- 静态宏观经济数据库（模拟统计年鉴）----------
+CITY_STATS = {
+    'city': ['苏州', '郑州', '杭州', '南京', '武汉', '长沙', '成都', '西安'],
+    'disposable_income': [75000, 42000, 70000, 68000, 55000, 60000, 50000, 45000],
+    'gdp_growth': [6.8, 7.2, 7.0, 6.5, 7.5, 7.8, 7.3, 6.9],
+    'population': [1280, 1260, 1220, 930, 1120, 1000, 1650, 1200],
+    'retail_total': [9500, 5200, 7800, 7200, 6800, 5500, 8200, 5900]  # 亿
+}
+
+# ---------- 统计年鉴数据仓（列式文件内存映射）----------
+CITY_STATS_DIR = os.environ.get("CITY_STATS_DIR", "city_stats")  # 年鉴文件：*.arrow / *.feather / *.parquet
+CITY_STATS_SUFFIXES = ('.arrow', '.feather', '.parquet')
+CITY_STATS_CHECK_INTERVAL = 5.0  # 检查年鉴文件变化的最小间隔（秒）
+
+def _table_columns(table):
+    return list(table) if isinstance(table, dict) else table.column_names
+
+def _table_values(table, name):
+    return list(table[name]) if isinstance(table, dict) else table.column(name).to_pylist()
+
+def _table_cell(table, name, row):
+    if isinstance(table, dict):
+        return table[name][row]
+    return table.column(name)[row].as_py()
+
+def _stats_year(value):
+    """年份统一为 int（缺失、空值、NaN 或无法解析时为None），避免混合类型年份无法比较"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        year = float(str(value).strip())
+    except ValueError:
+        return None
+    return int(year) if math.isfinite(year) and year == int(year) else None
+
+class CityStatsStore:
+    """城市统计年鉴数据仓（每个文件需含 city 列，可选 year 列，其余列为指标）
+    
+    Arrow IPC/Feather 文件按内存映射零拷贝打开，多个工作进程共享同一份页缓存；Parquet 首次加载时
+    转存为同目录下的隐藏 Arrow 文件（.<文件名>.arrow）后再映射。只把 city/year 两列读入内存，
+    建 (城市, 年份) 哈希索引，指标按行惰性读取。目录中文件增删改后自动热加载；
+    未安装pyarrow或目录下没有年鉴文件时使用内置 CITY_STATS。
+    """
+    def __init__(self, root=CITY_STATS_DIR, check_interval=CITY_STATS_CHECK_INTERVAL):
+        self.root = root
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._files = None
+        self._state = None
+        self.reload(force=True)
+    
+    def __reduce__(self):
+        # 传给子进程时只传目录，由子进程自行映射，不复制数据
+        return (CityStatsStore, (self.root, self.check_interval))
+    
+    def _scan(self):
+        """年鉴文件清单：(路径, 修改时间, 大小)；未安装pyarrow时视为空"""
+        try:
+            names = sorted(os.listdir(self.root))
+            import pyarrow  # noqa: F401
+        except (OSError, ImportError):
+            return []
+        files = []
+        for name in names:
+            if name.startswith('.') or not name.endswith(CITY_STATS_SUFFIXES):
+                continue
+            path = os.path.join(self.root, name)
+            st = os.stat(path)
+            files.append((path, st.st_mtime_ns, st.st_size))
+        return files
+    
+    @staticmethod
+    def _arrow_copy(path):
+        """Parquet 转存为未压缩的 Arrow IPC 文件（已是最新时直接复用），返回可映射的路径；目录只读时返回None"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        target = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.arrow")
+        try:
+            if os.path.exists(target) and os.stat(target).st_mtime_ns >= os.stat(path).st_mtime_ns:
+                return target
+            table = pq.read_table(path)
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, target)
+            return target
+        except OSError as e:
+            logger.warning("年鉴文件 %s 无法转存为Arrow，改为直接读取: %s", path, e)
+            return None
+    
+    def _open(self, path):
+        import pyarrow as pa
+        if path.endswith('.parquet'):
+            mapped = self._arrow_copy(path)
+            if mapped is None:
+                import pyarrow.parquet as pq
+                return pq.read_table(path, memory_map=True)
+            path = mapped
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    
+    def _build(self, files):
+        """打开全部文件并建立索引；同一 (城市, 年份) 出现在多个文件时以文件名靠后者为准"""
+        tables = [self._open(path) for path, _, _ in files] if files else [CITY_STATS]
+        index, latest, columns = {}, {}, []
+        for t, table in enumerate(tables):
+            names = _table_columns(table)
+            if 'city' not in names:
+                logger.warning("年鉴文件 %s 缺少 city 列，已跳过", files[t][0])
+                continue
+            cities = _table_values(table, 'city')
+            years = _table_values(table, 'year') if 'year' in names else [None] * len(cities)
+            for row, (city, year) in enumerate(zip(cities, years)):
+                city, year = str(city).strip(), _stats_year(year)
+                index[(city, year)] = (t, row)
+                if city not in latest or (year is not None and (latest[city] is None or year > latest[city])):
+                    latest[city] = year
+            columns += [n for n in names if n not in ('city', 'year') and n not in columns]
+        version = hashlib.sha1(repr(files).encode('utf-8')).hexdigest()[:12] if files else 'builtin'
+        return {'tables': tables, 'index': index, 'latest': latest, 'columns': columns,
+                'version': version, 'files': len(files), 'bytes': sum(size for _, _, size in files)}
+    
+    def reload(self, force=False):
+        """文件有变化时重建索引并整体替换（读者始终看到完整的一版）；返回是否重新加载"""
+        with self._lock:
+            self._checked = time.monotonic()
+            files = self._scan()
+            if not force and files == self._files:
+                return False
+            try:
+                state = self._build(files)
+            except Exception as e:  # 文件损坏或列类型异常等任何错误都不替换当前版本
+                logger.warning("统计年鉴加载失败: %s", e)
+                if self._state is not None:
+                    return False  # 保留上一版本
+                files, state = [], self._build([])
+            if self._state is not None:
+                self.reloads += 1
+                logger.info("统计年鉴已热加载：%d 个文件，%d 个城市", state['files'], len(state['latest']))
+            self._files, self._state = files, state
+            return True
+    
+    def maybe_reload(self):
+        """距上次检查超过 check_interval 时检查文件变化"""
+        if time.monotonic() - self._checked >= self.check_interval:
+            return self.reload()
+        return False
+    
+    @property
+    def version(self):
+        """当前数据版本（随文件变化而变，可用作缓存键）"""
+        self.maybe_reload()
+        return self._state['version']
+    
+    def get(self, city, year=None):
+        """按 (城市, 年份) 取一行指标，year 为空时取该城市最新年份；无数据返回None"""
+        self.maybe_reload()
+        state = self._state
+        city = str(city).strip()
+        if year is not None:
+            year = _stats_year(year)
+            if year is None:
+                return None
+        key = (city, state['latest'].get(city) if year is None else year)
+        loc = state['index'].get(key)
+        if loc is None:
+            return None
+        table = state['tables'][loc[0]]
+        names = set(_table_columns(table))
+        row = {'city': city, 'year': key[1]}
+        for name in state['columns']:
+            if name in names:
+                value = _table_cell(table, name, loc[1])
+                if value is not None:
+                    row[name] = value
+        return row
+    
+    def cities(self):
+        """已收录的城市"""
+        self.maybe_reload()
+        return list(self._state['latest'])
+    
+    def __contains__(self, city):
+        return self.get(city) is not None
+    
+    def stats(self):
+        """数据来源、规模与热加载次数"""
+        self.maybe_reload()
+        state = self._state
+        years = [y for _, y in state['index'] if y is not None]
+        return {'source': 'files' if state['files'] else 'builtin', 'files': state['files'],
+                'cities': len(state['latest']), 'rows': len(state['index']), 'bytes': state['bytes'],
+                'years': (min(years), max(years)) if years else None, 'reloads': self.reloads,
+                'version': state['version']}
+
+def load_city_stats(root=CITY_STATS_DIR):
+    """城市统计年鉴数据仓（CITY_STATS_DIR 下的列式文件，无文件时为内置数据）"""
+    return CityStatsStore(root)
+
+def load_local_poi_backend(city):
+    """加载城市的本地POI索引（无导出文件时返回None）"""
+    for ext in (".jsonl", ".csv"):
+        path = os.path.join(POI_INDEX_DIR, f"{city}{ext}")
+        if os.path.exists(path):
+            return LocalPOIBackend.from_dump(path)
+    return None
+
+# ---------- 跨会话分析结果缓存 ----------
+ANALYSIS_DATA_VERSION = "2024.03"  # 统计年鉴/模拟数据版本，更新数据时修改即整体失效
+ANALYSIS_CACHE_BUDGET_MB = float(os.environ.get("ANALYSIS_CACHE_BUDGET_MB", "64"))
+ANALYSIS_DEGRADED_TTL = 30  # 降级结果（配额耗尽/部分字段回退）的短时缓存（秒），避免短时间内反复请求同一失败来源
+
+class AnalysisCache:
+    """进程级城市/商圈分析结果缓存：键为(类型, 城市, 商圈, 附加参数, 数据模式, 数据版本)，
+    按序列化体积计入内存预算，超出时LRU淘汰；真实数据按TTL过期，降级结果只缓存 degraded_ttl 秒"""
+    DEFAULT_TTLS = {'mock': None, 'real': 6 * 3600}  # 与高德POI文本搜索缓存有效期一致
+
+    def __init__(self, budget_mb=ANALYSIS_CACHE_BUDGET_MB, data_version=ANALYSIS_DATA_VERSION, ttls=None,
+                 degraded_ttl=ANALYSIS_DEGRADED_TTL):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.data_version = data_version
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.degraded_ttl = degraded_ttl
+        self._entries = OrderedDict()  # 键 -> (值, 字节数, 写入时间, 是否降级)
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, kind, city, district, mode, extra=()):
+        return (kind, city, district or '', tuple(extra), mode, self.data_version)
+
+    def get_or_compute(self, kind, city, district, mode, compute, extra=()):
+        """命中直接返回副本；未命中时同键并发只计算一次"""
+        key = self.key(kind, city, district, mode, extra)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry, mode):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+            self.misses += 1
+        return dict(self._flights.do(key, lambda: self._compute(key, compute)))
+
+    def _fresh(self, entry, mode):
+        ttl = self.degraded_ttl if entry[3] else self.ttls.get(mode)
+        return ttl is None or time.time() - entry[2] < ttl
+    
+    def _compute(self, key, compute):
+        value = compute()
+        # 配额耗尽/部分字段降级的结果只短时缓存，过期后重新获取
+        degraded = bool(value.get('data_warning') or value.get('fallback_fields'))
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size, time.time(), degraded)
+            self.bytes += size
+            while self.bytes > self.budget and len(self._entries) > 1:
+                _, (_, evicted, _, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def contains(self, kind, city, district, mode, extra=()):
+        """是否已有未过期的缓存（不计入命中统计，供预取判断）"""
+        key = self.key(kind, city, district, mode, extra)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._fresh(entry, mode)
+
+    def invalidate(self, mode=None, city=None):
+        """按数据模式/城市失效（缺省全部），返回删除条数"""
+        with self._lock:
+            doomed = [k for k in self._entries
+                      if (mode is None or k[4] == mode) and (city is None or k[1] == city)]
+            for k in doomed:
+                self.bytes -= self._entries.pop(k)[1]
+        return len(doomed)
+
+    def stats(self):
+        """命中率、条目数与内存占用"""
+        with self._lock:
+            entries = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'bytes': self.bytes,
+            'budget': self.budget,
+            'evictions': self.evictions,
+            'coalesced': self._flights.shared,
+        }
+
+# ---------- 商圈分析预取（后台预热分析缓存）----------
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "2"))
+PREFETCH_DISTRICTS = int(os.environ.get("PREFETCH_DISTRICTS", "6"))   # 每个城市最多预取的商圈数
+PREFETCH_MIN_QUOTA = 200   # 高德日配额剩余低于此值时停止预取，把配额留给用户主动查询
+PREFETCH_RETRY_AFTER = 300  # 同一商圈预取后多久内不再重复预取（秒）；降级结果只短时缓存，避免每次重跑都重试
+
+def likely_districts(city, limit=PREFETCH_DISTRICTS):
+    """城市下用户最可能查看的商圈：模拟样本库中的商圈优先，其次为地名词典收录的商圈"""
+    names = [d for c, d in MOCK_DISTRICT_DB if c == city]
+    names += [name for kind, name, owner in get_gazetteer().entries if kind == 'district' and owner == city]
+    return list(dict.fromkeys(names))[:limit]
+
+class DistrictPrefetcher:
+    """用户浏览当前标签时，在有界线程池中预先分析可能查看的商圈并写入 AnalysisCache；
+    同一会话切换城市（或数据模式）后，尚未开始的旧城市预取任务被取消"""
+    def __init__(self, cache, max_workers=PREFETCH_WORKERS):
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.RLock()  # Future 已完成或被取消时回调在持锁线程内同步执行
+        self._scopes = {}    # 会话 -> (城市, 数据模式, [Future])，只保留仍有未完成任务的会话
+        self._inflight = {}  # (城市, 商圈, 数据模式, 竞品) -> Future，跨会话去重
+        self._attempted = {}  # 同上键 -> 最近一次提交时间
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def prefetch(self, scope, city, districts, amap_client=None, use_mock=True, poi_backend=None,
+                 competitor='大米先生'):
+        """为会话 scope 预取 city 下的商圈（按优先级排列），返回新提交的任务数；
+        客户端处于强制刷新或高德剩余配额不足时不预取"""
+        client = None if use_mock else amap_client
+        mode = 'mock' if client is None else 'real'
+        if client is not None:
+            if client.bypass_cache:
+                return 0
+            quota_left = client.pool_stats()['quota_remaining']
+            if quota_left is not None and quota_left < PREFETCH_MIN_QUOTA:
+                return 0
+            client.warm_competitor_density(competitor, city)
+        submitted = 0
+        now = time.time()
+        with self._lock:
+            self._attempted = {k: t for k, t in self._attempted.items() if now - t < PREFETCH_RETRY_AFTER}
+            old_city, old_mode, futures = self._scopes.pop(scope, (None, None, []))
+            if (old_city, old_mode) != (city, mode):
+                # 其他会话也在等待的任务不取消
+                shared = {id(f) for _, _, fs in self._scopes.values() for f in fs}
+                for future in futures:
+                    if id(future) not in shared and future.cancel():
+                        self.cancelled += 1
+                futures = []
+            futures = [f for f in futures if not f.done()]
+            for district in districts:
+                key = (city, district, mode, competitor)
+                if not district or self.cache.contains('district', city, district, mode, extra=(competitor,)):
+                    continue
+                if key in self._inflight:
+                    if self._inflight[key] not in futures:
+                        futures.append(self._inflight[key])
+                    continue
+                if key in self._attempted:
+                    continue
+                future = self._pool.submit(analyze_district, city, district, client, use_mock,
+                                           poi_backend=poi_backend, competitor=competitor, cache=self.cache)
+                self._inflight[key] = future
+                self._attempted[key] = now
+                future.add_done_callback(lambda f, key=key: self._done(key, f))
+                futures.append(future)
+                submitted += 1
+            futures = [f for f in futures if not f.done()]
+            if futures:
+                self._scopes[scope] = (city, mode, futures)
+        return submitted
+
+    def _done(self, key, future):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if future.cancelled():
+                self._attempted.pop(key, None)  # 被取消的可在回到该城市时重新预取
+                return
+            if future.exception() is not None:
+                self.failed += 1
+                logger.warning("商圈预取失败 %s: %s", key[:2], future.exception())
+            else:
+                self.completed += 1
+
+    def stats(self):
+        """预取完成/取消/失败数与进行中任务数"""
+        with self._lock:
+            return {
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'failed': self.failed,
+                'pending': len(self._inflight),
+            }
+
+# ---------- 核心分析函数 ----------
+QUOTA_WARNING = "高德API配额已耗尽，当前结果已回退为模拟数据"
+
+def analyze_city(city_name, amap_client, city_stats, use_mock, cache=None):
+    """城市宏观分析接口（cache: 可选的跨会话 AnalysisCache）"""
+    if cache is not None:
+        mode = 'mock' if use_mock or amap_client is None else 'real'
+        # 真实模式的结果依赖年鉴数据，年鉴热加载后自动失效
+        extra = (getattr(city_stats, 'version', None),) if mode == 'real' else ()
+        return cache.get_or_compute('city', city_name, None, mode,
+                                    lambda: analyze_city(city_name, amap_client, city_stats, use_mock), extra=extra)
+    if use_mock or amap_client is None:
+        return generate_mock_city_data(city_name)
+    try:
+        return get_city_data_real(amap_client, city_name, city_stats)
+    except AMapQuotaExceeded as e:
+        logger.warning("城市分析配额耗尽: %s", e)
+        return dict(generate_mock_city_data(city_name), data_warning=QUOTA_WARNING)
+
+def analyze_district(city, district, amap_client, use_mock, poi_backend=None, competitor='大米先生',
+                     cache=None):
+    """商圈微观分析接口（cache: 可选的跨会话 AnalysisCache）"""
+    if cache is not None:
+        mode = 'mock' if use_mock or amap_client is None else 'real'
+        return cache.get_or_compute('district', city, district, mode,
+                                    lambda: analyze_district(city, district, amap_client, use_mock,
+                                                             poi_backend, competitor),
+                                    extra=(competitor,))
+    if use_mock or amap_client is None:
+        return generate_mock_district_data(city, district)
+    try:
+        return get_district_data_real(amap_client, city, district, poi_backend=poi_backend,
+                                      competitor=competitor)
+    except AMapQuotaExceeded as e:
+        logger.warning("商圈分析配额耗尽: %s", e)
+        return dict(generate_mock_district_data(city, district), data_warning=QUOTA_WARNING)
+
+# 季节性客流系数（按城市，未收录城市使用默认曲线）
+SEASONAL_FACTORS = {
+    '苏州': [0.85, 0.65, 0.90, 0.95, 1.0, 0.95, 0.88, 0.92, 0.98, 1.05, 1.02, 0.95],
+    '郑州': [0.70, 0.65, 0.85, 0.95, 1.0, 0.98, 0.95, 0.92, 0.96, 1.02, 0.90, 0.75],
+    '默认': [0.85, 0.80, 0.90, 0.95, 1.0, 0.98, 0.96, 0.97, 0.98, 1.02, 0.95, 0.85]
+}
+FORECAST_MONTHS = 60
+EQUIPMENT_DEPRECIATION = 2000000 / 60  # 200万设备5年折旧
+
+def _monthly_base(avg_price, seat_count, monthly_rent, labor_cost,
+                  food_cost_rate, utility_rate, marketing_rate, table_turnover):
+    """稳定期月营收与月利润（元），参数可为标量或数组"""
+    # 基础计算
+    daily_customers = seat_count * table_turnover
+    daily_revenue = daily_customers * avg_price
+    monthly_revenue = daily_revenue * 30
+    
+    # 成本与利润
+    monthly_food_cost = monthly_revenue * (food_cost_rate / 100)
+    monthly_utility = monthly_revenue * (utility_rate / 100)
+    monthly_marketing = monthly_revenue * (marketing_rate / 100)
+    monthly_other = monthly_revenue * 0.05
+    monthly_profit = (monthly_revenue - monthly_food_cost - monthly_utility -
+                      monthly_marketing - monthly_other -
+                      labor_cost * 10000 - monthly_rent * 10000 -
+                      EQUIPMENT_DEPRECIATION)
+    return monthly_revenue, monthly_profit
+
+def financial_forecast_batch(avg_price, seat_count, monthly_rent, labor_cost,
+                             food_cost_rate, utility_rate, marketing_rate,
+                             initial_investment, city, table_turnover=2.8,
+                             return_cashflow=True):
+    """向量化财务预测：各参数可为标量或等长数组，一次计算N个情景
+    
+    返回的现金流矩阵为 (N, 60)，金额单位为元；annual_profit 单位为万元。
+    """
+    inputs = [avg_price, seat_count, monthly_rent, labor_cost, food_cost_rate,
+              utility_rate, marketing_rate, initial_investment, table_turnover]
+    shape = np.broadcast_shapes(*(np.shape(v) for v in inputs), np.shape(city))
+    n = int(np.prod(shape))
+    (avg_price, seat_count, monthly_rent, labor_cost, food_cost_rate,
+     utility_rate, marketing_rate, initial_investment, table_turnover) = [
+        np.broadcast_to(np.asarray(v, dtype=float), shape).reshape(n) for v in inputs
+    ]
+    monthly_revenue, monthly_profit = _monthly_base(
+        avg_price, seat_count, monthly_rent, labor_cost, food_cost_rate,
+        utility_rate, marketing_rate, table_turnover)
+    
+    # 季节性：同城情景共用一行系数
+    cities = np.broadcast_to(np.asarray(city, dtype=object), shape).reshape(n).astype(str)
+    unique_cities, city_idx = np.unique(cities, return_inverse=True)
+    season_table = np.array([SEASONAL_FACTORS.get(c, SEASONAL_FACTORS['默认']) for c in unique_cities])
+    
+    # 5年现金流：增长与季节系数按 (情景, 月份) 广播
+    m = np.arange(1, FORECAST_MONTHS + 1)
+    growth = 1.0 + np.minimum(0.5, m * 0.015)  # 前33个月增长
+    seasonal = season_table[city_idx][:, (m - 1) % 12]
+    adj_profit = monthly_profit[:, None] * growth * seasonal
+    cum_cash = np.cumsum(np.column_stack([-initial_investment, adj_profit]), axis=1)[:, 1:]
+    
+    reached = cum_cash >= 0
+    breakeven_month = np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, 99)
+    annual_profit = (adj_profit[:, -12:] / 10000).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roe = np.where(initial_investment > 0,
+                       annual_profit / (initial_investment / 10000) * 100, 0.0)
+    
+    result = {
+        'monthly_revenue': monthly_revenue,
+        'monthly_profit': monthly_profit,
+        'breakeven_month': breakeven_month,
+        'annual_profit': annual_profit,
+        'roe': roe,
+    }
+    if return_cashflow:
+        result['revenue'] = monthly_revenue[:, None] * growth * seasonal
+        result['profit'] = adj_profit
+        result['cum_cash'] = cum_cash
+    return result
+
+def financial_forecast(avg_price, seat_count, monthly_rent, labor_cost, 
+                       food_cost_rate, utility_rate, marketing_rate, 
+                       initial_investment, city, use_mock, table_turnover=2.8):
+    """财务预测核心模型（单情景，基于向量化引擎）"""
+    import pandas as pd
+    res = financial_forecast_batch(avg_price, seat_count, monthly_rent, labor_cost,
+                                   food_cost_rate, utility_rate, marketing_rate,
+                                   initial_investment, city, table_turnover)
+    df_cashflow = pd.DataFrame({
+        '月份': np.arange(1, FORECAST_MONTHS + 1),
+        '营收(万)': res['revenue'][0] / 10000,
+        '利润(万)': res['profit'][0] / 10000,
+        '累计现金流(万)': res['cum_cash'][0] / 10000
+    })
+    
+    return {
+        'monthly_revenue': float(res['monthly_revenue'][0]),
+        'monthly_profit': float(res['monthly_profit'][0]),
+        'breakeven_month': int(res['breakeven_month'][0]),
+        'annual_profit': float(res['annual_profit'][0]),
+        'roe': float(res['roe'][0]),
+        'df_cashflow': df_cashflow,
+        'seasonal_factors': SEASONAL_FACTORS.get(city, SEASONAL_FACTORS['默认'])
+    }
+
+# ---------- 蒙特卡洛风险模拟 ----------
+# 各不确定输入的抽样分布，取值为相对基准值的倍数：
+#   ('normal', 均值, 标准差) / ('uniform', 下限, 上限) / ('triangular', 下限, 众数, 上限)
+# seasonal_amplitude 缩放季节系数相对1.0的偏离幅度
+MC_DEFAULT_DISTRIBUTIONS = {
+    'table_turnover': ('triangular', 0.75, 1.0, 1.15),
+    'monthly_rent': ('normal', 1.0, 0.10),
+    'food_cost_rate': ('uniform', 0.92, 1.10),
+    'seasonal_amplitude': ('normal', 1.0, 0.30),
+}
+MC_PERCENTILES = (5, 25, 50, 75, 95)
+MC_QUANTILE_BINS = 4096
+
+def _binned_percentiles(values, percentiles, bins=MC_QUANTILE_BINS):
+    """分箱近似分位数：一次O(N)计数，误差不超过一个箱宽（值域的1/bins）
+    
+    为减少内存带宽，values 会被原地改写。
+    """
+    lo, hi = values.min(), values.max()
+    if hi <= lo:
+        return np.full(len(percentiles), lo, dtype=float)
+    scale = bins / (float(hi) - float(lo))
+    values -= lo
+    values *= values.dtype.type(scale)
+    idx = values.astype(np.intp)
+    np.minimum(idx, bins - 1, out=idx)
+    cdf = np.cumsum(np.bincount(idx, minlength=bins))
+    targets = np.asarray(percentiles, dtype=float) / 100 * values.size
+    pos = np.searchsorted(cdf, targets)
+    prev = np.where(pos > 0, cdf[pos - 1], 0)
+    frac = (targets - prev) / np.maximum(cdf[pos] - prev, 1)
+    return float(lo) + (pos + frac) / scale
+
+def _mc_draw(rng, spec, n):
+    """按分布配置抽取n个样本"""
+    kind, *args = spec
+    if kind == 'normal':
+        return rng.normal(args[0], args[1], n)
+    if kind == 'uniform':
+        return rng.uniform(args[0], args[1], n)
+    if kind == 'triangular':
+        return rng.triangular(args[0], args[1], args[2], n)
+    raise ValueError(f"未知分布类型: {kind}")
+
+def monte_carlo_forecast(avg_price, seat_count, monthly_rent, labor_cost,
+                         food_cost_rate, utility_rate, marketing_rate,
+                         initial_investment, city, table_turnover=2.8,
+                         n_samples=100_000, distributions=None, seed=None):
+    """蒙特卡洛风险模拟：返回累计现金流分位带与回本月份概率分布
+    
+    累计现金流对“月利润”和“季节幅度”是线性的：
+    cum[m] = -投资 + 利润 * (A[m] + 幅度 * B[m])，A、B为按月累加的增长/季节项，
+    因此逐月只需O(N)的向量运算（分位数用分箱计数近似），无需构造 N×60 矩阵，
+    10^6 样本也可在约1秒内完成。
+    """
+    import pandas as pd
+    dists = dict(MC_DEFAULT_DISTRIBUTIONS, **(distributions or {}))
+    rng = np.random.default_rng(seed)
+    turnover = table_turnover * np.clip(_mc_draw(rng, dists['table_turnover'], n_samples), 0, None)
+    rent = monthly_rent * np.clip(_mc_draw(rng, dists['monthly_rent'], n_samples), 0, None)
+    food = food_cost_rate * np.clip(_mc_draw(rng, dists['food_cost_rate'], n_samples), 0, None)
+    amplitude = np.clip(_mc_draw(rng, dists['seasonal_amplitude'], n_samples), 0, 2)
+    _, profit = _monthly_base(avg_price, seat_count, rent, labor_cost, food,
+                              utility_rate, marketing_rate, turnover)
+    
+    m = np.arange(1, FORECAST_MONTHS + 1)
+    growth = 1.0 + np.minimum(0.5, m * 0.015)
+    season = np.asarray(SEASONAL_FACTORS.get(city, SEASONAL_FACTORS['默认']))[(m - 1) % 12]
+    a = np.cumsum(growth)
+    b = np.cumsum(growth * (season - 1.0))
+    profit_amp = profit * amplitude
+    
+    # 分位带：float32逐月复用缓冲区（精度约1元，足够绘图），避免生成临时数组
+    bands = np.empty((FORECAST_MONTHS, len(MC_PERCENTILES)))
+    profit32 = profit.astype(np.float32)
+    profit_amp32 = profit_amp.astype(np.float32)
+    cum = np.empty(n_samples, dtype=np.float32)
+    tmp = np.empty(n_samples, dtype=np.float32)
+    for i in range(FORECAST_MONTHS):
+        np.multiply(profit32, np.float32(a[i]), out=cum)
+        np.multiply(profit_amp32, np.float32(b[i]), out=tmp)
+        cum += tmp
+        cum -= np.float32(initial_investment)
+        bands[i] = _binned_percentiles(cum, MC_PERCENTILES)
+    
+    # 回本月份：幅度限制在[0, 2]时各月调整后季节系数恒为正，利润为正的样本累计现金流单调递增，
+    # 向量化二分查找首个非负月份；利润非正的样本只可能在第1个月回本
+    lo = np.zeros(n_samples, dtype=np.intp)
+    hi = np.full(n_samples, FORECAST_MONTHS, dtype=np.intp)
+    for _ in range(int(np.ceil(np.log2(FORECAST_MONTHS + 1)))):
+        mid = (lo + hi) // 2
+        safe = np.minimum(mid, FORECAST_MONTHS - 1)
+        ok = profit * a[safe] + profit_amp * b[safe] - initial_investment >= 0
+        hi = np.where(ok, mid, hi)
+        lo = np.where(ok, lo, mid + 1)
+    first_ok = profit * a[0] + profit_amp * b[0] - initial_investment >= 0
+    breakeven = np.where(profit > 0, lo + 1, np.where(first_ok, 1, 99))
+    breakeven[breakeven > FORECAST_MONTHS] = 99
+    
+    counts = np.bincount(breakeven, minlength=100)
+    outcomes = np.append(m, 99)
+    df_breakeven = pd.DataFrame({'回本月份': outcomes, '概率': counts[outcomes] / n_samples})
+    df_bands = pd.DataFrame(bands / 10000, columns=[f'P{p}' for p in MC_PERCENTILES])
+    df_bands.insert(0, '月份', m)
+    reached = breakeven[breakeven < 99]
+    return {
+        'n_samples': n_samples,
+        'df_bands': df_bands,
+        'df_breakeven': df_breakeven,
+        'prob_breakeven': reached.size / n_samples,
+        'median_breakeven': int(np.median(reached)) if reached.size else 99
+    }
+
+# ---------- 敏感性分析（网格扫描 + 龙卷风图）----------
+SENSITIVITY_PARAMS = {
+    'monthly_rent': '月租金(万元)',
+    'table_turnover': '翻台率(次/天)',
+    'avg_price': '客单价(元)',
+    'food_cost_rate': '食材成本率%',
+    'labor_cost': '月人力成本(万元)',
+    'seat_count': '座位数',
+    'utility_rate': '水电杂费率%',
+    'marketing_rate': '营销费率%',
+    'initial_investment': '初始投资(元)',
+}
+
+SENSITIVITY_MEMO_ENTRIES = 16_384  # 每会话记忆的情景数上限：可容纳最大网格(121×121)与一次龙卷风分析，约5MB
+
+class SensitivityMemo:
+    """敏感性分析逐格记忆化：键为完整情景参数，扩大扫描范围时只计算新增格点；超出上限时LRU淘汰"""
+    _KEY_FORMAT = struct.Struct(f"{len(SENSITIVITY_PARAMS)}d")
+    
+    def __init__(self, max_entries=SENSITIVITY_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self.computed = 0
+        self.reused = 0
+    
+    @classmethod
+    def _key(cls, scenario):
+        # 按 SENSITIVITY_PARAMS 固定顺序打包为bytes（每条约300字节，不到(参数名, 值)元组键的三分之一）
+        values = cls._KEY_FORMAT.pack(*(round(float(scenario[p]), 6) for p in SENSITIVITY_PARAMS))
+        return values + str(scenario['city']).encode('utf-8')
+    
+    def evaluate(self, scenarios):
+        """批量评估情景列表，返回 (回本月份数组, ROE数组)；仅未命中的情景进入向量化引擎"""
+        keys = [self._key(sc) for sc in scenarios]
+        missing = {}
+        for key, sc in zip(keys, scenarios):
+            if key in self._memo:
+                self._memo.move_to_end(key)
+            elif key not in missing:
+                missing[key] = sc
+        self.reused += len(keys) - len(missing)
+        fresh = {}
+        if missing:
+            cols = {p: [sc[p] for sc in missing.values()] for p in list(SENSITIVITY_PARAMS) + ['city']}
+            res = financial_forecast_batch(**cols, return_cashflow=False)
+            for i, key in enumerate(missing):
+                fresh[key] = self._memo[key] = (int(res['breakeven_month'][i]), float(res['roe'][i]))
+            self.computed += len(missing)
+        # 先取值再淘汰：本次请求超过上限时也能完整返回
+        values = [fresh[key] if key in fresh else self._memo[key] for key in keys]
+        while len(self._memo) > self.max_entries:
+            self._memo.popitem(last=False)
+        return (np.array([v[0] for v in values]), np.array([v[1] for v in values]))
+
+def sensitivity_values(base_value, range_pct, step_pct):
+    """以固定步长生成扫描取值，范围扩大时原有格点保持不变"""
+    k = int(range_pct // step_pct)
+    return [round(base_value * (1 + i * step_pct / 100), 4) for i in range(-k, k + 1)]
+
+def sensitivity_grid(base, x_param, x_values, y_param, y_values, memo):
+    """双参数网格扫描，返回回本月份与ROE矩阵（行=y，列=x）"""
+    scenarios = [dict(base, **{x_param: x, y_param: y}) for y in y_values for x in x_values]
+    breakeven, roe = memo.evaluate(scenarios)
+    shape = (len(y_values), len(x_values))
+    return {'breakeven': breakeven.reshape(shape), 'roe': roe.reshape(shape)}
+
+def tornado_analysis(base, memo, swing_pct=20, params=None):
+    """龙卷风分析：各参数单独上下浮动swing_pct%，按ROE变动幅度排序"""
+    import pandas as pd
+    params = params or list(SENSITIVITY_PARAMS)
+    scenarios = [base]
+    for p in params:
+        scenarios.append(dict(base, **{p: base[p] * (1 - swing_pct / 100)}))
+        scenarios.append(dict(base, **{p: base[p] * (1 + swing_pct / 100)}))
+    breakeven, roe = memo.evaluate(scenarios)
+    rows = []
+    for i, p in enumerate(params):
+        rows.append({
+            '参数': SENSITIVITY_PARAMS[p],
+            '下调ROE': roe[1 + 2 * i],
+            '上调ROE': roe[2 + 2 * i],
+            '下调回本': breakeven[1 + 2 * i],
+            '上调回本': breakeven[2 + 2 * i],
+        })
+    df = pd.DataFrame(rows)
+    df['基准ROE'] = roe[0]
+    df['影响幅度'] = (df['上调ROE'] - df['下调ROE']).abs()
+    return df.sort_values('影响幅度').reset_index(drop=True)
+
+def risk_assessment(city_data, district_data, financials, brand_config):
+    """综合风险评估"""
+    risks = {}
+    
+    # 市场风险
+    comp_score = min(100, district_data.get('competitor_count', 0) * 12)
+    demand_score = 100 - city_data.get('growth_potential', 80)
+    price_score = 30 if brand_config['avg_price'] > 55 else 20
+    risks['市场风险'] = {
+        '竞争激烈度': comp_score,
+        '需求波动': demand_score,
+        '价格敏感': price_score,
+        '平均': (comp_score + demand_score + price_score) / 3
+    }
+    
+    # 运营风险
+    rent_score = max(0, (district_data.get('avg_rent', 200) - 150) // 2)
+    labor_score = 25  # 默认
+    supply_score = 15 if city_data.get('logistics_score', 80) > 85 else 25
+    risks['运营风险'] = {
+        '租金压力': rent_score,
+        '人力稳定性': labor_score,
+        '供应链风险': supply_score,
+        '平均': (rent_score + labor_score + supply_score) / 3
+    }
+    
+    # 财务风险
+    payback_score = 40 if financials['breakeven_month'] > 24 else 20 if financials['breakeven_month'] > 18 else 10
+    cashflow_score = 30 if financials['monthly_profit'] < 50000 else 15
+    risks['财务风险'] = {
+        '回本周期': payback_score,
+        '现金流压力': cashflow_score,
+        '投资强度': 20 if brand_config['budget_max'] > 250 else 10,
+        '平均': (payback_score + cashflow_score + 20) / 3
+    }
+    
+    # 政策风险
+    policy_score = 100 - city_data.get('policy_score', 80)
+    env_score = 30 if district_data.get('visibility_score', 70) < 60 else 15
+    risks['政策风险'] = {
+        '证照难度': policy_score,
+        '环保消防': env_score,
+        '地方保护': 20,
+        '平均': (policy_score + env_score + 20) / 3
+    }
+    
+    # 总风险分
+    total_score = sum([v['平均'] for v in risks.values()]) / len(risks)
+    return risks, total_score
+
+def _feature(data, name, default, n):
+    """按列取特征（DataFrame/数组字典均可），缺列或缺值时用标量函数相同的默认值填充"""
+    if name in data:
+        values = np.asarray(data[name], dtype=float)
+        return np.where(np.isnan(values), float(default), values)
+    return np.full(n, float(default))
+
+def risk_assessment_frame(city_data, district_data, financials, brand_config):
+    """列式综合风险评估：一次计算N个情景的全部分项、类别平均与总分，结果与 risk_assessment 逐行一致
+    
+    city_data/district_data/financials 为按行对齐的DataFrame或数组字典，
+    返回列名形如“市场风险_竞争激烈度”“市场风险_平均”，总分列为 total_risk。
+    """
+    import pandas as pd
+    n = len(np.asarray(financials['breakeven_month']))
+    breakeven = _feature(financials, 'breakeven_month', 99, n)
+    monthly_profit = _feature(financials, 'monthly_profit', 0, n)
+    cols = {}
+    
+    # 市场风险
+    comp_score = np.minimum(100, _feature(district_data, 'competitor_count', 0, n) * 12)
+    demand_score = 100 - _feature(city_data, 'growth_potential', 80, n)
+    price_score = np.full(n, 30.0 if brand_config['avg_price'] > 55 else 20.0)
+    cols['市场风险_竞争激烈度'] = comp_score
+    cols['市场风险_需求波动'] = demand_score
+    cols['市场风险_价格敏感'] = price_score
+    cols['市场风险_平均'] = (comp_score + demand_score + price_score) / 3
+    
+    # 运营风险
+    rent_score = np.maximum(0, (_feature(district_data, 'avg_rent', 200, n) - 150) // 2)
+    labor_score = np.full(n, 25.0)
+    supply_score = np.where(_feature(city_data, 'logistics_score', 80, n) > 85, 15.0, 25.0)
+    cols['运营风险_租金压力'] = rent_score
+    cols['运营风险_人力稳定性'] = labor_score
+    cols['运营风险_供应链风险'] = supply_score
+    cols['运营风险_平均'] = (rent_score + labor_score + supply_score) / 3
+    
+    # 财务风险
+    payback_score = np.where(breakeven > 24, 40.0, np.where(breakeven > 18, 20.0, 10.0))
+    cashflow_score = np.where(monthly_profit < 50000, 30.0, 15.0)
+    cols['财务风险_回本周期'] = payback_score
+    cols['财务风险_现金流压力'] = cashflow_score
+    cols['财务风险_投资强度'] = np.full(n, 20.0 if brand_config['budget_max'] > 250 else 10.0)
+    cols['财务风险_平均'] = (payback_score + cashflow_score + 20) / 3
+    
+    # 政策风险
+    policy_score = 100 - _feature(city_data, 'policy_score', 80, n)
+    env_score = np.where(_feature(district_data, 'visibility_score', 70, n) < 60, 30.0, 15.0)
+    cols['政策风险_证照难度'] = policy_score
+    cols['政策风险_环保消防'] = env_score
+    cols['政策风险_地方保护'] = np.full(n, 20.0)
+    cols['政策风险_平均'] = (policy_score + env_score + 20) / 3
+    
+    # 总风险分（与标量版相同的累加顺序）
+    categories = ['市场风险', '运营风险', '财务风险', '政策风险']
+    total = np.zeros(n)
+    for cat in categories:
+        total = total + cols[f'{cat}_平均']
+    cols['total_risk'] = total / len(categories)
+    return pd.DataFrame(cols)
+
+def ai_recommendations(city_data, district_data, financials, brand_config):
+    """AI智能建议（基于规则+历史经验）"""
+    recs = []
+    
+    # 选址建议
+    if district_data.get('competitor_count', 0) > 5:
+        recs.append(("竞争策略", "竞品密集，建议错位经营：主打现炒锅气，增加外卖窗口", "⚠️"))
+    else:
+        recs.append(("竞争策略", "竞争温和，可快速抢占心智，加大营销投入", "✅"))
+    
+    if financials['breakeven_month'] > 24:
+        recs.append(("财务优化", f"回本周期{financials['breakeven_month']}个月偏长，建议降低租金或提升翻台率", "🔴"))
+    else:
+        recs.append(("财务健康", f"回本周期{financials['breakeven_month']}个月，处于健康区间", "🟢"))
+    
+    # 本地化调整
+    if city_data.get('spicy_acceptance', 50) < 70:
+        recs.append(("菜品本地化", "建议增加免辣/微辣菜品，占比约30%，并推出儿童套餐", "🟡"))
+    
+    if brand_config['avg_price'] > 55:
+        recs.append(("价格策略", "客单价偏高，建议设置39元引流套餐，提升复购", "🟡"))
+    elif brand_config['avg_price'] < 45:
+        recs.append(("价格策略", "客单价偏低，可小幅提价至49-52元，优化利润结构", "🟢"))
+    
+    # 通用建议
+    recs.append(("会员体系", "开业前30天启动社群运营，储值赠礼锁定初始客流", "✅"))
+    recs.append(("人员培训", "提前45天招聘店长、厨师，进行标准化操作培训", "✅"))
+    
+    return recs
+
+# ---------- 批量候选选址评分 ----------
+# 聊天顾问与批量评分共用的标准店财务假设
+STANDARD_STORE_AREA = 300  # ㎡
+STANDARD_OPEX = {'labor_cost': 15, 'food_cost_rate': 32, 'utility_rate': 8, 'marketing_rate': 5}
+
+def match_score_components(city_data, district_data, total_risk, avg_price):
+    """综合匹配得分分项；参数可为单个情景的dict，也可为批量评分的DataFrame/Series"""
+    return {
+        '辣味接受': 0.25 * city_data.get('spicy_acceptance', 60),
+        '消费能力': 0.20 * (city_data.get('disposable_income', 50000) / 1000),
+        '竞争强度': 0.15 * (100 - district_data.get('competitor_count', 0) * 8),
+        '客流规模': 0.15 * district_data.get('daily_flow', 50000) / 1000,
+        '风险水平': 0.15 * (100 - total_risk),
+        '价格匹配': 0.10 * (100 - abs(avg_price - 49) * 2),
+    }
+
+def score_candidates(candidates, brand_config, amap_client=None, city_stats=None,
+                     use_mock=True, poi_loader=None, max_workers=4):
+    """批量候选选址评分：按城市/商圈去重批量获取特征，向量化财务预测，返回按综合得分排序的DataFrame
+    
+    candidates 需包含 city、district 两列，可选 avg_price 列覆盖品牌客单价。
+    """
+    import pandas as pd
+    df = candidates.reset_index(drop=True).copy()
+    df['city'] = df['city'].astype(str).str.strip()
+    df['district'] = df['district'].astype(str).str.strip()
+    if 'avg_price' not in df:
+        df['avg_price'] = brand_config['avg_price']
+    df['avg_price'] = df['avg_price'].fillna(brand_config['avg_price']).astype(float)
+    client = None if use_mock else amap_client
+    
+    # 1. 城市与商圈特征：每个城市、每个(城市, 商圈)只分析一次，真实模式下并发获取
+    cities = df['city'].unique().tolist()
+    pairs = list(dict.fromkeys(zip(df['city'], df['district'])))
+    def fetch_district(pair):
+        city, district = pair
+        return analyze_district(city, district, client, use_mock,
+                                poi_backend=poi_loader(city) if poi_loader else None,
+                                competitor=brand_config['main_competitor'])
+    if use_mock or client is None:
+        city_rows = [analyze_city(c, None, city_stats, True) for c in cities]
+        district_rows = [fetch_district(p) for p in pairs]
+    else:
+        # 按城市批量地理编码（每次请求最多10个地址）并写入缓存，各商圈分析的地理编码随后直接命中
+        if client.cache is not None:
+            try:
+                for city in cities:
+                    client.geocode_many([f"{d},{c}" for c, d in pairs if c == city], city)
+            except AMapQuotaExceeded as e:
+                logger.warning("批量地理编码配额耗尽: %s", e)
+        # 先构建各城市竞品密度栅格，避免首批商圈分析在耗时预算内等待整城POI拉取
+        wait([client.warm_competitor_density(brand_config['main_competitor'], c) for c in cities])
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch") as pool:
+            city_rows = list(pool.map(lambda c: analyze_city(c, client, city_stats, False), cities))
+            district_rows = list(pool.map(fetch_district, pairs))
+    city_df = pd.DataFrame(city_rows, index=cities)
+    district_df = pd.DataFrame(district_rows, index=pd.MultiIndex.from_tuples(pairs))
+    city_feat = city_df.reindex(df['city']).reset_index(drop=True)
+    district_feat = district_df.reindex(pd.MultiIndex.from_arrays([df['city'], df['district']])).reset_index(drop=True)
+    
+    # 2. 向量化财务预测（与聊天顾问相同的标准店假设）
+    fin = financial_forecast_batch(
+        avg_price=df['avg_price'].to_numpy(),
+        seat_count=brand_config['seat_count'],
+        monthly_rent=district_feat['avg_rent'].to_numpy() * STANDARD_STORE_AREA / 10000,
+        initial_investment=brand_config['budget_min'] * 10000,
+        city=df['city'].to_numpy(),
+        return_cashflow=False,
+        **STANDARD_OPEX
+    )
+    fin_df = pd.DataFrame({k: fin[k] for k in ('monthly_revenue', 'monthly_profit',
+                                               'breakeven_month', 'annual_profit', 'roe')})
+    
+    # 3. 列式风险评估
+    fin_df['total_risk'] = risk_assessment_frame(city_feat, district_feat, fin_df, brand_config)['total_risk']
+    
+    # 4. 综合得分与分项
+    components = pd.DataFrame(match_score_components(city_feat, district_feat, fin_df['total_risk'], df['avg_price']))
+    result = pd.concat([
+        df[['city', 'district', 'avg_price']],
+        district_feat[['daily_flow', 'competitor_count', 'avg_rent']],
+        fin_df[['breakeven_month', 'roe', 'annual_profit', 'total_risk']],
+        components
+    ], axis=1)
+    result['match_score'] = components.sum(axis=1)
+    result = result.sort_values('match_score', ascending=False, kind='stable').reset_index(drop=True)
+    result.insert(0, 'rank', np.arange(1, len(result) + 1))
+    return result
+
+# 多进程批量评分：每个工作进程持有独立的高德客户端，QPS与日配额按进程数均分
+_score_worker = {}
+
+def _score_worker_state(brand_config, amap_key, qps, daily_quota, use_local_poi):
+    """评分上下文：本进程的高德客户端（共享SQLite缓存文件）、统计年鉴与本地POI加载器"""
+    client = None
+    if amap_key:
+        client = AMapService(amap_key, cache=AMapCache(AMAP_CACHE_PATH), qps=qps, daily_quota=daily_quota)
+    poi_backends = {}
+    def poi_loader(city):
+        if city not in poi_backends:
+            poi_backends[city] = load_local_poi_backend(city)
+        return poi_backends[city]
+    return dict(brand_config=brand_config, client=client, city_stats=load_city_stats(),
+                poi_loader=poi_loader if use_local_poi else None)
+
+def _init_score_worker(*initargs):
+    """工作进程初始化：评分上下文存入进程全局，供 _score_chunk 使用"""
+    _score_worker.update(_score_worker_state(*initargs))
+
+def _score_chunk_with(state, chunk):
+    """按给定评分上下文对一块候选执行 score_candidates"""
+    return score_candidates(chunk, state['brand_config'], state['client'], state['city_stats'],
+                            use_mock=state['client'] is None, poi_loader=state['poi_loader'])
+
+def _score_chunk(chunk):
+    """在工作进程内对一块候选执行 score_candidates"""
+    return _score_chunk_with(_score_worker, chunk)
+
+def score_candidates_parallel(candidates, brand_config, amap_key=None, workers=None,
+                              chunk_size=500, use_local_poi=False):
+    """多进程批量评分：按行连续分块分发到进程池，合并后统一排名（结果与 score_candidates 一致）"""
+    import pandas as pd
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunks = [candidates.iloc[i:i + chunk_size] for i in range(0, len(candidates), chunk_size)]
+    workers = min(workers, max(1, len(chunks)))
+    qps = AMAP_QPS / workers
+    daily_quota = AMAP_DAILY_QUOTA // workers if AMAP_DAILY_QUOTA else 0
+    initargs = (brand_config, amap_key, qps, daily_quota, use_local_poi)
+    if workers == 1:
+        # 进程内评分：上下文只在本次调用内使用，不写入工作进程全局
+        state = _score_worker_state(*initargs)
+        parts = [_score_chunk_with(state, c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_score_worker,
+                                 initargs=initargs) as pool:
+            parts = list(pool.map(_score_chunk, chunks))
+    if not parts:
+        return score_candidates(candidates, brand_config)
+    # 块内已稳定排序，块按原始顺序拼接后再稳定排序，同分时保持输入顺序
+    result = pd.concat(parts, ignore_index=True).drop(columns='rank')
+    result = result.sort_values('match_score', ascending=False, kind='stable').reset_index(drop=True)
+    result.insert(0, 'rank', np.arange(1, len(result) + 1))
+    return result
+
+# ---------- 分析依赖图（增量重算）----------
+def input_hash(value):
+    """输入参数的稳定哈希（字典按键排序，非JSON类型取repr）"""
+    raw = json.dumps(value, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+class AnalysisGraph:
+    """分析阶段依赖图：节点键 = 自身输入哈希 + 上游节点键，键未变直接复用记忆值，
+    任一输入变化只会让依赖它的下游节点重算；recomputed 记录本轮重算过的节点
+    
+    降级结果（含 fallback_fields / data_warning）及依赖它的下游节点不记忆，下次求值重新获取。
+    """
+    def __init__(self):
+        self._nodes = OrderedDict()  # 节点名 -> (函数, 输入名, 上游节点)
+        self._memo = {}              # 节点名 -> (节点键, 值)，每个节点只保留最近一次结果
+        self.recomputed = []
+        self.computed = 0
+        self.reused = 0
+    
+    def add(self, name, fn, inputs=(), deps=()):
+        """注册节点：fn(context, **输入参数, **上游节点值)，上游须先注册"""
+        for dep in deps:
+            if dep not in self._nodes:
+                raise KeyError(f"未注册的上游节点：{dep}")
+        self._nodes[name] = (fn, tuple(inputs), tuple(deps))
+        return self
+    
+    def begin_run(self):
+        """开始新一轮重跑，清空重算记录"""
+        self.recomputed = []
+    
+    def key(self, name, inputs, _keys=None):
+        """计算节点键（只看输入与上游键，不触发求值）"""
+        _keys = {} if _keys is None else _keys
+        if name not in _keys:
+            _, input_names, deps = self._nodes[name]
+            missing = [n for n in input_names if n not in inputs]
+            if missing:
+                raise KeyError(f"节点 {name} 缺少输入：{', '.join(missing)}")
+            own = {n: inputs[n] for n in input_names}
+            _keys[name] = input_hash([name, own, [self.key(d, inputs, _keys) for d in deps]])
+        return _keys[name]
+    
+    @staticmethod
+    def is_degraded(value):
+        """结果是否为回退/降级数据"""
+        return isinstance(value, dict) and bool(value.get('fallback_fields') or value.get('data_warning'))
+    
+    def evaluate(self, name, inputs, context=None, _keys=None, _values=None):
+        """求值节点：键与记忆一致则复用，否则先求值上游再重算本节点"""
+        _keys = {} if _keys is None else _keys
+        _values = {} if _values is None else _values  # 本次求值内已算出的节点：名 -> (值, 是否降级)
+        if name in _values:
+            return _values[name][0]
+        key = self.key(name, inputs, _keys)
+        memo = self._memo.get(name)
+        if memo is not None and memo[0] == key:
+            self.reused += 1
+            _values[name] = (memo[1], False)
+            return memo[1]
+        fn, input_names, deps = self._nodes[name]
+        kwargs = {n: inputs[n] for n in input_names}
+        for dep in deps:
+            kwargs[dep] = self.evaluate(dep, inputs, context, _keys, _values)
+        value = fn(context or {}, **kwargs)
+        degraded = self.is_degraded(value) or any(_values[d][1] for d in deps)
+        if degraded:
+            self._memo.pop(name, None)
+        else:
+            self._memo[name] = (key, value)
+        _values[name] = (value, degraded)
+        self.computed += 1
+        self.recomputed.append(name)
+        return value
+    
+    def invalidate(self, name=None):
+        """丢弃指定节点（缺省为全部）的记忆值"""
+        if name is None:
+            self._memo.clear()
+        else:
+            self._memo.pop(name, None)
+
+def generate_report(brand, city_name, district_name, city_data, district_data, financials,
+                    total_risk, risks, recs, match_score, report_time):
+    """综合选址报告（Markdown）"""
+    return f"""
+# {brand['brand_name']} 新店选址分析报告
+**生成时间**：{report_time}  
+**分析城市**：{city_name}  
+**推荐商圈**：{district_name}  
+
+---
+
+## 一、市场分析摘要
+- 城市人口：{city_data['population']} 万  
+- 人均可支配收入：{city_data['disposable_income']} 元/年  
+- 湘菜接受度：{city_data['spicy_acceptance']}%  
+- 商圈日均客流：{district_data['daily_flow']} 人  
+- 竞品数量（1km内）：{district_data['competitor_count']} 家  
+- 平均租金：{district_data['avg_rent']} 元/㎡/月  
+
+## 二、财务预测
+- 投资总额：{brand['budget_min']}~{brand['budget_max']} 万元  
+- 预计月营收：{financials['monthly_revenue']/10000:.1f} 万元  
+- 预计月利润：{financials['monthly_profit']/10000:.1f} 万元  
+- 投资回收期：{financials['breakeven_month']} 个月  
+- 年化ROE：{financials['roe']:.1f}%  
+
+## 三、风险评估
+综合风险评分：{total_risk:.1f}/100  
+主要风险项：{', '.join(list(risks)[:2])}
+
+## 四、AI建议
+1. 竞争策略：{recs[0][1] if recs else '差异化定位'}
+2. 本地化调整：根据口味接受度调整辣度
+3. 营销预热：开业前30天启动社群运营
+
+## 五、结论
+**综合推荐指数**：{match_score}/100  
+**建议行动**：{"优先推进" if match_score>=75 else "谨慎评估"}
+
+---
+*报告由湘菜品牌智能选址系统 v3.0 自动生成*
+        """
+
+def _city_node(ctx, city_name, use_mock, data_version, bypass_cache):
+    return analyze_city(city_name, ctx.get('amap_client'), ctx.get('city_stats'), use_mock,
+                        cache=ctx.get('analysis_cache'))
+
+def _district_node(ctx, city_name, district_name, use_mock, competitor, bypass_cache):
+    poi_loader = ctx.get('poi_loader')
+    return analyze_district(city_name, district_name, ctx.get('amap_client'), use_mock,
+                            poi_backend=poi_loader(city_name) if poi_loader else None,
+                            competitor=competitor, cache=ctx.get('analysis_cache'))
+
+def _financials_node(ctx, fin_params, use_mock):
+    return financial_forecast(use_mock=use_mock, **fin_params)
+
+def _risks_node(ctx, brand_config, city, district, financials):
+    return risk_assessment(city, district, financials, brand_config)
+
+def _recs_node(ctx, brand_config, city, district, financials):
+    return ai_recommendations(city, district, financials, brand_config)
+
+def _report_node(ctx, brand_config, city_name, district_name, city, district, financials, risks, recs):
+    risk_items, total_risk = risks
+    match_score = int(sum(match_score_components(city, district, total_risk,
+                                                 brand_config['avg_price']).values()))
+    report_time = time.strftime("%Y-%m-%d %H:%M:%S")
+    text = generate_report(brand_config, city_name, district_name, city, district, financials,
+                           total_risk, risk_items, recs, match_score, report_time)
+    return {'match_score': match_score, 'generated_at': report_time, 'text': text}
+
+def build_analysis_graph():
+    """选址分析依赖图：city/district/financials → risks/recs → report
+    
+    输入：city_name, district_name, use_mock, competitor, fin_params（financial_forecast参数）, brand_config,
+    data_version（统计年鉴版本，热加载后城市节点重算）, bypass_cache（强制刷新，此时 context 不带分析缓存）；
+    context 提供不参与哈希的资源：amap_client, city_stats, poi_loader, analysis_cache。
+    """
+    graph = AnalysisGraph()
+    graph.add('city', _city_node, inputs=('city_name', 'use_mock', 'data_version', 'bypass_cache'))
+    graph.add('district', _district_node,
+              inputs=('city_name', 'district_name', 'use_mock', 'competitor', 'bypass_cache'))
+    graph.add('financials', _financials_node, inputs=('fin_params', 'use_mock'))
+    graph.add('risks', _risks_node, inputs=('brand_config',), deps=('city', 'district', 'financials'))
+    graph.add('recs', _recs_node, inputs=('brand_config',), deps=('city', 'district', 'financials'))
+    graph.add('report', _report_node, inputs=('brand_config', 'city_name', 'district_name'),
+              deps=('city', 'district', 'financials', 'risks', 'recs'))
+    return graph
+
+# ---------- 自然语言处理（地名词典意图识别）----------
+# 词典未收录的商圈按通名后缀回退识别
+DISTRICT_FALLBACK_PATTERN = re.compile(r'([\u4e00-\u9fa5]{2,}(?:商圈|广场|中心|路|街|区))')
+
+def parse_user_query(query, brand_config=None, gazetteer=None):
+    """从用户输入中提取城市、商圈、客单价、预算（万元）、座位数（未提及的项取品牌配置）"""
+    brand_config = brand_config or DEFAULT_BRAND_CONFIG
+    intent = parse_intent(query, gazetteer)
+    district = intent['district']
+    if district is None:
+        # 从城市名之后开始匹配，避免把“我想在苏州”等前缀并入商圈名
+        district_match = DISTRICT_FALLBACK_PATTERN.search(query, intent['city_end'] or 0)
+        district = district_match.group(1) if district_match else None
+    
+    result = {
+        'city': intent['city'] or brand_config.get('priority_city', '苏州'),
+        'district': district,
+        'avg_price': intent['avg_price'] or brand_config.get('avg_price', 49),
+        'budget': intent['budget'] or brand_config.get('budget_min', 150),
+        'seat_count': intent['seat_count'] or brand_config.get('seat_count', 120)
+    }
+    return result
+
+def stream_chat_response(user_input, amap_client, use_mock, city_stats, poi_loader=None, brand_config=None,
+                         analysis_cache=None):
+    """逐段生成选址顾问回复：解析结果立即返回，客流/竞品、财务、风险、建议各阶段完成即输出"""
+    brand_config = brand_config or DEFAULT_BRAND_CONFIG
+    parsed = parse_user_query(user_input, brand_config)
+    city = parsed['city']
+    district = parsed['district'] if parsed['district'] else '工业园区湖东'  # 默认商圈
+    
+    yield f"🎯 **{city}{district if district else ''}选址分析报告**\n\n"
+    yield (f"🧭 **需求解析**: {city} · {district}  |  客单价 {parsed['avg_price']} 元  |  "
+           f"预算 {parsed['budget']:g} 万元  |  {parsed['seat_count']} 座\n\n")
+    
+    # 获取数据
+    city_data = analyze_city(city, amap_client, city_stats, use_mock, cache=analysis_cache)
+    district_data = analyze_district(city, district, amap_client, use_mock,
+                                     poi_backend=poi_loader(city) if poi_loader else None,
+                                     competitor=brand_config['main_competitor'], cache=analysis_cache)
+    yield f"👥 **日均客流**: {district_data['daily_flow']:,} 人  |  🏪 **竞品数量**: {district_data['competitor_count']} 家\n"
+    yield f"💰 **租金水平**: {district_data['avg_rent']} 元/㎡/月  |  💵 **客单价**: {parsed['avg_price']} 元\n"
+    
+    # 财务假设（标准店）
+    financials = financial_forecast(
+        avg_price=parsed['avg_price'],
+        seat_count=parsed['seat_count'],
+        monthly_rent=district_data.get('avg_rent', 200) * STANDARD_STORE_AREA / 10000,
+        initial_investment=parsed['budget'] * 10000,
+        city=city,
+        use_mock=use_mock,
+        **STANDARD_OPEX
+    )
+    yield f"⏳ **预估回本**: {financials['breakeven_month']} 个月  |  📈 **年化ROE**: {financials['roe']:.1f}%\n\n"
+    
+    section = "**🔍 核心优势**:\n"
+    if district_data['office_ratio'] > 0.4:
+        section += "- 白领客群充足，午市刚需\n"
+    if district_data['daily_flow'] > 80000:
+        section += "- 商圈流量大，品牌曝光佳\n"
+    if financials['breakeven_month'] <= 20:
+        section += "- 投资回收快，现金流稳健\n"
+    yield section
+    
+    # 风险评估与综合评分
+    risks, total_risk = risk_assessment(city_data, district_data, financials, brand_config)
+    match_score = int(sum(match_score_components(city_data, district_data, total_risk, parsed['avg_price']).values()))
+    
+    section = f"\n📊 **综合得分**: {match_score}/100  "
+    if match_score >= 80:
+        section += "🌟 强烈推荐\n\n"
+    elif match_score >= 65:
+        section += "👍 建议考虑\n\n"
+    else:
+        section += "⚠️ 谨慎评估\n\n"
+    section += "**⚠️ 风险提示**:\n"
+    if district_data['competitor_count'] > 5:
+        section += "- 竞争激烈，需差异化运营\n"
+    if total_risk > 50:
+        section += "- 综合风险偏高，建议复核\n"
+    if city_data['spicy_acceptance'] < 70:
+        section += "- 本地辣味接受度较低，需调整菜单\n"
+    yield section
+    
+    section = "\n💡 **AI优化建议**:\n"
+    ai_recs = ai_recommendations(city_data, district_data, financials, brand_config)
+    for rec in ai_recs[:3]:  # 只取前3条
+        section += f"- {rec[0]}：{rec[1]}\n"
+    yield section
+
+
+def generate_chat_response(user_input, amap_client, use_mock, city_stats, poi_loader=None, brand_config=None,
+                           analysis_cache=None):
+    """生成完整的选址顾问回复（poi_loader: 城市 -> 本地POI索引；analysis_cache: 跨会话分析缓存）"""
+    return "".join(stream_chat_response(user_input, amap_client, use_mock, city_stats, poi_loader=poi_loader,
+                                        brand_config=brand_config, analysis_cache=analysis_cache))
+
+# ---------- 对话记录持久化（SQLite + 内存有界窗口）----------
+CHAT_STORE_PATH = os.environ.get("CHAT_STORE_PATH", ".chat_history.sqlite")
+CHAT_WINDOW_MESSAGES = int(os.environ.get("CHAT_WINDOW_MESSAGES", "40"))      # 每会话内存保留的最近消息数
+CHAT_SESSION_MAX_KB = float(os.environ.get("CHAT_SESSION_MAX_KB", "256"))    # 每会话内存窗口字节上限
+CHAT_IDLE_TTL = float(os.environ.get("CHAT_IDLE_TTL", "1800"))               # 会话空闲超时（秒），超时释放内存窗口
+CHAT_RETENTION_DAYS = float(os.environ.get("CHAT_RETENTION_DAYS", "30"))     # 磁盘记录保留天数，0表示永久
+
+class ChatStore:
+    """对话记录存储：全部消息写入SQLite，内存中每会话只保留最近的有界窗口
+
+    窗口同时受消息条数与字节数限制，超出部分只留在磁盘上按页读取；
+    空闲超时的会话释放内存窗口，再次访问时从磁盘重建。
+    """
+    def __init__(self, path=CHAT_STORE_PATH, window=CHAT_WINDOW_MESSAGES, max_session_kb=CHAT_SESSION_MAX_KB,
+                 idle_ttl=CHAT_IDLE_TTL, retention_days=CHAT_RETENTION_DAYS):
+        self.path = path
+        self.window = window
+        self.max_session_bytes = int(max_session_kb * 1024)
+        self.idle_ttl = idle_ttl
+        self.evicted_sessions = 0
+        self._sessions = OrderedDict()   # session_id -> {'messages': [...], 'bytes': int, 'count': int, 'last_seen': t}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session ON messages(session_id, id)")
+        if retention_days:
+            self._conn.execute("DELETE FROM messages WHERE created_at < ?", (time.time() - retention_days * 86400,))
+        self._conn.commit()
+
+    @staticmethod
+    def _size(msg):
+        return len(msg['content'].encode('utf-8')) + len(msg['role'])
+
+    def _trim(self, state):
+        """窗口超出条数或字节上限时丢弃最旧的消息（至少保留最新一条）"""
+        messages = state['messages']
+        while len(messages) > 1 and (len(messages) > self.window or state['bytes'] > self.max_session_bytes):
+            state['bytes'] -= self._size(messages.pop(0))
+
+    def _state(self, session_id, now):
+        """取会话内存窗口（调用方持锁）；未驻留时从磁盘加载最近消息"""
+        state = self._sessions.get(session_id)
+        if state is None:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, self.window)
+            ).fetchall()
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            messages = [{'role': r, 'content': c} for r, c in reversed(rows)]
+            state = {'messages': messages, 'bytes': sum(map(self._size, messages)), 'count': count}
+            self._trim(state)
+            self._sessions[session_id] = state
+        state['last_seen'] = now
+        self._sessions.move_to_end(session_id)
+        return state
+
+    def _evict_idle(self, now):
+        """释放空闲超时会话的内存窗口（按最近访问排序，遇到未超时的即停止）"""
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state['last_seen'] <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.evicted_sessions += 1
+
+    def append(self, session_id, role, content):
+        """追加一条消息：先落盘，再进入内存窗口"""
+        now = time.time()
+        msg = {'role': role, 'content': content}
+        with self._lock:
+            self._evict_idle(now)
+            state = self._state(session_id, now)
+            self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, now)
+            )
+            self._conn.commit()
+            state['messages'].append(msg)
+            state['bytes'] += self._size(msg)
+            state['count'] += 1
+            self._trim(state)
+
+    def count(self, session_id):
+        """会话消息总数（含已移出内存窗口的）"""
+        with self._lock:
+            return self._state(session_id, time.time())['count']
+
+    def page(self, session_id, page=1, page_size=20):
+        """按页读取消息，第1页为最新一页，页内按时间正序；内存窗口能覆盖时不访问磁盘"""
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            state = self._state(session_id, now)
+            start = (page - 1) * page_size
+            messages = state['messages']
+            if start + page_size <= len(messages) or len(messages) == state['count']:
+                end = len(messages) - start
+                return [dict(m) for m in messages[max(0, end - page_size):max(0, end)]]
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (session_id, page_size, start)
+            ).fetchall()
+        return [{'role': r, 'content': c} for r, c in reversed(rows)]
+
+    def clear(self, session_id):
+        """删除会话的全部消息"""
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        """内存驻留会话数、窗口总字节与磁盘消息数"""
+        with self._lock:
+            self._evict_idle(time.time())
+            total = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            return {
+                'sessions': len(self._sessions),
+                'memory_bytes': sum(s['bytes'] for s in self._sessions.values()),
+                'stored_messages': total,
+                'evicted_sessions': self.evicted_sessions
+            }
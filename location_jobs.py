@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+湘菜品牌智能选址 - 后台扫描任务队列
+    全城商圈扫描、批量候选评分等长任务交给独立的执行进程（python location_jobs.py <任务ID>），
+    执行进程用本地进程池分块评分，不阻塞Streamlit脚本重跑；多个任务经文件锁排队依次执行。
+    每完成一块即落盘（进度 job.json + 分块结果），浏览器断开、会话结束甚至服务重启都不影响执行；
+    任意会话或命令行都可按任务ID轮询进度、查看阶段性排名与最终结果，中断的任务可续跑未完成的块。
+
+目录结构（LOCATION_JOBS_DIR，默认 .jobs/）：
+    <job_id>/job.json          任务元数据与进度
+    <job_id>/candidates.*      候选清单（续跑时按相同方式分块）
+    <job_id>/parts/NNNNN.*     已完成分块的评分结果
+    <job_id>/result.*          全部完成后合并排名的结果
+    <job_id>/runner.log        执行进程日志
+结果优先写 Parquet（需 pyarrow），否则写 CSV。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import fcntl  # 任务排队用的文件锁（仅POSIX；其他平台任务不排队，直接并行执行）
+except ImportError:
+    fcntl = None
+
+from gazetteer import get_gazetteer
+from location_core import (
+    AMAP_QPS, AMAP_DAILY_QUOTA, DEFAULT_BRAND_CONFIG,
+    input_hash, _init_score_worker, _score_chunk, _score_worker,
+)
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.environ.get("LOCATION_JOBS_DIR", ".jobs")
+JOB_WORKERS = int(os.environ.get("LOCATION_JOB_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+JOB_CHUNK_SIZE = 200
+ACTIVE_STATES = ('queued', 'running')
+
+
+# ---------- 结果文件读写（Parquet优先，缺少pyarrow时回退CSV）----------
+def _write_frame(df, base):
+    """写出DataFrame，返回实际文件路径；先写临时文件再改名，读取方不会看到半个文件"""
+    try:
+        import pyarrow  # noqa: F401
+        path, tmp = base + '.parquet', base + '.parquet.tmp'
+        df.to_parquet(tmp, index=False)
+    except ImportError:
+        path, tmp = base + '.csv', base + '.csv.tmp'
+        df.to_csv(tmp, index=False, encoding='utf-8-sig')
+    os.replace(tmp, path)
+    return path
+
+def _read_frame(base):
+    """按 _write_frame 的约定读取，文件不存在时返回None"""
+    import pandas as pd
+    if os.path.exists(base + '.parquet'):
+        return pd.read_parquet(base + '.parquet')
+    if os.path.exists(base + '.csv'):
+        return pd.read_csv(base + '.csv')
+    return None
+
+def _frame_exists(base):
+    return os.path.exists(base + '.parquet') or os.path.exists(base + '.csv')
+
+def _rank(parts):
+    """合并分块结果并按综合得分稳定排序（与 score_candidates_parallel 的排名一致）"""
+    import numpy as np
+    import pandas as pd
+    result = pd.concat(parts, ignore_index=True).drop(columns='rank')
+    result = result.sort_values('match_score', ascending=False, kind='stable').reset_index(drop=True)
+    result.insert(0, 'rank', np.arange(1, len(result) + 1))
+    return result
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ---------- 扫描候选生成 ----------
+def scan_cities(gazetteer=None):
+    """地名词典中收录了商圈的城市（按词典顺序）"""
+    gaz = gazetteer if gazetteer is not None else get_gazetteer()
+    return list(dict.fromkeys(owner for kind, _, owner in gaz.entries if kind == 'district' and owner))
+
+def city_scan_candidates(city, price_points=None, gazetteer=None):
+    """全城扫描候选：地名词典中该城市的全部商圈 × 客单价档位（默认只用品牌客单价）"""
+    import pandas as pd
+    gaz = gazetteer if gazetteer is not None else get_gazetteer()
+    districts = [name for kind, name, owner in gaz.entries if kind == 'district' and owner == city]
+    prices = list(price_points or [DEFAULT_BRAND_CONFIG['avg_price']])
+    return pd.DataFrame([(city, d, p) for d in districts for p in prices],
+                        columns=['city', 'district', 'avg_price'])
+
+
+# ---------- 工作进程 ----------
+def _run_job_chunk(context, chunk):
+    """工作进程执行一块评分；评分上下文（品牌参数、Key）变化时才重建客户端"""
+    key = input_hash(context)
+    if _score_worker.get('context_key') != key:
+        _score_worker.clear()
+        _init_score_worker(*context)
+        _score_worker['context_key'] = key
+    return _score_chunk(chunk)
+
+
+# ---------- 任务队列 ----------
+class JobCancelled(Exception):
+    """执行进程收到取消信号"""
+
+class JobQueue:
+    """本地持久化任务队列：任务目录即队列状态，执行进程负责分块评分并落盘进度与结果"""
+    def __init__(self, root=JOBS_DIR, workers=JOB_WORKERS, chunk_size=JOB_CHUNK_SIZE):
+        self.root = root
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        os.makedirs(root, exist_ok=True)
+        self._procs = {}   # 本进程启动的执行进程 pid -> Popen（用于回收，避免僵尸进程被误判为存活）
+
+    def _dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def _save(self, meta):
+        path = os.path.join(self._dir(meta['id']), 'job.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def _load(self, job_id):
+        try:
+            with open(os.path.join(self._dir(job_id), 'job.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _alive(self, pid):
+        proc = self._procs.get(pid)
+        if proc is not None:
+            return proc.poll() is None
+        return _pid_alive(pid)
+
+    def create(self, candidates, brand_config=None, amap_key=None, use_local_poi=False, name=None):
+        """登记任务（写入候选清单与元数据），返回任务ID；尚未开始执行"""
+        job_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        os.makedirs(os.path.join(self._dir(job_id), 'parts'))
+        _write_frame(candidates.reset_index(drop=True), os.path.join(self._dir(job_id), 'candidates'))
+        self._save({
+            'id': job_id,
+            'name': name or f"{len(candidates)} 个候选",
+            'status': 'queued',
+            'rows': len(candidates),
+            'total_chunks': -(-len(candidates) // self.chunk_size),
+            'done_chunks': 0,
+            'chunk_size': self.chunk_size,
+            'brand_config': dict(brand_config or DEFAULT_BRAND_CONFIG),
+            'mode': 'real' if amap_key else 'mock',   # Key 不落盘，续跑真实模式任务时需重新提供
+            'use_local_poi': use_local_poi,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+            'pid': None,
+        })
+        return job_id
+
+    def start(self, job_id, amap_key=None):
+        """启动独立执行进程（新会话，不随提交方退出）；Key 经环境变量传递，不出现在命令行"""
+        meta = self._load(job_id)
+        if meta['mode'] == 'real' and not amap_key:
+            raise ValueError("真实数据模式任务需要提供高德API Key")
+        meta.update(status='queued', pid=None, error=None, finished_at=None)
+        self._save(meta)
+        # 执行进程沿用提交方的工作目录，缓存、POI索引、年鉴等相对路径与提交方一致
+        env = dict(os.environ, LOCATION_JOBS_DIR=os.path.abspath(self.root))
+        env.pop('AMAP_KEY', None)
+        if amap_key:
+            env['AMAP_KEY'] = amap_key
+        with open(os.path.join(self._dir(job_id), 'runner.log'), 'ab') as log:
+            proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), job_id,
+                 '--workers', str(self.workers), '--chunk-size', str(self.chunk_size)],
+                stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, env=env,
+                start_new_session=True)
+        self._procs[proc.pid] = proc
+        # 执行进程启动后会自行登记pid；若尚未登记则代为写入，避免刚提交的任务被判为中断
+        meta = self._load(job_id)
+        if meta['pid'] is None:
+            meta['pid'] = proc.pid
+            self._save(meta)
+        return job_id
+
+    def submit(self, candidates, brand_config=None, amap_key=None, use_local_poi=False, name=None):
+        """提交扫描任务并立即返回任务ID，由后台执行进程排队执行"""
+        job_id = self.create(candidates, brand_config, amap_key, use_local_poi, name)
+        return self.start(job_id, amap_key)
+
+    def resume(self, job_id, amap_key=None):
+        """后台续跑中断、取消或失败的任务：已落盘的分块直接复用"""
+        meta = self.status(job_id)
+        if meta is None:
+            raise KeyError(job_id)
+        if meta['status'] in ACTIVE_STATES or meta['status'] == 'done':
+            return job_id
+        return self.start(job_id, amap_key)
+
+    def run(self, job_id, amap_key=None, on_progress=None):
+        """在当前进程执行任务（排队等待前一个任务结束），返回最终状态；
+        Ctrl+C 中断时状态为 interrupted，收到 SIGTERM（取消）时为 cancelled，均可续跑"""
+        meta = self._load(job_id)
+        if meta is None:
+            raise KeyError(job_id)
+        if meta['status'] in ACTIVE_STATES and meta['pid'] not in (None, os.getpid()) and self._alive(meta['pid']):
+            raise ValueError(f"任务已在进程 {meta['pid']} 中执行")
+        if meta['mode'] == 'real' and not amap_key:
+            raise ValueError("真实数据模式任务需要提供高德API Key")
+        meta.pop('progress', None)
+        meta.update(status='queued', pid=os.getpid(), error=None, finished_at=None)
+        self._save(meta)
+        job_dir = self._dir(job_id)
+        parts_dir = os.path.join(job_dir, 'parts')
+        pool = None
+        try:
+            with open(os.path.join(self.root, '.runner.lock'), 'w') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)  # 同一时间只执行一个任务，其余排队
+                candidates = _read_frame(os.path.join(job_dir, 'candidates'))
+                size = meta['chunk_size']
+                pending = [i for i in range(meta['total_chunks'])
+                           if not _frame_exists(os.path.join(parts_dir, f"{i:05d}"))]
+                meta.update(status='running', started_at=meta['started_at'] or time.time(),
+                            done_chunks=meta['total_chunks'] - len(pending))
+                self._save(meta)
+                if on_progress:
+                    on_progress(meta)
+                # 任务内各工作进程均分Key的QPS与日配额
+                workers = min(self.workers, max(1, len(pending)))
+                context = (meta['brand_config'], amap_key, AMAP_QPS / workers,
+                           AMAP_DAILY_QUOTA // workers if AMAP_DAILY_QUOTA else 0, meta['use_local_poi'])
+                pool = ProcessPoolExecutor(max_workers=workers)
+                futures = {pool.submit(_run_job_chunk, context, candidates.iloc[i * size:(i + 1) * size]): i
+                           for i in pending}
+                for future in as_completed(futures):
+                    _write_frame(future.result(), os.path.join(parts_dir, f"{futures[future]:05d}"))
+                    meta['done_chunks'] += 1
+                    self._save(meta)
+                    if on_progress:
+                        on_progress(meta)
+                parts = [_read_frame(os.path.join(parts_dir, f"{i:05d}")) for i in range(meta['total_chunks'])]
+                if parts:
+                    _write_frame(_rank(parts), os.path.join(job_dir, 'result'))
+                meta.update(status='done')
+        except JobCancelled:
+            meta.update(status='cancelled')
+        except KeyboardInterrupt:
+            meta.update(status='interrupted')
+        except Exception as e:
+            logger.exception("扫描任务 %s 执行失败", job_id)
+            meta.update(status='failed', error=str(e))
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=meta['status'] == 'done', cancel_futures=True)
+            meta.update(finished_at=time.time())
+            self._save(meta)
+        return meta['status']
+
+    def cancel(self, job_id):
+        """取消排队或运行中的任务（向执行进程发送SIGTERM；已完成的块保留，可续跑）"""
+        meta = self._load(job_id)
+        if meta is None or meta['status'] not in ACTIVE_STATES or not self._alive(meta['pid']):
+            return False
+        os.kill(meta['pid'], signal.SIGTERM)
+        return True
+
+    def status(self, job_id):
+        """读取任务进度；执行进程已退出但未完成的任务标记为 interrupted"""
+        meta = self._load(job_id)
+        if meta is None:
+            return None
+        if meta['status'] in ACTIVE_STATES and not self._alive(meta['pid']):
+            meta['status'] = 'interrupted'
+        meta['progress'] = meta['done_chunks'] / meta['total_chunks'] if meta['total_chunks'] else 1.0
+        return meta
+
+    def list_jobs(self, limit=20):
+        """按提交时间倒序列出任务"""
+        ids = sorted((d for d in os.listdir(self.root) if os.path.isdir(self._dir(d))), reverse=True)
+        jobs = (self.status(job_id) for job_id in ids)
+        return [meta for meta in jobs if meta is not None][:limit]
+
+    def result(self, job_id, partial=False):
+        """最终排名结果；partial=True 时合并已完成的块给出阶段性排名（尚无结果返回None）"""
+        job_dir = self._dir(job_id)
+        final = _read_frame(os.path.join(job_dir, 'result'))
+        if final is not None or not partial:
+            return final
+        parts_dir = os.path.join(job_dir, 'parts')
+        if not os.path.isdir(parts_dir):
+            return None
+        names = sorted({os.path.splitext(n)[0] for n in os.listdir(parts_dir) if not n.endswith('.tmp')})
+        parts = [_read_frame(os.path.join(parts_dir, n)) for n in names]
+        return _rank(parts) if parts else None
+
+    def delete(self, job_id):
+        """删除已结束任务的全部文件"""
+        meta = self.status(job_id)
+        if meta is not None and meta['status'] in ACTIVE_STATES:
+            raise RuntimeError("任务运行中，请先取消")
+        shutil.rmtree(self._dir(job_id), ignore_errors=True)
+
+
+# ---------- 执行进程入口 ----------
+def _raise_cancelled(signum, frame):
+    raise JobCancelled()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="执行（或续跑）一个后台扫描任务")
+    parser.add_argument("job_id")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=JOB_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGTERM, _raise_cancelled)
+    queue = JobQueue(workers=args.workers, chunk_size=args.chunk_size)
+    status = queue.run(args.job_id, amap_key=os.environ.get("AMAP_KEY"))
+    logger.info("任务 %s 结束：%s", args.job_id, status)
+    return 0 if status == 'done' else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+冷启动性能剖析：导入耗时排行 + 首次渲染耗时
+
+用法：
+    python profile_startup.py                 # 默认5次冷启动取中位数
+    python profile_startup.py --runs 10 --target-ms 1500
+
+每次测量都在全新的Python进程中执行，模拟自动扩缩容时的容器冷启动：
+    1. 导入 streamlit（服务端启动成本，与应用代码无关）
+    2. 首次执行 streamlit_app.py 直到脚本跑完（即首屏全部元素已发送）
+首次渲染中位数超过 --target-ms 时以非零状态退出，可接入CI。
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+
+TIMING_SNIPPET = """
+import time, logging
+t0 = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+logging.disable(logging.WARNING)
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+t2 = time.perf_counter()
+assert not at.exception, [e.value for e in at.exception]
+print(f"{{(t1 - t0) * 1000:.1f}} {{(t2 - t1) * 1000:.1f}}")
+"""
+
+IMPORTTIME_SNIPPET = """
+import streamlit
+from streamlit.testing.v1 import AppTest
+import logging
+logging.disable(logging.WARNING)
+print("--app--", file=__import__('sys').stderr)
+AppTest.from_file({app!r}, default_timeout=120).run()
+"""
+
+
+def run_python(code, *flags):
+    """在全新进程中执行代码片段，返回 (stdout, stderr)"""
+    proc = subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True,
+                          cwd=os.path.dirname(APP))
+    if proc.returncode != 0:
+        sys.exit(f"子进程执行失败：\n{proc.stderr[-2000:]}")
+    return proc.stdout, proc.stderr
+
+
+def import_profile(top=15):
+    """应用首次运行期间新增导入的模块，按累计耗时排序（只统计顶层导入）"""
+    _, stderr = run_python(IMPORTTIME_SNIPPET.format(app=APP), "-X", "importtime")
+    app_part = stderr.split("--app--", 1)[1]
+    rows = []
+    for line in app_part.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if m and len(m.group(3)) == 1:  # 缩进为1的是顶层导入
+            rows.append((int(m.group(2)) / 1000, m.group(4)))
+    rows.sort(reverse=True)
+    return rows[:top], sum(ms for ms, _ in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="streamlit_app.py 冷启动剖析")
+    parser.add_argument("--runs", type=int, default=5, help="冷启动测量次数")
+    parser.add_argument("--target-ms", type=float, default=None,
+                        help="首次渲染耗时目标（毫秒），中位数超出时返回非零状态")
+    args = parser.parse_args(argv)
+
+    rows, total = import_profile()
+    print(f"应用首次运行新增导入：合计 {total:.0f} ms")
+    for ms, module in rows:
+        print(f"  {ms:8.1f} ms  {module}")
+
+    server, render = [], []
+    for _ in range(args.runs):
+        out, _ = run_python(TIMING_SNIPPET.format(app=APP))
+        s, r = map(float, out.split())
+        server.append(s)
+        render.append(r)
+    print(f"\n冷启动 {args.runs} 次（中位数 / 最大）：")
+    print(f"  导入streamlit：{statistics.median(server):8.1f} / {max(server):.1f} ms")
+    print(f"  首次渲染：    {statistics.median(render):8.1f} / {max(render):.1f} ms")
+    if args.target_ms is not None:
+        ok = statistics.median(render) <= args.target_ms
+        print(f"  目标 {args.target_ms:.0f} ms：{'达标' if ok else '未达标'}")
+        return 0 if ok else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,17 +25,20 @@ st.write(
 """
 
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-import requests
-import json
-import re
+import uuid
 from datetime import datetime
-import time
-import hashlib
+
+# pandas、plotly 在绘图/建表的函数内按需导入，缩短容器冷启动的首屏时间（见 profile_startup.py）
+import location_core
+from location_core import (
+    AMAP_CACHE_PATH, POI_INDEX_DIR, DEFAULT_BRAND_CONFIG, CITY_STATS,
+    AMapCache, AMapClientRegistry, AnalysisCache, ChatStore, DistrictPrefetcher, likely_districts,
+    analyze_city,
+    monte_carlo_forecast,
+    SENSITIVITY_PARAMS, SensitivityMemo, sensitivity_values, sensitivity_grid, tornado_analysis,
+    stream_chat_response, build_analysis_graph,
+)
+from location_jobs import JobQueue, city_scan_candidates, scan_cities
 
 # ---------- 页面配置（必须放在最前）----------
 st.set_page_config(
@@ -105,262 +108,192 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+# ---------- 静态宏观经济数据库（模拟统计年鉴）----------
+@st.cache_resource
+def load_city_stats():
+    """进程级共享的统计年鉴数据仓（文件内存映射，文件更新后自动热加载）"""
+    return location_core.load_city_stats()
 
-# ---------- 高德地图API封装（真实数据源）----------
-class AMapService:
-    """高德地图开放平台API封装"""
-    def __init__(self, api_key):
-        self.key = api_key
-        self.base_url = "https://restapi.amap.com/v3"
-        self.session = requests.Session()
-    
-    def search_poi(self, keyword, city, offset=20, page=1):
-        """POI关键词搜索"""
-        url = f"{self.base_url}/place/text"
-        params = {
-            "keywords": keyword,
-            "city": city,
-            "offset": offset,
-            "page": page,
-            "extensions": "all",
-            "output": "JSON",
-            "key": self.key
-        }
-        try:
-            resp = self.session.get(url, params=params, timeout=10)
-            data = resp.json()
-            if data["status"] == "1":
-                return data
-        except Exception as e:
-            st.error(f"高德POI搜索失败: {e}")
-        return None
-    
-    def search_around(self, location, keywords, radius=1000):
-        """周边搜索"""
-        url = f"{self.base_url}/place/around"
-        params = {
-            "location": location,
-            "keywords": keywords,
-            "radius": radius,
-            "output": "JSON",
-            "key": self.key
-        }
-        try:
-            resp = self.session.get(url, params=params, timeout=10)
-            return resp.json()
-        except:
-            return None
-    
-    def geocode(self, address, city):
-        """地理编码：地址转经纬度"""
-        url = f"{self.base_url}/geocode/geo"
-        params = {
-            "address": address,
-            "city": city,
-            "output": "JSON",
-            "key": self.key
-        }
-        try:
-            resp = self.session.get(url, params=params, timeout=10)
-            data = resp.json()
-            if data["status"] == "1" and data["geocodes"]:
-                return data["geocodes"][0]["location"]
-        except:
-            return None
-    
-    def district(self, keywords):
-        """行政区划查询"""
-        url = f"{self.base_url}/config/district"
-        params = {
-            "keywords": keywords,
-            "subdistrict": 0,
-            "output": "JSON",
-            "key": self.key
-        }
-        try:
-            resp = self.session.get(url, params=params, timeout=10)
-            data = resp.json()
-            if data["status"] == "1" and data["districts"]:
-                return data["districts"][0]
-        except:
-            return None
-        return None
+@st.cache_resource
+def get_amap_cache():
+    """进程级共享的高德响应缓存（跨会话、跨重跑复用）"""
+    return AMapCache(AMAP_CACHE_PATH)
 
-# ---------- 模拟数据生成器（无API Key时使用）----------
-def generate_mock_city_data(city_name):
-    """模拟城市宏观数据"""
-    mock_db = {
-        '苏州': {
-            'population': 1280, 'gdp_growth': 6.8, 'disposable_income': 75000,
-            'rental_index': 85, 'spicy_acceptance': 65, 'dining_frequency': 8.5,
-            'competition_index': 62, 'logistics_score': 88, 'policy_score': 85,
-            'growth_potential': 92
-        },
-        '郑州': {
-            'population': 1260, 'gdp_growth': 7.2, 'disposable_income': 42000,
-            'rental_index': 72, 'spicy_acceptance': 85, 'dining_frequency': 7.8,
-            'competition_index': 68, 'logistics_score': 92, 'policy_score': 78,
-            'growth_potential': 88
-        },
-        '杭州': {
-            'population': 1220, 'gdp_growth': 7.0, 'disposable_income': 70000,
-            'rental_index': 88, 'spicy_acceptance': 60, 'dining_frequency': 8.2,
-            'competition_index': 70, 'logistics_score': 90, 'policy_score': 86,
-            'growth_potential': 90
-        },
-        '南京': {
-            'population': 930, 'gdp_growth': 6.5, 'disposable_income': 68000,
-            'rental_index': 80, 'spicy_acceptance': 55, 'dining_frequency': 7.5,
-            'competition_index': 65, 'logistics_score': 85, 'policy_score': 82,
-            'growth_potential': 84
-        }
-    }
-    return mock_db.get(city_name, mock_db['苏州'])
+@st.cache_resource
+def get_local_poi_backend(city):
+    """加载城市的本地POI索引（无导出文件时返回None）"""
+    return location_core.load_local_poi_backend(city)
 
-def generate_mock_district_data(city, district_name):
-    """模拟商圈微观数据"""
-    mock_db = {
-        ('苏州', '工业园区湖东'): {
-            'daily_flow': 85000, 'weekend_multiplier': 1.8, 'office_ratio': 0.45,
-            'family_ratio': 0.35, 'youth_ratio': 0.55, 'avg_rent': 220,
-            'competitor_count': 3, 'visibility_score': 88, 'accessibility_score': 92,
-            'neighbor_quality': 85, 'parking_score': 78
-        },
-        ('苏州', '姑苏区观前街'): {
-            'daily_flow': 150000, 'weekend_multiplier': 2.2, 'office_ratio': 0.15,
-            'family_ratio': 0.25, 'youth_ratio': 0.40, 'avg_rent': 320,
-            'competitor_count': 7, 'visibility_score': 95, 'accessibility_score': 88,
-            'neighbor_quality': 82, 'parking_score': 65
-        },
-        ('郑州', '金水区花园路'): {
-            'daily_flow': 95000, 'weekend_multiplier': 1.6, 'office_ratio': 0.35,
-            'family_ratio': 0.45, 'youth_ratio': 0.50, 'avg_rent': 180,
-            'competitor_count': 5, 'visibility_score': 85, 'accessibility_score': 90,
-            'neighbor_quality': 80, 'parking_score': 82
-        }
-    }
-    key = (city, district_name)
-    if key in mock_db:
-        return mock_db[key]
-    else:
-        # 返回一个默认值
-        return {
-            'daily_flow': 70000, 'weekend_multiplier': 1.7, 'office_ratio': 0.3,
-            'family_ratio': 0.3, 'youth_ratio': 0.4, 'avg_rent': 200,
-            'competitor_count': 4, 'visibility_score': 75, 'accessibility_score': 75,
-            'neighbor_quality': 70, 'parking_score': 70
-        }
+@st.cache_resource
+def get_amap_registry():
+    """进程级共享的高德客户端注册表（连接在重跑与会话之间复用）"""
+    return AMapClientRegistry(cache=get_amap_cache())
 
-# ---------- 真实数据获取函数（使用高德API）----------
-def get_city_data_real(amap, city_name, stats_df):
-    """从高德+统计局数据库获取真实城市数据"""
-    # 1. 获取行政区信息（人口、面积）
-    district_info = amap.district(city_name)
-    population = 0
-    if district_info:
-        try:
-            population = int(district_info.get('population', '0'))
-        except:
-            population = 0
-    
-    # 2. 从统计数据库读取（CSV或DataFrame）
-    city_row = stats_df[stats_df['city'] == city_name]
-    if not city_row.empty:
-        disposable_income = city_row.iloc[0].get('disposable_income', 60000)
-        gdp_growth = city_row.iloc[0].get('gdp_growth', 6.5)
-    else:
-        disposable_income = 60000
-        gdp_growth = 6.5
-    
-    # 3. 湘菜接受度（可根据口味大数据，这里用经验值）
-    spicy_dict = {'郑州': 85, '苏州': 65, '杭州': 60, '南京': 55, '武汉': 88, '长沙': 95}
-    spicy_acceptance = spicy_dict.get(city_name, 70)
-    
-    # 4. 返回标准格式
+@st.cache_resource
+def get_analysis_cache():
+    """进程级共享的城市/商圈分析结果缓存（热门商圈在会话之间复用）"""
+    return AnalysisCache()
+
+@st.cache_resource
+def get_district_prefetcher():
+    """进程级共享的商圈预取器（小线程池，预热分析缓存）"""
+    return DistrictPrefetcher(get_analysis_cache())
+
+def prefetch_districts(city, amap_client, use_mock, use_local_poi, first=None):
+    """后台预热该城市可能查看的商圈分析（first 为当前输入的商圈，优先预取）；强制刷新时不预取"""
+    if analysis_cache is None:
+        return
+    get_district_prefetcher().prefetch(
+        st.session_state.prefetch_scope, city, [first] + likely_districts(city),
+        amap_client, use_mock,
+        poi_backend=get_local_poi_backend(city) if use_local_poi else None,
+        competitor=st.session_state.brand_config['main_competitor']
+    )
+
+@st.cache_resource
+def get_job_queue():
+    """进程级共享的后台扫描任务队列（任务不随会话结束或浏览器断开而中止）"""
+    return JobQueue()
+
+@st.cache_resource
+def get_chat_store():
+    """进程级共享的对话记录存储（SQLite持久化，内存只保留各会话最近窗口）"""
+    return ChatStore()
+
+def analysis_context(amap_client, city_stats, use_local_poi):
+    """依赖图求值所需的资源（不参与节点哈希）"""
+    return {'amap_client': amap_client, 'city_stats': city_stats,
+            'poi_loader': get_local_poi_backend if use_local_poi else None,
+            'analysis_cache': analysis_cache}
+
+def data_inputs(amap_client, city_stats, use_mock):
+    """依赖图中与数据源相关的输入：年鉴版本、是否强制刷新"""
     return {
-        'population': population if population > 0 else 1000,  # 若获取失败，给个默认值
-        'gdp_growth': gdp_growth,
-        'disposable_income': disposable_income,
-        'rental_index': 80,  # 需其他数据源
-        'spicy_acceptance': spicy_acceptance,
-        'dining_frequency': 8.0,
-        'competition_index': 65,
-        'logistics_score': 80,
-        'policy_score': 80,
-        'growth_potential': 85
+        'data_version': city_stats.version if city_stats is not None and not use_mock else None,
+        'bypass_cache': bool(amap_client is not None and not use_mock and amap_client.bypass_cache),
     }
 
-def get_district_data_real(amap, city, district_name):
-    """从高德API获取真实商圈数据"""
-    # 1. 地理编码得到中心点
-    location = amap.geocode(f"{district_name},{city}", city)
-    if not location:
-        return generate_mock_district_data(city, district_name)
-    
-    # 2. 搜索竞品（大米先生）
-    competitor_data = amap.search_poi("大米先生", city)
-    competitor_count = 0
-    if competitor_data and competitor_data['status'] == '1':
-        competitor_count = int(competitor_data['count'])
-    
-    # 3. 搜索周边设施
-    bus = amap.search_around(location, "公交车站", 500)
-    subway = amap.search_around(location, "地铁站", 800)
-    office = amap.search_around(location, "写字楼", 1000)
-    residence = amap.search_around(location, "住宅小区", 1000)
-    
-    bus_cnt = len(bus.get('pois', [])) if bus else 0
-    subway_cnt = len(subway.get('pois', [])) if subway else 0
-    office_cnt = len(office.get('pois', [])) if office else 0
-    
-    # 4. 估算人流（简易模型）
-    daily_flow = 30000 + office_cnt * 500 + subway_cnt * 2000
-    
+def analysis_inputs(use_mock, amap_client=None, city_stats=None):
+    """依赖图输入：取自最近一次商圈分析与财务预测时的参数"""
+    brand = st.session_state.brand_config
     return {
-        'daily_flow': daily_flow,
-        'weekend_multiplier': 1.8,
-        'office_ratio': min(0.6, office_cnt / 100) if office_cnt else 0.3,
-        'family_ratio': 0.3,
-        'youth_ratio': 0.4,
-        'avg_rent': 200,  # 需租金API
-        'competitor_count': competitor_count,
-        'visibility_score': 75,
-        'accessibility_score': 85 if (bus_cnt+subway_cnt) > 10 else 70,
-        'neighbor_quality': 70,
-        'parking_score': 70
+        'city_name': st.session_state.get('city_name', '苏州'),
+        'district_name': st.session_state.get('district_name', ''),
+        'use_mock': use_mock,
+        'competitor': brand['main_competitor'],
+        'fin_params': st.session_state.get('fin_params'),
+        'brand_config': brand,
+        **data_inputs(amap_client, city_stats, use_mock),
     }
 
-# ---------- 静态宏观经济数据库（模拟统计年鉴）----------
-@st.cache_data
-def load_city_stats():
-    """城市统计年鉴数据（可定期更新）"""
-    data = {
-        'city': ['苏州', '郑州', '杭州', '南京', '武汉', '长沙', '成都', '西安'],
-        'disposable_income': [75000, 42000, 70000, 68000, 55000, 60000, 50000, 45000],
-        'gdp_growth': [6.8, 7.2, 7.0, 6.5, 7.5, 7.8, 7.3, 6.9],
-        'population': [1280, 1260, 1220, 930, 1120, 1000, 1650, 1200],
-        'retail_total': [9500, 5200, 7800, 7200, 6800, 5500, 8200, 5900]  # 亿
-    }
-    return pd.DataFrame(data)
+# ---------- 图表构建（按输入缓存，图对象只读复用）----------
+@st.cache_resource(max_entries=64)
+def city_radar_figure(city, values):
+    """城市六维评估雷达图"""
+    import plotly.graph_objects as go
+    categories = ['消费能力', '辣味接受', '竞争环境', '政策支持', '物流', '增长潜力']
+    fig = go.Figure(data=go.Scatterpolar(
+        r=list(values),
+        theta=categories,
+        fill='toself',
+        marker=dict(color='#e74c3c')
+    ))
+    fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
+        height=400,
+        title=f"{city} 城市六维评估"
+    )
+    return fig
+
+@st.cache_resource(max_entries=64)
+def season_figure(city):
+    """月度客流系数折线图"""
+    import plotly.graph_objects as go
+    months = ['1月','2月','3月','4月','5月','6月','7月','8月','9月','10月','11月','12月']
+    if city == '苏州':
+        season = [0.85,0.65,0.90,0.95,1.0,0.95,0.88,0.92,0.98,1.05,1.02,0.95]
+    elif city == '郑州':
+        season = [0.70,0.65,0.85,0.95,1.0,0.98,0.95,0.92,0.96,1.02,0.90,0.75]
+    else:
+        season = [0.85]*12
+    fig = go.Figure(go.Scatter(x=months, y=season, mode='lines+markers'))
+    fig.add_hline(y=1.0, line_dash="dash", line_color="green")
+    fig.update_layout(height=300, title=f"{city} 月度客流系数",
+                      xaxis_title='月份', yaxis_title='客流系数')
+    return fig
+
+@st.cache_resource(max_entries=64)
+def customer_pie_figure(sizes):
+    """商圈客群结构环形图"""
+    import plotly.graph_objects as go
+    from plotly.colors import qualitative
+    fig = go.Figure(go.Pie(values=list(sizes), labels=['白领', '家庭', '年轻群体', '其他'], hole=0.4,
+                           marker=dict(colors=qualitative.Set2)))
+    fig.update_layout(height=300)
+    return fig
+
+@st.cache_resource(max_entries=64)
+def score_radar_figure(labels, values, color, title=None):
+    """通用评分雷达图（微观位置、风险矩阵）"""
+    import plotly.graph_objects as go
+    fig = go.Figure(data=go.Scatterpolar(
+        r=list(values),
+        theta=list(labels),
+        fill='toself',
+        marker=dict(color=color)
+    ))
+    fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
+        height=400,
+        title=title
+    )
+    return fig
+
+def rerun_fragment():
+    """只重跑当前片段；片段随整页运行时不允许片段级重跑，改为整页重跑"""
+    from streamlit.errors import StreamlitAPIException
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
 # ---------- 品牌参数全局存储 ----------
 if 'brand_config' not in st.session_state:
-    st.session_state.brand_config = {
-        'brand_name': '湘味小炒',
-        'store_count': 120,
-        'avg_price': 49,
-        'seat_count': 120,
-        'target_groups': ['年轻白领', '家庭聚餐', '朋友聚会'],
-        'main_competitor': '大米先生',
-        'budget_min': 150,
-        'budget_max': 200,
-        'roi_target': 18,
-        'expansion_strategy': '谨慎测试(先开1-2家)'
-    }
+    st.session_state.brand_config = dict(DEFAULT_BRAND_CONFIG)
+
+# ---------- 分析依赖图（会话级，按输入哈希增量重算）----------
+if 'analysis_graph' not in st.session_state:
+    st.session_state['analysis_graph'] = build_analysis_graph()
+analysis_graph = st.session_state['analysis_graph']
+analysis_graph.begin_run()
+
+# ---------- 商圈预取作用域（切换城市时只取消本会话的旧预取）----------
+if 'prefetch_scope' not in st.session_state:
+    st.session_state.prefetch_scope = uuid.uuid4().hex
 
 # ---------- 对话历史存储 ----------
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+# 会话只保存对话ID，消息存于共享的ChatStore；ID写入URL，刷新页面后可接续原对话
+if 'chat_session_id' not in st.session_state:
+    st.session_state.chat_session_id = st.query_params.get('chat') or uuid.uuid4().hex
+    st.query_params['chat'] = st.session_state.chat_session_id
+chat_store = get_chat_store()
+CHAT_PAGE_SIZE = 20
+
+# ---------- 标签页控件状态 ----------
+# 标签页惰性渲染时未选中标签的控件不会执行，Streamlit会丢弃其状态；
+# 默认值统一在此登记，每轮回写一次，切换标签后保留用户输入
+TAB_WIDGET_DEFAULTS = {
+    'city_tab1': '苏州', 'depth': '快速',
+    'city_t2': '苏州', 'district_t2': '工业园区湖东',
+    'area': 300, 'turnover': 2.8, 'rent': 12.0, 'labor': 15.0,
+    'food': 32, 'util': 8, 'mkt': 5, 'city_fin': '苏州', 'invest': 180,
+    'mc_samples': 100_000, 'mc_turnover': (25, 15), 'mc_rent': 10, 'mc_food': 8, 'mc_season': 30,
+    'sens_x': 'monthly_rent', 'sens_y': 'table_turnover', 'sens_range': 30, 'sens_step': 5,
+    'tornado_swing': 20,
+    'scan_source': '全城商圈扫描', 'scan_city': '苏州', 'scan_prices': [49],
+}
+for _key, _default in TAB_WIDGET_DEFAULTS.items():
+    st.session_state[_key] = st.session_state.get(_key, _default)
 
 # ---------- 侧边栏：全局配置 ----------
 with st.sidebar:
@@ -427,297 +360,114 @@ with st.sidebar:
     st.subheader("🗺️ 数据源设置")
     amap_key = st.text_input("高德地图API Key (留空则使用模拟数据)", 
                              type="password", 
-                             help="申请地址：https://lbs.amap.com/")
+                             help="申请地址：https://lbs.amap.com/ ；多个Key以逗号分隔，按余量自动分配并在配额耗尽时切换")
     
     if amap_key:
         st.success("✅ 已启用【真实数据模式】")
-        amap_client = AMapService(amap_key)
+        amap_registry = get_amap_registry()
+        bypass_cache = st.checkbox("跳过本地缓存（强制刷新）", value=False,
+                                   help="勾选后直接请求高德接口，并用最新结果覆盖缓存")
+        amap_client = amap_registry.get(amap_key).with_options(bypass_cache=bypass_cache)
+        api_stats_slot = st.container()  # 接口缓存/连接池/限流统计，由 render_sidebar_stats 填充
+        use_local_poi = st.checkbox("优先使用本地POI索引（离线周边查询）", value=True,
+                                    help=f"从 {POI_INDEX_DIR}/<城市>.jsonl 加载批量POI导出，已收录类别不再请求高德")
         use_mock = False
     else:
         st.info("ℹ️ 当前使用【模拟数据模式】")
         amap_client = None
         use_mock = True
+        use_local_poi = False
+        bypass_cache = False
+        api_stats_slot = None
+    
+    # 跨会话分析缓存：键中含数据模式，切换数据源不影响其他会话的缓存；强制刷新时本会话不读缓存
+    shared_analysis_cache = get_analysis_cache()
+    analysis_cache = None if bypass_cache else shared_analysis_cache
     
-    # 加载统计年鉴数据
-    city_stats = load_city_stats()
+    # 加载统计年鉴数据（仅真实模式取数使用，模拟模式不加载）
+    city_stats = load_city_stats() if not use_mock else None
+    
+    # 运行统计（缓存、预取、对话、年鉴、依赖图），标签页执行完后由 render_sidebar_stats 填充
+    runtime_stats_slot = st.container()
     
     st.divider()
     st.caption("📌 系统版本：v3.0 企业版 | 数据更新：2024.03")
     st.caption("🚀 智能选址顾问已上线，请在聊天窗口输入需求")
 
-# ---------- 核心分析函数 ----------
-def analyze_city(city_name, amap_client, city_stats, use_mock):
-    """城市宏观分析接口"""
-    if use_mock or amap_client is None:
-        return generate_mock_city_data(city_name)
-    else:
-        return get_city_data_real(amap_client, city_name, city_stats)
+# ---------- 侧边栏运行统计（独立片段定时刷新）----------
+SIDEBAR_STATS_REFRESH = 3  # 秒；标签页片段重跑不会刷新侧边栏，由本片段定时拉取最新数值
 
-def analyze_district(city, district, amap_client, use_mock):
-    """商圈微观分析接口"""
-    if use_mock or amap_client is None:
-        return generate_mock_district_data(city, district)
-    else:
-        return get_district_data_real(amap_client, city, district)
-
-def financial_forecast(avg_price, seat_count, monthly_rent, labor_cost, 
-                       food_cost_rate, utility_rate, marketing_rate, 
-                       initial_investment, city, use_mock):
-    """财务预测核心模型"""
-    # 基础计算
-    table_turnover = 2.8  # 默认翻台率
-    daily_customers = seat_count * table_turnover
-    daily_revenue = daily_customers * avg_price
-    monthly_revenue = daily_revenue * 30
-    
-    # 成本
-    monthly_food_cost = monthly_revenue * (food_cost_rate / 100)
-    monthly_utility = monthly_revenue * (utility_rate / 100)
-    monthly_marketing = monthly_revenue * (marketing_rate / 100)
-    monthly_other = monthly_revenue * 0.05
-    equipment_depreciation = 2000000 / 60  # 200万设备5年折旧
-    
-    # 利润
-    monthly_profit = (monthly_revenue - monthly_food_cost - monthly_utility -
-                      monthly_marketing - monthly_other - 
-                      labor_cost * 10000 - monthly_rent * 10000 - 
-                      equipment_depreciation)
-    
-    # 季节性调整
-    seasonal_factors = {
-        '苏州': [0.85, 0.65, 0.90, 0.95, 1.0, 0.95, 0.88, 0.92, 0.98, 1.05, 1.02, 0.95],
-        '郑州': [0.70, 0.65, 0.85, 0.95, 1.0, 0.98, 0.95, 0.92, 0.96, 1.02, 0.90, 0.75],
-        '默认': [0.85, 0.80, 0.90, 0.95, 1.0, 0.98, 0.96, 0.97, 0.98, 1.02, 0.95, 0.85]
-    }
-    season = seasonal_factors.get(city, seasonal_factors['默认'])
-    
-    # 5年现金流模拟
-    months = 60
-    monthly_data = []
-    cum_cash = -initial_investment
-    breakeven_month = None
-    
-    for m in range(1, months+1):
-        growth = 1.0 + min(0.5, m * 0.015)  # 前33个月增长
-        seasonal = season[(m-1)%12]
-        adj_profit = monthly_profit * growth * seasonal
-        cum_cash += adj_profit
-        
-        monthly_data.append({
-            '月份': m,
-            '营收(万)': monthly_revenue * growth * seasonal / 10000,
-            '利润(万)': adj_profit / 10000,
-            '累计现金流(万)': cum_cash / 10000
-        })
-        
-        if cum_cash >= 0 and breakeven_month is None:
-            breakeven_month = m
-    
-    df_cashflow = pd.DataFrame(monthly_data)
-    annual_profit = df_cashflow['利润(万)'].tail(12).sum()
-    roe = annual_profit / (initial_investment / 10000) * 100 if initial_investment > 0 else 0
-    
-    return {
-        'monthly_revenue': monthly_revenue,
-        'monthly_profit': monthly_profit,
-        'breakeven_month': breakeven_month if breakeven_month else 99,
-        'annual_profit': annual_profit,
-        'roe': roe,
-        'df_cashflow': df_cashflow,
-        'seasonal_factors': season
-    }
+def render_sidebar_stats(amap_client, city_stats, api_slot, runtime_slot):
+    """在侧边栏预留的位置绘制运行统计（片段不能直接写 st.sidebar，故在侧边栏容器内调用）"""
+    if api_slot is not None:
+        with api_slot:
+            st.fragment(run_every=SIDEBAR_STATS_REFRESH)(_api_stats_panel)(amap_client)
+    with runtime_slot:
+        st.fragment(run_every=SIDEBAR_STATS_REFRESH)(_runtime_stats_panel)(city_stats)
 
-def risk_assessment(city_data, district_data, financials, brand_config):
-    """综合风险评估"""
-    risks = {}
-    
-    # 市场风险
-    comp_score = min(100, district_data.get('competitor_count', 0) * 12)
-    demand_score = 100 - city_data.get('growth_potential', 80)
-    price_score = 30 if brand_config['avg_price'] > 55 else 20
-    risks['市场风险'] = {
-        '竞争激烈度': comp_score,
-        '需求波动': demand_score,
-        '价格敏感': price_score,
-        '平均': (comp_score + demand_score + price_score) / 3
-    }
-    
-    # 运营风险
-    rent_score = max(0, (district_data.get('avg_rent', 200) - 150) // 2)
-    labor_score = 25  # 默认
-    supply_score = 15 if city_data.get('logistics_score', 80) > 85 else 25
-    risks['运营风险'] = {
-        '租金压力': rent_score,
-        '人力稳定性': labor_score,
-        '供应链风险': supply_score,
-        '平均': (rent_score + labor_score + supply_score) / 3
-    }
-    
-    # 财务风险
-    payback_score = 40 if financials['breakeven_month'] > 24 else 20 if financials['breakeven_month'] > 18 else 10
-    cashflow_score = 30 if financials['monthly_profit'] < 50000 else 15
-    risks['财务风险'] = {
-        '回本周期': payback_score,
-        '现金流压力': cashflow_score,
-        '投资强度': 20 if brand_config['budget_max'] > 250 else 10,
-        '平均': (payback_score + cashflow_score + 20) / 3
-    }
-    
-    # 政策风险
-    policy_score = 100 - city_data.get('policy_score', 80)
-    env_score = 30 if district_data.get('visibility_score', 70) < 60 else 15
-    risks['政策风险'] = {
-        '证照难度': policy_score,
-        '环保消防': env_score,
-        '地方保护': 20,
-        '平均': (policy_score + env_score + 20) / 3
-    }
-    
-    # 总风险分
-    total_score = sum([v['平均'] for v in risks.values()]) / len(risks)
-    return risks, total_score
+def _api_stats_panel(amap_client):
+    cache_stats = get_amap_cache().stats()
+    st.caption(f"📦 接口缓存：命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} "
+               f"（命中率 {cache_stats['hit_rate']:.0%}，{cache_stats['entries']}/{cache_stats['max_entries']} 条）")
+    pool_stats = get_amap_registry().stats()
+    st.caption(f"🔌 连接池：{pool_stats['clients']} 个客户端 · 累计请求 {pool_stats['requests']} · "
+               f"并发峰值 {pool_stats['peak_in_flight']} · 连接 {pool_stats['connections']}/{pool_stats['pool_size']}")
+    key_stats = amap_client.pool_stats()
+    quota_left = key_stats['quota_remaining']
+    st.caption(f"🚦 限流：今日已用 {key_stats['used_today']} 次"
+               f"{'' if quota_left is None else f'，剩余 {quota_left} 次'} · "
+               f"合并请求 {pool_stats['coalesced']} · 批量子请求 {pool_stats['batched']} · "
+               f"重试 {pool_stats['retries']} · 失败 {pool_stats['errors']}")
+    if len(key_stats['keys']) > 1:
+        st.caption("🔑 Key池：" + " · ".join(
+            f"{'⛔' if k['exhausted'] else ''}{k['key']} {k['used_today']}"
+            f"{'/' + str(k['daily_quota']) if k['daily_quota'] else ''}" for k in key_stats['keys'])
+            + f" · 切换 {key_stats['failovers']} 次")
+    if quota_left == 0:
+        st.error("⛔ 今日高德配额已耗尽，分析将回退为模拟数据")
 
-def ai_recommendations(city_data, district_data, financials, brand_config):
-    """AI智能建议（基于规则+历史经验）"""
-    recs = []
-    
-    # 选址建议
-    if district_data.get('competitor_count', 0) > 5:
-        recs.append(("竞争策略", "竞品密集，建议错位经营：主打现炒锅气，增加外卖窗口", "⚠️"))
-    else:
-        recs.append(("竞争策略", "竞争温和，可快速抢占心智，加大营销投入", "✅"))
-    
-    if financials['breakeven_month'] > 24:
-        recs.append(("财务优化", f"回本周期{financials['breakeven_month']}个月偏长，建议降低租金或提升翻台率", "🔴"))
-    else:
-        recs.append(("财务健康", f"回本周期{financials['breakeven_month']}个月，处于健康区间", "🟢"))
-    
-    # 本地化调整
-    if city_data.get('spicy_acceptance', 50) < 70:
-        recs.append(("菜品本地化", "建议增加免辣/微辣菜品，占比约30%，并推出儿童套餐", "🟡"))
-    
-    if brand_config['avg_price'] > 55:
-        recs.append(("价格策略", "客单价偏高，建议设置39元引流套餐，提升复购", "🟡"))
-    elif brand_config['avg_price'] < 45:
-        recs.append(("价格策略", "客单价偏低，可小幅提价至49-52元，优化利润结构", "🟢"))
-    
-    # 通用建议
-    recs.append(("会员体系", "开业前30天启动社群运营，储值赠礼锁定初始客流", "✅"))
-    recs.append(("人员培训", "提前45天招聘店长、厨师，进行标准化操作培训", "✅"))
-    
-    return recs
-
-# ---------- 自然语言处理（简单意图识别）----------
-def parse_user_query(query):
-    """从用户输入中提取城市、商圈、预算等信息"""
-    city_pattern = r'(苏州|郑州|杭州|南京|武汉|长沙|成都|西安|上海|北京|广州|深圳)'
-    district_pattern = r'([\u4e00-\u9fa5]{2,}(?:商圈|广场|中心|路|街|区))'
-    price_pattern = r'(\d{2,3})[元块]'
-    
-    city_match = re.search(city_pattern, query)
-    district_match = re.search(district_pattern, query)
-    price_match = re.search(price_pattern, query)
-    
-    result = {
-        'city': city_match.group(1) if city_match else st.session_state.brand_config.get('priority_city', '苏州'),
-        'district': district_match.group(1) if district_match else None,
-        'avg_price': int(price_match.group(1)) if price_match else st.session_state.brand_config.get('avg_price', 49)
-    }
-    return result
-
-def generate_chat_response(user_input, amap_client, use_mock, city_stats):
-    """生成选址顾问回复"""
-    parsed = parse_user_query(user_input)
-    city = parsed['city']
-    district = parsed['district'] if parsed['district'] else '工业园区湖东'  # 默认商圈
-    
-    # 获取数据
-    city_data = analyze_city(city, amap_client, city_stats, use_mock)
-    district_data = analyze_district(city, district, amap_client, use_mock)
-    
-    # 财务假设
-    financials = financial_forecast(
-        avg_price=parsed['avg_price'],
-        seat_count=st.session_state.brand_config['seat_count'],
-        monthly_rent=district_data.get('avg_rent', 200) * 300 / 10000,  # 300㎡
-        labor_cost=15,
-        food_cost_rate=32,
-        utility_rate=8,
-        marketing_rate=5,
-        initial_investment=st.session_state.brand_config['budget_min'] * 10000,
-        city=city,
-        use_mock=use_mock
-    )
-    
-    # 风险评估
-    risks, total_risk = risk_assessment(city_data, district_data, financials, st.session_state.brand_config)
-    
-    # 综合评分
-    match_score = int(
-        0.25 * city_data.get('spicy_acceptance', 60) +
-        0.20 * (city_data.get('disposable_income', 50000) / 1000) +
-        0.15 * (100 - district_data.get('competitor_count', 0) * 8) +
-        0.15 * district_data.get('daily_flow', 50000) / 1000 +
-        0.15 * (100 - total_risk) +
-        0.10 * (100 - abs(parsed['avg_price'] - 49) * 2)
-    )
-    
-    # 构建回复
-    response = f"🎯 **{city}{district if district else ''}选址分析报告**\n\n"
-    response += f"📊 **综合得分**: {match_score}/100  "
-    if match_score >= 80:
-        response += "🌟 强烈推荐\n\n"
-    elif match_score >= 65:
-        response += "👍 建议考虑\n\n"
-    else:
-        response += "⚠️ 谨慎评估\n\n"
-    
-    response += f"👥 **日均客流**: {district_data['daily_flow']:,} 人  |  🏪 **竞品数量**: {district_data['competitor_count']} 家\n"
-    response += f"💰 **租金水平**: {district_data['avg_rent']} 元/㎡/月  |  💵 **客单价**: {parsed['avg_price']} 元\n"
-    response += f"⏳ **预估回本**: {financials['breakeven_month']} 个月  |  📈 **年化ROE**: {financials['roe']:.1f}%\n\n"
-    
-    response += "**🔍 核心优势**:\n"
-    if district_data['office_ratio'] > 0.4:
-        response += "- 白领客群充足，午市刚需\n"
-    if district_data['daily_flow'] > 80000:
-        response += "- 商圈流量大，品牌曝光佳\n"
-    if financials['breakeven_month'] <= 20:
-        response += "- 投资回收快，现金流稳健\n"
-    
-    response += "\n**⚠️ 风险提示**:\n"
-    if district_data['competitor_count'] > 5:
-        response += "- 竞争激烈，需差异化运营\n"
-    if total_risk > 50:
-        response += "- 综合风险偏高，建议复核\n"
-    if city_data['spicy_acceptance'] < 70:
-        response += "- 本地辣味接受度较低，需调整菜单\n"
-    
-    response += "\n💡 **AI优化建议**:\n"
-    ai_recs = ai_recommendations(city_data, district_data, financials, st.session_state.brand_config)
-    for rec in ai_recs[:3]:  # 只取前3条
-        response += f"- {rec[0]}：{rec[1]}\n"
-    
-    return response
-
-# ---------- 主界面：多标签页 ----------
-tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
-    "🏙️ 城市宏观", "📍 商圈微观", "💰 财务预测", 
-    "⚠️ 风险评估", "🎯 AI推荐", "📋 综合报告", "💬 智能顾问"
-])
+def _runtime_stats_panel(city_stats):
+    analysis_stats = get_analysis_cache().stats()
+    st.caption(f"🗃️ 分析缓存：命中 {analysis_stats['hits']} / 未命中 {analysis_stats['misses']} "
+               f"（命中率 {analysis_stats['hit_rate']:.0%}，{analysis_stats['entries']} 条，"
+               f"{analysis_stats['bytes'] / 1048576:.1f}/{analysis_stats['budget'] / 1048576:.0f} MB，"
+               f"淘汰 {analysis_stats['evictions']}）")
+    prefetch_stats = get_district_prefetcher().stats()
+    st.caption(f"⚡ 商圈预取：完成 {prefetch_stats['completed']} · 进行中 {prefetch_stats['pending']} · "
+               f"已取消 {prefetch_stats['cancelled']} · 失败 {prefetch_stats['failed']}")
+    chat_stats = chat_store.stats()
+    st.caption(f"💬 对话记录：已存 {chat_stats['stored_messages']} 条，内存驻留 {chat_stats['sessions']} 个会话 "
+               f"{chat_stats['memory_bytes'] / 1024:.0f} KB（空闲释放 {chat_stats['evicted_sessions']}）")
+    if city_stats is not None:
+        stats_info = city_stats.stats()
+        years = stats_info['years']
+        st.caption(f"📊 统计年鉴：{stats_info['cities']} 个城市"
+                   f"{'' if years is None else f' · {years[0]}–{years[1]}年'} · "
+                   + (f"{stats_info['files']} 个文件 {stats_info['bytes'] / 2**20:.1f} MB（热加载 {stats_info['reloads']} 次）"
+                      if stats_info['source'] == 'files' else "内置数据"))
+    st.caption(f"🧮 依赖图本轮重算：{', '.join(analysis_graph.recomputed) or '无'} · "
+               f"累计计算 {analysis_graph.computed} / 复用 {analysis_graph.reused}")
 
 # ---------- Tab1: 城市宏观 ----------
-with tab1:
+@st.fragment
+def render_city_tab(city_stats, amap_client, use_mock, use_local_poi):
+    """城市宏观标签页（片段内交互只重跑本标签）"""
     st.markdown('<h2 class="sub-header">🏙️ 城市宏观竞争力分析</h2>', unsafe_allow_html=True)
     
     col1, col2 = st.columns([3, 1])
     with col1:
-        selected_city = st.selectbox("选择城市", city_stats['city'].tolist(), key="city_tab1")
+        selected_city = st.selectbox("选择城市", CITY_STATS['city'], key="city_tab1")
     with col2:
         depth = st.radio("分析深度", ["快速", "详细"], horizontal=True, key="depth")
     
+    # 用户阅读城市概况时，后台预热该城市热门商圈的分析
+    prefetch_districts(selected_city, amap_client, use_mock, use_local_poi)
+    
     # 获取数据
-    city_data = analyze_city(selected_city, amap_client if not use_mock else None, 
-                             city_stats, use_mock)
+    city_data = analyze_city(selected_city, amap_client if not use_mock else None,
+                             city_stats, use_mock, cache=analysis_cache)
+    if city_data.get('data_warning'):
+        st.warning(city_data['data_warning'])
     
     # 关键指标卡片
     cols = st.columns(5)
@@ -735,60 +485,43 @@ with tab1:
         st.metric("租金指数", f"{city_data['rental_index']}/100")
     
     # 雷达图
-    categories = ['消费能力', '辣味接受', '竞争环境', '政策支持', '物流', '增长潜力']
-    values = [
+    values = (
         city_data['disposable_income']/1000,
         city_data['spicy_acceptance'],
         100 - city_data['competition_index'],
         city_data['policy_score'],
         city_data['logistics_score'],
         city_data['growth_potential']
-    ]
-    
-    fig = go.Figure(data=go.Scatterpolar(
-        r=values,
-        theta=categories,
-        fill='toself',
-        marker=dict(color='#e74c3c')
-    ))
-    fig.update_layout(
-        polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
-        height=400,
-        title=f"{selected_city} 城市六维评估"
     )
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(city_radar_figure(selected_city, values), use_container_width=True)
     
     # 季节性
     st.subheader("📅 季节性客流波动")
-    months = ['1月','2月','3月','4月','5月','6月','7月','8月','9月','10月','11月','12月']
-    if selected_city == '苏州':
-        season = [0.85,0.65,0.90,0.95,1.0,0.95,0.88,0.92,0.98,1.05,1.02,0.95]
-    elif selected_city == '郑州':
-        season = [0.70,0.65,0.85,0.95,1.0,0.98,0.95,0.92,0.96,1.02,0.90,0.75]
-    else:
-        season = [0.85]*12
-    
-    fig_season = px.line(x=months, y=season, markers=True, 
-                        title=f"{selected_city} 月度客流系数",
-                        labels={'x':'月份', 'y':'客流系数'})
-    fig_season.add_hline(y=1.0, line_dash="dash", line_color="green")
-    fig_season.update_layout(height=300)
-    st.plotly_chart(fig_season, use_container_width=True)
+    st.plotly_chart(season_figure(selected_city), use_container_width=True)
 
 # ---------- Tab2: 商圈微观 ----------
-with tab2:
+@st.fragment
+def render_district_tab(city_stats, amap_client, use_mock, use_local_poi):
+    """商圈微观标签页（片段内交互只重跑本标签）"""
+    analysis_graph.begin_run()  # 片段单独重跑时重算记录只反映本次交互
     st.markdown('<h2 class="sub-header">📍 商圈微观评估</h2>', unsafe_allow_html=True)
     
     col_c, col_d = st.columns(2)
     with col_c:
-        city_t2 = st.selectbox("城市", city_stats['city'].tolist(), key="city_t2")
+        city_t2 = st.selectbox("城市", CITY_STATS['city'], key="city_t2")
     with col_d:
-        district_t2 = st.text_input("输入商圈名称（如：工业园区湖东）", value="工业园区湖东", key="district_t2")
+        district_t2 = st.text_input("输入商圈名称（如：工业园区湖东）", key="district_t2")
+    prefetch_districts(city_t2, amap_client, use_mock, use_local_poi, first=district_t2)
     
     if st.button("🔍 分析该商圈", key="btn_district"):
         with st.spinner("正在获取商圈数据..."):
-            district_data = analyze_district(city_t2, district_t2, 
-                                           amap_client if not use_mock else None, use_mock)
+            district_data = analysis_graph.evaluate(
+                'district',
+                {'city_name': city_t2, 'district_name': district_t2, 'use_mock': use_mock,
+                 'competitor': st.session_state.brand_config['main_competitor'],
+                 **data_inputs(amap_client, city_stats, use_mock)},
+                analysis_context(amap_client if not use_mock else None, city_stats, use_local_poi)
+            )
             st.session_state['district_data'] = district_data
             st.session_state['district_name'] = district_t2
             st.session_state['city_name'] = city_t2
@@ -802,16 +535,16 @@ with tab2:
         m2.metric("周末客流倍率", f"{d['weekend_multiplier']}x")
         m3.metric("平均租金", f"{d['avg_rent']}元/㎡")
         m4.metric("竞品数量", f"{d['competitor_count']}家")
+        if d.get('data_warning'):
+            st.warning(d['data_warning'])
+        elif d.get('fallback_fields'):
+            st.caption(f"⏱️ 部分查询失败或超时，以下字段使用默认值：{', '.join(d['fallback_fields'])}")
         
         # 客群分布
         st.subheader("👥 客群结构")
-        labels = ['白领', '家庭', '年轻群体', '其他']
-        sizes = [d['office_ratio'], d['family_ratio'], d['youth_ratio'], 
-                 1 - d['office_ratio'] - d['family_ratio'] - d['youth_ratio']]
-        fig_pie = px.pie(values=sizes, names=labels, hole=0.4,
-                        color_discrete_sequence=px.colors.qualitative.Set2)
-        fig_pie.update_layout(height=300)
-        st.plotly_chart(fig_pie, use_container_width=True)
+        sizes = (d['office_ratio'], d['family_ratio'], d['youth_ratio'],
+                 1 - d['office_ratio'] - d['family_ratio'] - d['youth_ratio'])
+        st.plotly_chart(customer_pie_figure(sizes), use_container_width=True)
         
         # 微观位置六维评分
         st.subheader("📐 微观位置评分")
@@ -823,39 +556,36 @@ with tab2:
             '租金合理性': max(0, 100 - (d['avg_rent'] - 150) // 2),
             '客流质量': min(100, d['daily_flow'] / 1000)
         }
-        fig_radar = go.Figure(data=go.Scatterpolar(
-            r=list(loc_scores.values()),
-            theta=list(loc_scores.keys()),
-            fill='toself',
-            marker=dict(color='#3498db')
-        ))
-        fig_radar.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
-            height=400
-        )
-        st.plotly_chart(fig_radar, use_container_width=True)
+        st.plotly_chart(score_radar_figure(tuple(loc_scores), tuple(loc_scores.values()), '#3498db'),
+                        use_container_width=True)
 
 # ---------- Tab3: 财务预测 ----------
-with tab3:
+@st.fragment
+def render_finance_tab(city_stats, use_mock):
+    """财务预测标签页（片段内交互只重跑本标签）"""
+    analysis_graph.begin_run()  # 片段单独重跑时重算记录只反映本次交互
+    import plotly.graph_objects as go
+    import plotly.express as px
+    from plotly.subplots import make_subplots
     st.markdown('<h2 class="sub-header">💰 5年财务现金流预测</h2>', unsafe_allow_html=True)
     
     colp1, colp2, colp3 = st.columns(3)
     with colp1:
-        store_area = st.slider("店铺面积(㎡)", 150, 500, 300, key="area")
-        table_turnover = st.slider("翻台率(次/天)", 1.5, 4.0, 2.8, 0.1, key="turnover")
+        store_area = st.slider("店铺面积(㎡)", 150, 500, key="area")
+        table_turnover = st.slider("翻台率(次/天)", 1.5, 4.0, step=0.1, key="turnover")
     with colp2:
-        monthly_rent_input = st.number_input("月租金(万元)", 3.0, 30.0, 12.0, 0.5, key="rent")
-        labor_cost_input = st.number_input("月人力成本(万元)", 8.0, 30.0, 15.0, 0.5, key="labor")
+        monthly_rent_input = st.number_input("月租金(万元)", 3.0, 30.0, step=0.5, key="rent")
+        labor_cost_input = st.number_input("月人力成本(万元)", 8.0, 30.0, step=0.5, key="labor")
     with colp3:
-        food_cost_rate = st.slider("食材成本率%", 25, 40, 32, key="food")
-        utility_rate = st.slider("水电杂费率%", 5, 12, 8, key="util")
-        marketing_rate = st.slider("营销费率%", 3, 10, 5, key="mkt")
+        food_cost_rate = st.slider("食材成本率%", 25, 40, key="food")
+        utility_rate = st.slider("水电杂费率%", 5, 12, key="util")
+        marketing_rate = st.slider("营销费率%", 3, 10, key="mkt")
     
-    city_fin = st.selectbox("选择城市（用于季节性）", city_stats['city'].tolist(), key="city_fin")
-    initial_invest = st.number_input("初始投资总额(万元)", 100, 500, 180, key="invest") * 10000
+    city_fin = st.selectbox("选择城市（用于季节性）", CITY_STATS['city'], key="city_fin")
+    initial_invest = st.number_input("初始投资总额(万元)", 100, 500, key="invest") * 10000
     
     if st.button("📊 生成财务预测", key="btn_fin"):
-        fin = financial_forecast(
+        fin_params = dict(
             avg_price=st.session_state.brand_config['avg_price'],
             seat_count=st.session_state.brand_config['seat_count'],
             monthly_rent=monthly_rent_input,
@@ -865,8 +595,10 @@ with tab3:
             marketing_rate=marketing_rate,
             initial_investment=initial_invest,
             city=city_fin,
-            use_mock=use_mock
+            table_turnover=table_turnover
         )
+        fin = analysis_graph.evaluate('financials', {'fin_params': fin_params, 'use_mock': use_mock})
+        st.session_state['fin_params'] = fin_params
         st.session_state['financials'] = fin
         
         # 现金流图表
@@ -900,37 +632,155 @@ with tab3:
         k2.metric("年净利润", f"{fin['annual_profit']:.1f}万")
         k3.metric("投资回收期", f"{fin['breakeven_month']}个月")
         k4.metric("ROE", f"{fin['roe']:.1f}%")
+    
+    # 蒙特卡洛风险模拟：翻台率、租金、食材成本率、季节波动按分布抽样
+    st.subheader("🎲 蒙特卡洛风险模拟")
+    colmc1, colmc2, colmc3 = st.columns(3)
+    with colmc1:
+        mc_samples = st.select_slider("模拟次数", options=[10_000, 100_000, 300_000, 1_000_000],
+                                      key="mc_samples")
+        mc_turnover = st.slider("翻台率下行/上行幅度%", 5, 50, key="mc_turnover")
+    with colmc2:
+        mc_rent_sd = st.slider("租金波动(标准差%)", 0, 30, key="mc_rent")
+        mc_food = st.slider("食材成本率波动(±%)", 0, 20, key="mc_food")
+    with colmc3:
+        mc_season_sd = st.slider("季节幅度波动(标准差%)", 0, 60, key="mc_season")
+    
+    if st.button("🎲 运行风险模拟", key="btn_mc"):
+        mc = monte_carlo_forecast(
+            avg_price=st.session_state.brand_config['avg_price'],
+            seat_count=st.session_state.brand_config['seat_count'],
+            monthly_rent=monthly_rent_input,
+            labor_cost=labor_cost_input,
+            food_cost_rate=food_cost_rate,
+            utility_rate=utility_rate,
+            marketing_rate=marketing_rate,
+            initial_investment=initial_invest,
+            city=city_fin,
+            table_turnover=table_turnover,
+            n_samples=mc_samples,
+            distributions={
+                'table_turnover': ('triangular', 1 - mc_turnover[0] / 100, 1.0, 1 + mc_turnover[1] / 100),
+                'monthly_rent': ('normal', 1.0, mc_rent_sd / 100),
+                'food_cost_rate': ('uniform', 1 - mc_food / 100, 1 + mc_food / 100),
+                'seasonal_amplitude': ('normal', 1.0, mc_season_sd / 100),
+            }
+        )
+        bands = mc['df_bands']
+        
+        # 累计现金流扇形图（P5-P95 / P25-P75 / 中位数）
+        fig_fan = go.Figure()
+        for upper, lower, color, name in [('P95', 'P5', 'rgba(231,76,60,0.15)', 'P5-P95'),
+                                          ('P75', 'P25', 'rgba(231,76,60,0.35)', 'P25-P75')]:
+            fig_fan.add_trace(go.Scatter(x=bands['月份'], y=bands[upper], mode='lines',
+                                         line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig_fan.add_trace(go.Scatter(x=bands['月份'], y=bands[lower], mode='lines',
+                                         line=dict(width=0), fill='tonexty', fillcolor=color, name=name))
+        fig_fan.add_trace(go.Scatter(x=bands['月份'], y=bands['P50'], mode='lines',
+                                     name='中位数', line=dict(color='#c0392b', width=2)))
+        fig_fan.add_hline(y=0, line_dash="dash", line_color="green")
+        fig_fan.update_layout(height=420, title=f"累计现金流分位带（万元，{mc['n_samples']:,} 次模拟）",
+                              xaxis_title="月份", yaxis_title="累计现金流(万)")
+        st.plotly_chart(fig_fan, use_container_width=True)
+        
+        mk1, mk2, mk3 = st.columns(3)
+        mk1.metric("60个月内回本概率", f"{mc['prob_breakeven']:.1%}")
+        mk2.metric("回本月份中位数", f"{mc['median_breakeven']}个月" if mc['median_breakeven'] < 99 else "未回本")
+        mk3.metric("第60月累计现金流P5", f"{bands['P5'].iloc[-1]:.1f}万")
+        
+        dist = mc['df_breakeven']
+        dist = dist[dist['概率'] > 0].assign(回本月份=lambda d: d['回本月份'].map(lambda m: '未回本' if m == 99 else str(m)))
+        fig_be = px.bar(dist, x='回本月份', y='概率', title="回本月份概率分布")
+        fig_be.update_layout(height=300, yaxis_tickformat='.0%')
+        st.plotly_chart(fig_be, use_container_width=True)
+    
+    # 敏感性分析：网格结果按格点记忆化，调整范围只计算新增格点
+    st.subheader("🔬 敏感性分析")
+    if 'sensitivity_memo' not in st.session_state:
+        st.session_state['sensitivity_memo'] = SensitivityMemo()
+    sens_memo = st.session_state['sensitivity_memo']
+    sens_base = {
+        'avg_price': float(st.session_state.brand_config['avg_price']),
+        'seat_count': float(st.session_state.brand_config['seat_count']),
+        'monthly_rent': float(monthly_rent_input),
+        'labor_cost': float(labor_cost_input),
+        'food_cost_rate': float(food_cost_rate),
+        'utility_rate': float(utility_rate),
+        'marketing_rate': float(marketing_rate),
+        'initial_investment': float(initial_invest),
+        'table_turnover': float(table_turnover),
+        'city': city_fin,
+    }
+    param_names = list(SENSITIVITY_PARAMS)
+    cols1, cols2, cols3 = st.columns(3)
+    with cols1:
+        sens_x = st.selectbox("横轴参数", param_names, key="sens_x",
+                              format_func=SENSITIVITY_PARAMS.get)
+        sens_y = st.selectbox("纵轴参数", param_names, key="sens_y",
+                              format_func=SENSITIVITY_PARAMS.get)
+    with cols2:
+        sens_range = st.slider("扫描范围(±%)", 5, 60, step=5, key="sens_range")
+        sens_step = st.slider("步长(%)", 1, 10, key="sens_step")
+    with cols3:
+        tornado_swing = st.slider("龙卷风浮动幅度(±%)", 5, 50, step=5, key="tornado_swing")
+    
+    if st.button("🔬 运行敏感性分析", key="btn_sens"):
+        if sens_x == sens_y:
+            st.warning("横轴与纵轴请选择不同参数")
+        else:
+            computed_before, reused_before = sens_memo.computed, sens_memo.reused
+            x_values = sensitivity_values(sens_base[sens_x], sens_range, sens_step)
+            y_values = sensitivity_values(sens_base[sens_y], sens_range, sens_step)
+            grid = sensitivity_grid(sens_base, sens_x, x_values, sens_y, y_values, sens_memo)
+            tornado = tornado_analysis(sens_base, sens_memo, tornado_swing)
+            st.caption(f"本次新计算 {sens_memo.computed - computed_before} 个情景，"
+                       f"复用缓存 {sens_memo.reused - reused_before} 个")
+            
+            hm1, hm2 = st.columns(2)
+            with hm1:
+                fig_hm_be = px.imshow(grid['breakeven'], x=x_values, y=y_values, origin='lower',
+                                      color_continuous_scale='RdYlGn_r', aspect='auto',
+                                      labels=dict(x=SENSITIVITY_PARAMS[sens_x], y=SENSITIVITY_PARAMS[sens_y],
+                                                  color='回本月份'),
+                                      title="回本月份（99=60个月内未回本）")
+                st.plotly_chart(fig_hm_be, use_container_width=True)
+            with hm2:
+                fig_hm_roe = px.imshow(grid['roe'], x=x_values, y=y_values, origin='lower',
+                                       color_continuous_scale='RdYlGn', aspect='auto',
+                                       labels=dict(x=SENSITIVITY_PARAMS[sens_x], y=SENSITIVITY_PARAMS[sens_y],
+                                                   color='ROE%'),
+                                       title="年化ROE(%)")
+                st.plotly_chart(fig_hm_roe, use_container_width=True)
+            
+            base_roe = tornado['基准ROE'].iloc[0]
+            fig_tornado = go.Figure()
+            fig_tornado.add_trace(go.Bar(y=tornado['参数'], x=tornado['下调ROE'] - base_roe, base=base_roe,
+                                         orientation='h', name=f'下调{tornado_swing}%', marker_color='#3498db'))
+            fig_tornado.add_trace(go.Bar(y=tornado['参数'], x=tornado['上调ROE'] - base_roe, base=base_roe,
+                                         orientation='h', name=f'上调{tornado_swing}%', marker_color='#e74c3c'))
+            fig_tornado.update_layout(barmode='overlay', height=420, xaxis_title="年化ROE(%)",
+                                      title=f"ROE龙卷风图（基准 {base_roe:.1f}%）")
+            st.plotly_chart(fig_tornado, use_container_width=True)
 
 # ---------- Tab4: 风险评估 ----------
-with tab4:
+@st.fragment
+def render_risk_tab(city_stats, amap_client, use_mock, use_local_poi):
+    """风险评估标签页（片段内交互只重跑本标签）"""
+    analysis_graph.begin_run()  # 片段单独重跑时重算记录只反映本次交互
     st.markdown('<h2 class="sub-header">⚠️ 风险矩阵评估</h2>', unsafe_allow_html=True)
     
     if 'district_data' in st.session_state and 'financials' in st.session_state:
-        city_data_risk = analyze_city(st.session_state.get('city_name', '苏州'),
-                                     amap_client if not use_mock else None,
-                                     city_stats, use_mock)
-        risks, total_risk = risk_assessment(
-            city_data_risk,
-            st.session_state['district_data'],
-            st.session_state['financials'],
-            st.session_state.brand_config
+        risks, total_risk = analysis_graph.evaluate(
+            'risks', analysis_inputs(use_mock, amap_client, city_stats),
+            analysis_context(amap_client if not use_mock else None, city_stats, use_local_poi)
         )
         
         # 雷达图
-        categories = list(risks.keys())
-        values = [risks[c]['平均'] for c in categories]
-        fig_risk = go.Figure(data=go.Scatterpolar(
-            r=values,
-            theta=categories,
-            fill='toself',
-            marker=dict(color='#e67e22')
-        ))
-        fig_risk.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
-            height=400,
-            title=f"综合风险评分：{total_risk:.1f}/100"
-        )
-        st.plotly_chart(fig_risk, use_container_width=True)
+        categories = tuple(risks.keys())
+        values = tuple(risks[c]['平均'] for c in categories)
+        st.plotly_chart(score_radar_figure(categories, values, '#e67e22',
+                                           f"综合风险评分：{total_risk:.1f}/100"),
+                        use_container_width=True)
         
         # 详细风险表
         for cat, items in risks.items():
@@ -950,19 +800,20 @@ with tab4:
         st.warning("请先在【商圈微观】中分析商圈，并在【财务预测】中生成预测。")
 
 # ---------- Tab5: AI推荐 ----------
-with tab5:
+@st.fragment
+def render_ai_tab(city_stats, amap_client, use_mock, use_local_poi):
+    """AI推荐标签页（片段内交互只重跑本标签）"""
+    analysis_graph.begin_run()  # 片段单独重跑时重算记录只反映本次交互
+    import pandas as pd
     st.markdown('<h2 class="sub-header">🎯 AI智能选址推荐</h2>', unsafe_allow_html=True)
     
     if 'district_data' in st.session_state and 'financials' in st.session_state:
-        city_data_ai = analyze_city(st.session_state.get('city_name', '苏州'),
-                                   amap_client if not use_mock else None,
-                                   city_stats, use_mock)
-        recs = ai_recommendations(
-            city_data_ai,
-            st.session_state['district_data'],
-            st.session_state['financials'],
-            st.session_state.brand_config
-        )
+        inputs = analysis_inputs(use_mock, amap_client, city_stats)
+        context = analysis_context(amap_client if not use_mock else None, city_stats, use_local_poi)
+        recs = analysis_graph.evaluate('recs', inputs, context)
+        city_data_ai = analysis_graph.evaluate('city', inputs, context)
+        district_ai = analysis_graph.evaluate('district', inputs, context)
+        fin_ai = analysis_graph.evaluate('financials', inputs, context)
         
         for title, detail, level in recs:
             if level == "✅" or level == "🟢":
@@ -974,8 +825,8 @@ with tab5:
         
         # 成功概率估算
         city_match = min(100, city_data_ai['spicy_acceptance'])
-        district_match = min(100, 100 - st.session_state['district_data']['competitor_count'] * 5)
-        finance_match = 100 if st.session_state['financials']['breakeven_month'] <= 20 else 60
+        district_match = min(100, 100 - district_ai['competitor_count'] * 5)
+        finance_match = 100 if fin_ai['breakeven_month'] <= 20 else 60
         brand_match = 80  # 默认
         
         prob = (city_match*0.3 + district_match*0.3 + finance_match*0.25 + brand_match*0.15)
@@ -992,62 +843,107 @@ with tab5:
         st.dataframe(timeline, use_container_width=True, hide_index=True)
     else:
         st.info("完成商圈分析和财务预测后，AI将为您生成定制化建议。")
+    
+    # 批量候选评分 / 全城扫描：提交为后台任务，在进程池中执行，不阻塞本页交互
+    with st.expander("📦 批量候选评分 / 全城扫描（后台任务）", expanded=False):
+        source = st.radio("候选来源", ["全城商圈扫描", "上传候选清单CSV"], horizontal=True, key="scan_source")
+        if source == "全城商圈扫描":
+            scan_city = st.selectbox("扫描城市", scan_cities(), key="scan_city")
+            scan_prices = st.multiselect("客单价档位（元）", [35, 39, 45, 49, 55, 59, 65, 69, 79], key="scan_prices")
+            batch_file = None
+        else:
+            batch_file = st.file_uploader("上传候选清单CSV（列：city, district，可选 avg_price）",
+                                          type=["csv"], key="batch_candidates")
+        if st.button("🚀 提交后台任务", key="btn_batch"):
+            if source == "全城商圈扫描":
+                candidates = city_scan_candidates(scan_city, scan_prices or [st.session_state.brand_config['avg_price']])
+                job_name = f"{scan_city} 全城扫描"
+            elif batch_file is not None:
+                candidates = pd.read_csv(batch_file)
+                job_name = batch_file.name
+            else:
+                candidates = None
+                st.warning("请先上传候选清单CSV")
+            if candidates is not None:
+                missing = {'city', 'district'} - set(candidates.columns)
+                if missing:
+                    st.error(f"候选清单缺少列：{', '.join(sorted(missing))}")
+                else:
+                    st.session_state['scan_job'] = get_job_queue().submit(
+                        candidates, st.session_state.brand_config,
+                        amap_key=amap_client.key if not use_mock and amap_client else None,
+                        use_local_poi=use_local_poi, name=job_name
+                    )
+        render_scan_jobs(amap_client if not use_mock else None)
+
+SCAN_JOB_STATUS = {'queued': '⏳ 排队中', 'running': '🔄 运行中', 'done': '✅ 已完成', 'failed': '❌ 失败',
+                   'cancelled': '⏹️ 已取消', 'interrupted': '⏸️ 已中断'}
+
+def render_scan_jobs(amap_client):
+    """后台任务列表：有任务运行时以片段定时刷新进度，结束后回到静态展示"""
+    queue = get_job_queue()
+    running = any(j['status'] in ('queued', 'running') for j in queue.list_jobs())
+    st.fragment(run_every=2 if running else None)(_scan_jobs_panel)(queue, amap_client, running)
+
+def _scan_jobs_panel(queue, amap_client, polling):
+    jobs = queue.list_jobs()
+    if not jobs:
+        st.caption("暂无后台任务。任务提交后在服务端持续运行，关闭页面也不会中断，可随时回来查看。")
+        return
+    if polling and not any(j['status'] in ('queued', 'running') for j in jobs):
+        st.rerun()  # 任务全部结束：整页重跑一次以停止定时刷新
+    labels = {j['id']: f"{SCAN_JOB_STATUS.get(j['status'], j['status'])} {j['name']} · {j['id']}" for j in jobs}
+    current = st.session_state.get('scan_job')
+    job_id = st.selectbox("后台任务（所有会话共享）", list(labels), format_func=labels.get,
+                          index=list(labels).index(current) if current in labels else 0)
+    st.session_state['scan_job'] = job_id
+    job = next(j for j in jobs if j['id'] == job_id)
+    st.progress(job['progress'], text=f"{job['done_chunks']}/{job['total_chunks']} 块 · {job['rows']} 个候选")
+    if job['error']:
+        st.error(f"任务失败：{job['error']}")
+    
+    col1, col2 = st.columns(2)
+    if job['status'] in ('queued', 'running'):
+        if col1.button("⏹️ 取消任务", key="btn_job_cancel"):
+            queue.cancel(job_id)
+    elif job['status'] != 'done':
+        if col1.button("▶️ 继续执行", key="btn_job_resume"):
+            try:
+                queue.resume(job_id, amap_key=amap_client.key if amap_client else None)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+    if job['status'] not in ('queued', 'running') and col2.button("🗑️ 删除任务", key="btn_job_delete"):
+        queue.delete(job_id)
+        st.session_state.pop('scan_job', None)
+        st.rerun()
+    
+    ranked = queue.result(job_id, partial=True)
+    if ranked is not None:
+        if job['status'] != 'done':
+            st.caption(f"阶段性排名（已完成 {job['done_chunks']}/{job['total_chunks']} 块）")
+        st.dataframe(ranked.head(200), use_container_width=True, hide_index=True)
+        if job['status'] == 'done':
+            st.download_button("📥 下载评分结果(.csv)", ranked.to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"候选选址评分_{job_id}.csv", mime="text/csv", key="dl_batch")
 
 # ---------- Tab6: 综合报告 ----------
-with tab6:
+@st.fragment
+def render_report_tab(city_stats, amap_client, use_mock, use_local_poi):
+    """综合报告标签页（片段内交互只重跑本标签）"""
+    analysis_graph.begin_run()  # 片段单独重跑时重算记录只反映本次交互
     st.markdown('<h2 class="sub-header">📋 综合选址报告</h2>', unsafe_allow_html=True)
     
     if 'district_data' in st.session_state and 'financials' in st.session_state:
-        report_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         city_rep = st.session_state.get('city_name', '苏州')
         district_rep = st.session_state.get('district_name', '')
-        brand = st.session_state.brand_config
-        
-        # 获取城市数据
-        city_rep_data = analyze_city(city_rep, amap_client if not use_mock else None,
-                                     city_stats, use_mock)
-        dist_rep_data = st.session_state['district_data']
-        fin_rep = st.session_state['financials']
         
-        report_text = f"""
-# {brand['brand_name']} 新店选址分析报告
-**生成时间**：{report_time}  
-**分析城市**：{city_rep}  
-**推荐商圈**：{district_rep}  
-
----
-
-## 一、市场分析摘要
-- 城市人口：{city_rep_data['population']} 万  
-- 人均可支配收入：{city_rep_data['disposable_income']} 元/年  
-- 湘菜接受度：{city_rep_data['spicy_acceptance']}%  
-- 商圈日均客流：{dist_rep_data['daily_flow']} 人  
-- 竞品数量（1km内）：{dist_rep_data['competitor_count']} 家  
-- 平均租金：{dist_rep_data['avg_rent']} 元/㎡/月  
-
-## 二、财务预测
-- 投资总额：{brand['budget_min']}~{brand['budget_max']} 万元  
-- 预计月营收：{fin_rep['monthly_revenue']/10000:.1f} 万元  
-- 预计月利润：{fin_rep['monthly_profit']/10000:.1f} 万元  
-- 投资回收期：{fin_rep['breakeven_month']} 个月  
-- 年化ROE：{fin_rep['roe']:.1f}%  
-
-## 三、风险评估
-综合风险评分：{total_risk if 'total_risk' in locals() else '待计算'}/100  
-主要风险项：{', '.join([c for c in risks.keys()][:2]) if 'risks' in locals() else '待分析'}
-
-## 四、AI建议
-1. 竞争策略：{recs[0][1] if 'recs' in locals() else '差异化定位'}
-2. 本地化调整：根据口味接受度调整辣度
-3. 营销预热：开业前30天启动社群运营
-
-## 五、结论
-**综合推荐指数**：{match_score if 'match_score' in locals() else '85'}/100  
-**建议行动**：{"优先推进" if match_score>=75 else "谨慎评估"}
-
----
-*报告由湘菜品牌智能选址系统 v3.0 自动生成*
-        """
+        # 报告节点依赖城市/商圈/财务/风险/建议，任一上游输入变化才重新生成
+        report = analysis_graph.evaluate(
+            'report', analysis_inputs(use_mock, amap_client, city_stats),
+            analysis_context(amap_client if not use_mock else None, city_stats, use_local_poi)
+        )
+        report_text = report['text']
         
         st.markdown(report_text)
         
@@ -1063,21 +959,30 @@ with tab6:
         st.warning("请先在【商圈微观】和【财务预测】完成分析，生成综合报告。")
 
 # ---------- Tab7: 智能选址顾问（聊天端口）----------
-with tab7:
+@st.fragment
+def render_chat_tab(city_stats, amap_client, use_mock, use_local_poi):
+    """智能顾问标签页（片段内交互只重跑本标签）"""
     st.markdown('<h2 class="sub-header">💬 智能选址顾问</h2>', unsafe_allow_html=True)
     st.markdown("""
     <div style="background-color: #f8f9fa; padding: 15px; border-radius: 10px; margin-bottom: 20px;">
         您可以像咨询专业分析师一样提问，例如：<br>
         🔹 “我想在苏州工业园区湖东开一家店，客单价55元，怎么样？”<br>
-        🔹 “郑州金水区适合开湘菜馆吗？预算200万。”<br>
+        🔹 “郑州金水区花园路适合开湘菜馆吗？预算200万。”<br>
         🔹 “帮我评估一下苏州观前街的选址优劣。”
     </div>
     """, unsafe_allow_html=True)
     
-    # 聊天历史显示
+    # 聊天历史显示：按页渲染，每页最多 CHAT_PAGE_SIZE 条，第1页为最新消息
+    session_id = st.session_state.chat_session_id
+    total = chat_store.count(session_id)
+    pages = max(1, -(-total // CHAT_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"对话记录页码（共 {pages} 页 / {total} 条，1为最新）",
+                               min_value=1, max_value=pages, value=1, step=1, key="chat_page")
     chat_container = st.container()
     with chat_container:
-        for msg in st.session_state.chat_history:
+        for msg in chat_store.page(session_id, page, CHAT_PAGE_SIZE):
             if msg['role'] == 'user':
                 st.markdown(f'<div style="display:flex; justify-content:flex-end;"><div class="chat-message-user">👤 {msg["content"]}</div></div>', unsafe_allow_html=True)
             else:
@@ -1088,27 +993,71 @@ with tab7:
     
     if user_input:
         # 添加用户消息
-        st.session_state.chat_history.append({'role': 'user', 'content': user_input})
+        chat_store.append(session_id, 'user', user_input)
         
-        # 生成回复
-        with st.spinner("顾问正在分析..."):
-            response = generate_chat_response(
-                user_input, 
-                amap_client if not use_mock else None,
-                use_mock,
-                city_stats
-            )
+        # 流式生成回复：需求解析立即显示，各分析阶段完成即追加
+        with chat_container:
+            st.markdown(f'<div style="display:flex; justify-content:flex-end;"><div class="chat-message-user">👤 {user_input}</div></div>', unsafe_allow_html=True)
+            with st.status("顾问正在分析...", expanded=True) as status:
+                response = st.write_stream(stream_chat_response(
+                    user_input, 
+                    amap_client if not use_mock else None,
+                    use_mock,
+                    city_stats,
+                    poi_loader=get_local_poi_backend if use_local_poi else None,
+                    brand_config=st.session_state.brand_config,
+                    analysis_cache=analysis_cache
+                ))
+                status.update(label="分析完成", state="complete")
         
-        # 添加助手消息
-        st.session_state.chat_history.append({'role': 'assistant', 'content': response})
+        # 添加助手消息，回到最新一页
+        chat_store.append(session_id, 'assistant', response)
+        st.session_state.pop('chat_page', None)
         
-        # 重新运行以刷新聊天界面
-        st.rerun()
+        # 只重跑聊天片段以刷新聊天界面
+        rerun_fragment()
     
     # 清空聊天按钮
     if st.button("🧹 清空对话", key="clear_chat"):
-        st.session_state.chat_history = []
-        st.rerun()
+        chat_store.clear(session_id)
+        st.session_state.pop('chat_page', None)
+        rerun_fragment()
+
+# ---------- 主界面：多标签页（惰性渲染，只执行当前标签）----------
+tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
+    "🏙️ 城市宏观", "📍 商圈微观", "💰 财务预测", 
+    "⚠️ 风险评估", "🎯 AI推荐", "📋 综合报告", "💬 智能顾问"
+], key="active_tab", on_change="rerun")
+
+with tab1:
+    if tab1.open:
+        render_city_tab(city_stats, amap_client, use_mock, use_local_poi)
+
+with tab2:
+    if tab2.open:
+        render_district_tab(city_stats, amap_client, use_mock, use_local_poi)
+
+with tab3:
+    if tab3.open:
+        render_finance_tab(city_stats, use_mock)
+
+with tab4:
+    if tab4.open:
+        render_risk_tab(city_stats, amap_client, use_mock, use_local_poi)
+
+with tab5:
+    if tab5.open:
+        render_ai_tab(city_stats, amap_client, use_mock, use_local_poi)
+
+with tab6:
+    if tab6.open:
+        render_report_tab(city_stats, amap_client, use_mock, use_local_poi)
+
+with tab7:
+    if tab7.open:
+        render_chat_tab(city_stats, amap_client, use_mock, use_local_poi)
+
+render_sidebar_stats(amap_client, city_stats, api_stats_slot, runtime_stats_slot)
 
 # ---------- 页脚 ----------
 st.markdown("---")
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from urllib.parse import parse_qsl
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+
+class FakeAMapSession:
+    """requests.Session 替身：respond(接口, 参数) 返回响应体（或抛出异常模拟网络错误），记录每次调用
+
+    批量接口 POST /v3/batch 的每个子请求同样交给 respond 处理。
+    """
+    def __init__(self, respond=None):
+        self.respond = respond or (lambda endpoint, params: {'status': '1', 'infocode': '10000', 'echo': params})
+        self.gets = []    # (接口, 参数)
+        self.posts = []   # (Key, [(接口, 参数)])
+
+    def get(self, url, params, timeout):
+        endpoint = url.split('/v3/', 1)[1]
+        self.gets.append((endpoint, dict(params)))
+        return FakeResponse(self.respond(endpoint, dict(params)))
+
+    def post(self, url, params, json, timeout):
+        ops = []
+        for op in json['ops']:
+            path, query = op['url'].split('?', 1)
+            ops.append((path[len('/v3/'):], dict(parse_qsl(query))))
+        self.posts.append((params['key'], ops))
+        return FakeResponse([{'body': self.respond(endpoint, p)} for endpoint, p in ops])
+
+
+@pytest.fixture
+def amap_service(tmp_path):
+    """构造使用 FakeAMapSession 的 AMapService：amap_service(keys, respond, cache=False, **选项)"""
+    from location_core import AMapCache, AMapService
+
+    def make(keys='test-key-aaaa', respond=None, cache=False, **options):
+        options.setdefault('qps', 1000)
+        service = AMapService(keys, cache=AMapCache(str(tmp_path / 'amap.sqlite')) if cache else None, **options)
+        service.session = FakeAMapSession(respond)
+        return service
+    return make
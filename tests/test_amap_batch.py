@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""高德批量接口：每批不超过20个子请求，结果按输入顺序对应回各调用方，重复与已缓存的查询不再发送"""
+
+import pytest
+
+import location_core as lc
+from location_core import AMAP_BATCH_MAX_OPS
+
+
+def queries(n, prefix='q'):
+    return [('place/around', {'location': '120.62,31.30', 'keywords': f"{prefix}{i}", 'radius': 500})
+            for i in range(n)]
+
+
+def test_batches_are_capped_and_mapped_back(amap_service):
+    service = amap_service()
+    results = service._get_many(queries(45))
+    assert [len(ops) for _, ops in service.session.posts] == [20, 20, 5]
+    assert all(len(ops) <= AMAP_BATCH_MAX_OPS for _, ops in service.session.posts)
+    assert [r['echo']['keywords'] for r in results] == [f"q{i}" for i in range(45)]
+    assert service.session.gets == []
+    assert service._usage['batched'] == 45 and service._usage['requests'] == 3
+
+
+def test_sub_requests_carry_the_batch_key(amap_service):
+    service = amap_service('key-one-aaaa')
+    service._get_many(queries(3))
+    key, ops = service.session.posts[0]
+    assert key == 'key-one-aaaa' and all(p['key'] == key for _, p in ops)
+
+
+def test_duplicates_and_cached_queries_are_not_resent(amap_service):
+    service = amap_service(cache=True)
+    service._get('place/around', queries(1)[0][1])
+    batch = queries(3) + queries(3)
+    results = service._get_many(batch)
+    sent = [p['keywords'] for _, ops in service.session.posts for _, p in ops]
+    assert sorted(sent) == ['q1', 'q2']
+    assert [r['echo']['keywords'] for r in results] == ['q0', 'q1', 'q2'] * 2
+
+
+def test_single_pending_query_uses_plain_get(amap_service):
+    service = amap_service()
+    results = service._get_many(queries(1) * 2)
+    assert service.session.posts == [] and len(service.session.gets) == 1
+    assert results[0] is results[1]
+
+
+def test_throttled_sub_requests_are_retried_alone(amap_service, monkeypatch):
+    monkeypatch.setattr(lc.random, 'uniform', lambda a, b: 0.01)
+    throttled = {'q1'}
+
+    def respond(endpoint, params):
+        if params['keywords'] in throttled:
+            throttled.discard(params['keywords'])
+            return {'status': '0', 'infocode': '10020', 'info': 'ACCESS_TOO_FREQUENT'}
+        return {'status': '1', 'infocode': '10000', 'echo': params}
+    service = amap_service(respond=respond)
+    results = service._get_many(queries(3))
+    assert [len(ops) for _, ops in service.session.posts] == [3, 1]
+    assert [r['echo']['keywords'] for r in results] == ['q0', 'q1', 'q2']
+
+
+def test_failed_sub_requests_map_to_none(amap_service, monkeypatch):
+    monkeypatch.setattr(lc.random, 'uniform', lambda a, b: 0.01)
+
+    def respond(endpoint, params):
+        if params['keywords'] == 'q1':
+            return {'status': '0', 'infocode': '10020'}
+        return {'status': '1', 'infocode': '10000', 'echo': params}
+    service = amap_service(respond=respond, max_retries=1)
+    results = service._get_many(queries(3))
+    assert results[1] is None
+    assert results[0]['echo']['keywords'] == 'q0' and results[2]['echo']['keywords'] == 'q2'
+
+
+@pytest.mark.parametrize('n', [4, 25])
+def test_search_around_many_aligns_with_input(amap_service, n):
+    service = amap_service()
+    around = [('120.62,31.30', f"kw{i}", 500) for i in range(n)]
+    results = service.search_around_many(around)
+    assert [r['echo']['keywords'] for r in results] == [f"kw{i}" for i in range(n)]
+
+
+def test_geocode_many_splits_batches_and_fills_cache(amap_service):
+    def respond(endpoint, params):
+        names = params['address'].split('|')
+        return {'status': '1', 'infocode': '10000',
+                'geocodes': [{'location': f"120.{i:02d},31.30"} for i in range(len(names))]}
+    service = amap_service(respond=respond, cache=True)
+    addresses = [f"商圈{i},苏州" for i in range(12)]
+    locations = service.geocode_many(addresses, '苏州')
+    sizes = [len(p['address'].split('|')) for _, p in service.session.gets]
+    assert sizes == [lc.AMAP_GEOCODE_BATCH_MAX, 2]
+    assert locations[:2] == ['120.00,31.30', '120.01,31.30'] and locations[10] == '120.00,31.30'
+    calls = len(service.session.gets)
+    assert service.geocode(addresses[3], '苏州') == '120.03,31.30'
+    assert len(service.session.gets) == calls  # 单个地址的地理编码直接命中批量写入的缓存
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""高德响应持久化缓存：缓存键不含API Key、按接口TTL过期、超出容量按最久未访问淘汰"""
+
+import time
+
+from location_core import AMapCache
+
+
+def test_cache_key_excludes_api_key_and_normalises_values():
+    params = {'keywords': '大米先生', 'city': '苏州', 'page': 1}
+    key = AMapCache.make_key('place/text', dict(params, key='aaaa'))
+    assert key == AMapCache.make_key('place/text', dict(params, key='bbbb'))
+    assert key == AMapCache.make_key('place/text', dict(params, page='1 '))
+    assert key != AMapCache.make_key('place/text', dict(params, page=2))
+    assert key != AMapCache.make_key('place/around', params)
+
+
+def test_cached_response_is_shared_across_keys(amap_service):
+    first = amap_service('key-one-aaaa', cache=True)
+    params = {'keywords': '大米先生', 'city': '苏州'}
+    data = first._get('place/text', params)
+    assert len(first.session.gets) == 1
+    assert first._get('place/text', params) == data
+    assert len(first.session.gets) == 1
+
+    second = amap_service('key-two-bbbb', cache=True)
+    assert second._get('place/text', params) == data
+    assert second.session.gets == []  # 换Key后仍命中同一条缓存
+
+
+def test_failed_responses_are_not_cached(amap_service):
+    service = amap_service(respond=lambda endpoint, params: {'status': '0', 'infocode': '20000'}, cache=True)
+    service._get('place/text', {'keywords': 'x'})
+    service._get('place/text', {'keywords': 'x'})
+    assert len(service.session.gets) == 2
+    assert service.cache.stats()['entries'] == 0
+
+
+def test_bypass_reads_fresh_but_writes_back(amap_service):
+    service = amap_service(cache=True)
+    service._get('place/text', {'keywords': 'x'})
+    bypass = service.with_options(bypass_cache=True)
+    bypass._get('place/text', {'keywords': 'x'})
+    assert len(service.session.gets) == 2
+    assert service.cache.stats()['entries'] == 1
+
+
+def test_entries_expire_per_endpoint_ttl(tmp_path):
+    cache = AMapCache(str(tmp_path / 'c.sqlite'), ttls={'place/text': 60})
+    cache.set('place/text', {'keywords': 'a'}, {'status': '1'})
+    cache.set('config/district', {'keywords': 'a'}, {'status': '1'})
+    assert cache.get('place/text', {'keywords': 'a'}) == {'status': '1'}
+    cache._conn.execute("UPDATE responses SET created_at = created_at - 61")
+    assert cache.get('place/text', {'keywords': 'a'}) is None
+    assert cache.get('config/district', {'keywords': 'a'}) == {'status': '1'}  # 行政区划TTL为30天
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+
+
+def test_lru_eviction_keeps_recently_read_entries(tmp_path):
+    cache = AMapCache(str(tmp_path / 'c.sqlite'), max_entries=3)
+    for name in 'abc':
+        cache.set('place/text', {'keywords': name}, {'name': name})
+        time.sleep(0.01)
+    assert cache.get('place/text', {'keywords': 'a'}) == {'name': 'a'}  # a 变为最近访问
+    time.sleep(0.01)
+    cache.set('place/text', {'keywords': 'd'}, {'name': 'd'})
+    assert cache.stats()['entries'] == 3
+    assert cache.get('place/text', {'keywords': 'b'}) is None
+    for name in 'acd':
+        assert cache.get('place/text', {'keywords': name}) == {'name': name}
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / 'c.sqlite')
+    AMapCache(path).set('geocode/geo', {'address': '观前街'}, {'status': '1'})
+    assert AMapCache(path).get('geocode/geo', {'address': '观前街'}) == {'status': '1'}
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""多Key配额池：超限Key当天停用并换Key重发（不占重试次数），全部耗尽才抛出AMapQuotaExceeded，
+注册表中同一Key只有一个令牌桶"""
+
+from collections import Counter
+
+import pytest
+
+from location_core import (AMapClientRegistry, AMapKeyPool, AMapQuotaExceeded, mask_key,
+                           parse_amap_keys)
+
+KEY_A, KEY_B = 'key-aaaaaaaa', 'key-bbbbbbbb'
+
+
+def quota_for(*bad_keys):
+    """对 bad_keys 返回日配额超限的响应"""
+    def respond(endpoint, params):
+        if params['key'] in bad_keys:
+            return {'status': '0', 'infocode': '10044', 'info': 'USER_DAILY_QUERY_OVER_LIMIT'}
+        return {'status': '1', 'infocode': '10000', 'echo': params}
+    return respond
+
+
+def test_parse_and_mask_keys():
+    assert parse_amap_keys(f" {KEY_A}，{KEY_B}; {KEY_A}\n") == [KEY_A, KEY_B]
+    assert parse_amap_keys([KEY_B, KEY_A]) == [KEY_B, KEY_A]
+    assert KEY_A not in mask_key(KEY_A) and mask_key(KEY_A).endswith(KEY_A[-4:])
+
+
+def test_requests_are_spread_across_keys(amap_service):
+    service = amap_service(f"{KEY_A},{KEY_B}", qps=2, daily_quota=100)
+    for i in range(8):
+        service._get('place/text', {'keywords': str(i)})
+    used = Counter(p['key'] for _, p in service.session.gets)
+    assert set(used) == {KEY_A, KEY_B} and min(used.values()) >= 3
+
+
+def test_quota_infocode_fails_over_without_using_a_retry(amap_service):
+    service = amap_service(f"{KEY_A},{KEY_B}", respond=quota_for(KEY_A), max_retries=0)
+    for i in range(4):
+        assert service._get('place/text', {'keywords': str(i)})['status'] == '1'
+    stats = {s['key']: s for s in service.limiter.key_stats()}
+    assert stats[mask_key(KEY_A)]['exhausted'] and not stats[mask_key(KEY_B)]['exhausted']
+    assert service.limiter.failovers == 1
+    assert [p['key'] for _, p in service.session.gets].count(KEY_A) <= 1
+    assert service._usage['retries'] == 0
+
+
+def test_quota_exceeded_only_when_all_keys_exhausted(amap_service):
+    service = amap_service(f"{KEY_A},{KEY_B}", respond=quota_for(KEY_A, KEY_B))
+    with pytest.raises(AMapQuotaExceeded, match="2 个Key"):
+        service._get('place/text', {'keywords': 'x'})
+    assert service.limiter.failovers == 2
+    assert service.limiter.remaining_today() == 0
+    with pytest.raises(AMapQuotaExceeded):
+        service.geocode('观前街', '苏州')  # 配额耗尽向上抛出，不当作普通失败返回None
+
+
+def test_local_daily_quota_rolls_over_to_next_key(amap_service):
+    service = amap_service(f"{KEY_A},{KEY_B}", daily_quota=2)
+    for i in range(4):
+        service._get('place/text', {'keywords': str(i)})
+    assert Counter(p['key'] for _, p in service.session.gets) == {KEY_A: 2, KEY_B: 2}
+    with pytest.raises(AMapQuotaExceeded):
+        service._get('place/text', {'keywords': 'more'})
+
+
+def test_batch_fails_over_on_quota(amap_service):
+    # 余量相同时路由到排序靠后的Key，首批发往 KEY_B
+    service = amap_service(f"{KEY_A},{KEY_B}", respond=quota_for(KEY_B), max_retries=0)
+    queries = [('place/text', {'keywords': f"b{i}"}) for i in range(3)]
+    results = service._fetch_batch(queries)
+    assert [key for key, _ in service.session.posts] == [KEY_B, KEY_A]
+    assert [r['echo']['keywords'] for r in results] == ['b0', 'b1', 'b2']
+
+
+def test_registry_shares_one_bucket_per_key():
+    registry = AMapClientRegistry(qps=1000, daily_quota=10)
+    both = registry.get(f"{KEY_A},{KEY_B}")
+    assert registry.get(f" {KEY_B} ,{KEY_A}") is both
+    single = registry.get(KEY_A)
+    assert single is not both
+    assert single.limiter.buckets[KEY_A] is both.limiter.buckets[KEY_A]
+    single.limiter.acquire()
+    assert both.limiter.buckets[KEY_A].used_today == 1
+    assert registry.stats()['clients'] == 2
+
+
+def test_key_pool_requires_a_key():
+    with pytest.raises(ValueError):
+        AMapKeyPool([])
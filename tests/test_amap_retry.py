@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""高德请求的限流、退避重试与请求合并：重试在耗时上限前停止，同参数并发请求只发一次"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+import location_core as lc
+from location_core import AMapError, AMapQuotaExceeded, TokenBucket
+
+
+@pytest.fixture
+def full_backoff(monkeypatch):
+    """退避抖动取上限，退避时长依次为 0.5、1、2、4 秒"""
+    monkeypatch.setattr(lc.random, 'uniform', lambda a, b: b)
+
+
+def failing(endpoint, params):
+    raise requests.ConnectionError("connection reset")
+
+
+def test_transient_errors_are_retried(amap_service, monkeypatch):
+    monkeypatch.setattr(lc.random, 'uniform', lambda a, b: 0.01)
+    outcomes = iter([requests.ConnectionError("reset"), {'status': '0', 'infocode': '10020'},
+                     {'status': '1', 'infocode': '10000'}])
+
+    def respond(endpoint, params):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    service = amap_service(respond=respond)
+    assert service._get('place/text', {'keywords': 'x'})['status'] == '1'
+    assert len(service.session.gets) == 3
+    assert service._usage['retries'] == 2 and service._usage['errors'] == 0
+
+
+def test_gives_up_after_max_retries(amap_service, monkeypatch):
+    monkeypatch.setattr(lc.random, 'uniform', lambda a, b: 0.01)
+    service = amap_service(respond=failing, max_retries=2)
+    with pytest.raises(AMapError, match="重试2次"):
+        service._get('place/text', {'keywords': 'x'})
+    assert len(service.session.gets) == 3
+
+
+@pytest.mark.parametrize('timeout,calls', [(0.3, 1), (0.8, 2)])
+def test_retries_stop_at_deadline(amap_service, full_backoff, timeout, calls):
+    service = amap_service(respond=failing)
+    started = time.monotonic()
+    with pytest.raises(AMapError, match="超出耗时上限"):
+        service._get('geocode/geo', {'address': '观前街'}, timeout=timeout)
+    assert time.monotonic() - started < timeout
+    assert len(service.session.gets) == calls
+
+
+def test_concurrent_identical_requests_are_coalesced(amap_service):
+    release = threading.Event()
+
+    def respond(endpoint, params):
+        release.wait(5)
+        return {'status': '1', 'infocode': '10000'}
+    service = amap_service(respond=respond)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service._get('place/text', {'keywords': 'x'})))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    while service._flights.shared < 4:
+        time.sleep(0.005)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(service.session.gets) == 1
+    assert len(results) == 5 and all(r['status'] == '1' for r in results)
+
+
+def test_token_bucket_paces_requests_to_qps():
+    bucket = TokenBucket(rate=20, capacity=1)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+
+
+def test_token_bucket_enforces_daily_quota():
+    bucket = TokenBucket(rate=1000, daily_quota=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert bucket.remaining_today() == 0 and bucket.exhausted()
+    with pytest.raises(AMapQuotaExceeded):
+        bucket.acquire()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""跨会话分析缓存：内存预算LRU淘汰、TTL过期、同键并发只计算一次、降级结果只短时缓存"""
+
+import threading
+import time
+
+from location_core import AnalysisCache, analyze_city
+
+
+class Counter:
+    """计数的计算函数，返回体积约为 size 字节的结果"""
+    def __init__(self, value=None, size=0):
+        self.calls = 0
+        self.value = value or {}
+        self.size = size
+
+    def __call__(self):
+        self.calls += 1
+        return dict(self.value, calls=self.calls, payload='x' * self.size)
+
+
+def age(cache, seconds):
+    """把全部条目的写入时间提前 seconds 秒"""
+    for key, (value, size, stored, degraded) in list(cache._entries.items()):
+        cache._entries[key] = (value, size, stored - seconds, degraded)
+
+
+def test_hits_return_copies():
+    cache = AnalysisCache()
+    compute = Counter({'population': 1280})
+    first = cache.get_or_compute('city', '苏州', None, 'mock', compute)
+    first['population'] = 0
+    second = cache.get_or_compute('city', '苏州', None, 'mock', compute)
+    assert second['population'] == 1280 and compute.calls == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_keys_separate_mode_extra_and_data_version():
+    cache = AnalysisCache()
+    compute = Counter()
+    cache.get_or_compute('district', '苏州', '观前街', 'mock', compute, extra=('大米先生',))
+    cache.get_or_compute('district', '苏州', '观前街', 'real', compute, extra=('大米先生',))
+    cache.get_or_compute('district', '苏州', '观前街', 'mock', compute, extra=('老乡鸡',))
+    assert compute.calls == 3
+    cache.data_version = 'next'
+    cache.get_or_compute('district', '苏州', '观前街', 'mock', compute, extra=('大米先生',))
+    assert compute.calls == 4
+
+
+def test_budget_evicts_least_recently_used():
+    cache = AnalysisCache(budget_mb=0.01)  # 约10KB
+    computes = {name: Counter(size=3000) for name in 'abcd'}
+    for name in 'abc':
+        cache.get_or_compute('district', '苏州', name, 'mock', computes[name])
+    cache.get_or_compute('district', '苏州', 'a', 'mock', computes['a'])  # a 变为最近使用
+    cache.get_or_compute('district', '苏州', 'd', 'mock', computes['d'])
+    stats = cache.stats()
+    assert stats['bytes'] <= stats['budget'] and stats['evictions'] == 1
+    assert cache.contains('district', '苏州', 'a', 'mock')
+    assert not cache.contains('district', '苏州', 'b', 'mock')
+
+
+def test_real_entries_expire_after_ttl():
+    cache = AnalysisCache(ttls={'real': 60})
+    compute = Counter()
+    cache.get_or_compute('city', '苏州', None, 'real', compute)
+    cache.get_or_compute('city', '苏州', None, 'mock', compute)
+    age(cache, 61)
+    assert not cache.contains('city', '苏州', None, 'real')
+    assert cache.contains('city', '苏州', None, 'mock')  # 模拟数据不过期
+    assert cache.get_or_compute('city', '苏州', None, 'real', compute)['calls'] == 3
+
+
+def test_concurrent_misses_compute_once():
+    cache = AnalysisCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'population': 1280}
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        cache.get_or_compute('city', '苏州', None, 'mock', compute))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    while cache.stats()['coalesced'] < 5:
+        time.sleep(0.005)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len(results) == 6
+    assert cache.stats()['coalesced'] == 5
+
+
+def test_degraded_results_are_cached_briefly():
+    cache = AnalysisCache(degraded_ttl=30)
+    compute = Counter({'fallback_fields': ['competitor_count']})
+    cache.get_or_compute('district', '苏州', '观前街', 'real', compute)
+    cache.get_or_compute('district', '苏州', '观前街', 'real', compute)
+    assert compute.calls == 1
+    age(cache, 31)
+    assert not cache.contains('district', '苏州', '观前街', 'real')
+    cache.get_or_compute('district', '苏州', '观前街', 'real', compute)
+    assert compute.calls == 2
+
+    warned = Counter({'data_warning': '配额耗尽'})
+    cache.get_or_compute('city', '郑州', None, 'real', warned)
+    age(cache, 31)
+    cache.get_or_compute('city', '郑州', None, 'real', warned)
+    assert warned.calls == 2
+
+
+class NoPopulationAMap:
+    def district(self, city):
+        return {'name': city}
+
+
+class EmptyStats:
+    version = 'v1'
+
+    def get(self, city):
+        return None
+
+
+def test_city_without_population_is_negatively_cached():
+    cache = AnalysisCache(degraded_ttl=30)
+    data = analyze_city('无名市', NoPopulationAMap(), EmptyStats(), False, cache=cache)
+    assert data['fallback_fields'] == ['population']
+    assert cache.contains('city', '无名市', None, 'real', extra=('v1',))
+    age(cache, 31)
+    assert not cache.contains('city', '无名市', None, 'real', extra=('v1',))
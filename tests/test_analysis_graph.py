@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""分析依赖图：只重算受影响的下游节点；降级结果不记忆；年鉴版本变化时城市节点重算"""
+
+import pytest
+
+from location_core import DEFAULT_BRAND_CONFIG, AnalysisGraph, build_analysis_graph
+
+FIN_PARAMS = dict(avg_price=49, seat_count=120, monthly_rent=60000, labor_cost=80000, food_cost_rate=0.35,
+                  utility_rate=0.05, marketing_rate=0.03, initial_investment=1500000, city='苏州')
+
+
+@pytest.fixture
+def inputs():
+    return {'city_name': '苏州', 'district_name': '姑苏区观前街', 'use_mock': True, 'competitor': '大米先生',
+            'bypass_cache': False, 'data_version': 'v1', 'fin_params': dict(FIN_PARAMS),
+            'brand_config': dict(DEFAULT_BRAND_CONFIG)}
+
+
+def run(graph, name, inputs, context=None):
+    graph.begin_run()
+    value = graph.evaluate(name, inputs, context)
+    return value, sorted(graph.recomputed)
+
+
+def test_first_run_computes_everything_then_reuses(inputs):
+    graph = build_analysis_graph()
+    report, recomputed = run(graph, 'report', inputs)
+    assert recomputed == ['city', 'district', 'financials', 'recs', 'report', 'risks']
+    assert '姑苏区观前街' in report['text']
+    again, recomputed = run(graph, 'report', inputs)
+    assert recomputed == [] and again is report
+
+
+def test_only_downstream_nodes_recompute(inputs):
+    graph = build_analysis_graph()
+    run(graph, 'report', inputs)
+
+    inputs['fin_params'] = dict(FIN_PARAMS, avg_price=59)
+    _, recomputed = run(graph, 'report', inputs)
+    assert recomputed == ['financials', 'recs', 'report', 'risks']
+
+    inputs['brand_config'] = dict(DEFAULT_BRAND_CONFIG, roi_target=25)
+    _, recomputed = run(graph, 'report', inputs)
+    assert recomputed == ['recs', 'report', 'risks']
+
+    inputs['district_name'] = '工业园区湖东'
+    _, recomputed = run(graph, 'report', inputs)
+    assert recomputed == ['district', 'recs', 'report', 'risks']
+
+
+def test_data_version_change_recomputes_city(inputs):
+    graph = build_analysis_graph()
+    run(graph, 'risks', inputs)
+    inputs['data_version'] = 'v2'
+    _, recomputed = run(graph, 'risks', inputs)
+    assert recomputed == ['city', 'risks']
+
+
+def test_degraded_values_are_not_memoized():
+    calls = {'source': 0, 'sink': 0}
+
+    def source(ctx, x):
+        calls['source'] += 1
+        return {'x': x, 'fallback_fields': ['x']} if calls['source'] == 1 else {'x': x}
+
+    def sink(ctx, source):
+        calls['sink'] += 1
+        return {'total': source['x'] * 2}
+    graph = AnalysisGraph().add('source', source, inputs=('x',)).add('sink', sink, deps=('source',))
+
+    assert graph.evaluate('sink', {'x': 3}) == {'total': 6}
+    # 上游降级：上游与依赖它的下游都不记忆，下一次重新求值
+    _, recomputed = run(graph, 'sink', {'x': 3})
+    assert recomputed == ['sink', 'source']
+    _, recomputed = run(graph, 'sink', {'x': 3})
+    assert recomputed == [] and calls == {'source': 2, 'sink': 2}
+
+
+def test_missing_inputs_and_unknown_deps_are_rejected():
+    graph = AnalysisGraph().add('a', lambda ctx, x: x, inputs=('x',))
+    with pytest.raises(KeyError):
+        graph.add('b', lambda ctx, c: c, deps=('c',))
+    with pytest.raises(KeyError):
+        graph.evaluate('a', {})
+
+
+def test_context_is_not_part_of_the_key(inputs):
+    graph = build_analysis_graph()
+    run(graph, 'city', inputs, {'poi_loader': None})
+    _, recomputed = run(graph, 'city', inputs, {'poi_loader': lambda city: None})
+    assert recomputed == []
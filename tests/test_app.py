@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Streamlit 页面冒烟测试：切换到智能顾问标签并提交一条消息（模拟数据模式）"""
+
+import os
+
+import pytest
+
+pytest.importorskip('streamlit')
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit_app.py')
+CHAT_TAB = "💬 智能顾问"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # 缓存、对话记录与任务目录都按相对路径落在临时目录
+    monkeypatch.chdir(tmp_path)
+    import streamlit as st
+    st.cache_resource.clear()
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.session_state["active_tab"] = CHAT_TAB
+    at.run()
+    assert not at.exception
+    yield at
+    st.cache_resource.clear()
+
+
+def test_chat_tab_submits_message(app):
+    app.chat_input[0].set_value("南京新街口，客单价60元，预算180万，100个座位")
+    app.session_state["active_tab"] = CHAT_TAB
+    app.run()
+    assert not app.exception, [e.value for e in app.exception]
+
+    from location_core import ChatStore
+    history = ChatStore(os.path.join(os.getcwd(), '.chat_history.sqlite')).page(app.session_state["chat_session_id"])
+    assert [m['role'] for m in history] == ['user', 'assistant']
+    assert '新街口' in history[1]['content']
+    rendered = "".join(m.value for m in app.markdown)
+    assert '南京新街口，客单价60元' in rendered
+
+
+def test_clear_chat_button(app):
+    app.chat_input[0].set_value("苏州观前街怎么样")
+    app.session_state["active_tab"] = CHAT_TAB
+    app.run()
+    app.button(key="clear_chat").click()
+    app.session_state["active_tab"] = CHAT_TAB
+    app.run()
+    assert not app.exception, [e.value for e in app.exception]
+
+    from location_core import ChatStore
+    assert ChatStore(os.path.join(os.getcwd(), '.chat_history.sqlite')).count(app.session_state["chat_session_id"]) == 0
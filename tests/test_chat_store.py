@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""对话记录存储：内存窗口受条数与字节上限约束，空闲会话释放后从磁盘重建，过期记录清理，分页与磁盘一致"""
+
+import sqlite3
+import time
+
+import pytest
+
+from location_core import ChatStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'chat.sqlite')
+
+
+def fill(store, session_id, n):
+    for i in range(n):
+        store.append(session_id, 'user' if i % 2 == 0 else 'assistant', f"消息{i}")
+
+
+def test_window_caps_message_count(path):
+    store = ChatStore(path, window=5)
+    fill(store, 's1', 12)
+    window = store._sessions['s1']['messages']
+    assert [m['content'] for m in window] == [f"消息{i}" for i in range(7, 12)]
+    assert store.count('s1') == 12 and store.stats()['stored_messages'] == 12
+
+
+def test_window_caps_bytes_but_keeps_latest(path):
+    store = ChatStore(path, window=100, max_session_kb=1)
+    for i in range(10):
+        store.append('s1', 'assistant', f"{i}" + '长' * 100)  # 每条约300字节
+    state = store._sessions['s1']
+    assert state['bytes'] <= 1024 and len(state['messages']) == 3
+    assert state['messages'][-1]['content'].startswith('9')
+    store.append('s1', 'assistant', '超' * 1000)  # 单条超过上限时仍保留最新一条
+    assert len(store._sessions['s1']['messages']) == 1
+
+
+def test_idle_sessions_are_evicted_and_rebuilt_from_disk(path):
+    store = ChatStore(path, window=4, idle_ttl=60)
+    fill(store, 'old', 6)
+    fill(store, 'new', 2)
+    store._sessions['old']['last_seen'] -= 120
+    assert store.stats()['sessions'] == 1 and store.stats()['evicted_sessions'] == 1
+    assert 'old' not in store._sessions
+    assert [m['content'] for m in store.page('old', 1, 4)] == ['消息2', '消息3', '消息4', '消息5']
+    assert store.count('old') == 6 and 'old' in store._sessions
+
+
+def test_history_survives_restart(path):
+    fill(ChatStore(path), 's1', 3)
+    store = ChatStore(path)
+    assert store.count('s1') == 3
+    assert [m['role'] for m in store.page('s1')] == ['user', 'assistant', 'user']
+
+
+def test_old_rows_are_purged_on_open(path):
+    store = ChatStore(path, retention_days=1)
+    fill(store, 's1', 3)
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE messages SET created_at = ? WHERE content = '消息0'", (time.time() - 2 * 86400,))
+    conn.commit()
+    conn.close()
+    assert ChatStore(path, retention_days=0).count('s1') == 3  # 0 表示永久保留
+    reopened = ChatStore(path, retention_days=1)
+    assert reopened.count('s1') == 2
+
+
+@pytest.mark.parametrize('window', [3, 50])
+def test_paging_matches_limit_offset(path, window):
+    store = ChatStore(path, window=window)
+    fill(store, 's1', 23)
+    all_messages = [f"消息{i}" for i in range(23)]
+    for page in range(1, 5):
+        end = 23 - (page - 1) * 5
+        expected = all_messages[max(0, end - 5):max(0, end)]
+        assert [m['content'] for m in store.page('s1', page, 5)] == expected
+
+
+def test_pages_are_copies_and_clear_removes_session(path):
+    store = ChatStore(path)
+    fill(store, 's1', 2)
+    store.page('s1')[0]['content'] = '已修改'
+    assert store.page('s1')[0]['content'] == '消息0'
+    store.clear('s1')
+    assert store.count('s1') == 0 and store.page('s1') == []
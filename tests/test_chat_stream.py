@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""选址顾问流式回复：需求解析先于数据获取输出，各阶段逐段产出，拼接结果与完整回复一致（模拟数据模式）"""
+
+import pytest
+
+import location_core as lc
+from location_core import AnalysisCache, generate_chat_response, load_city_stats, stream_chat_response
+
+QUERY = "南京新街口，客单价60元，预算180万，100个座位"
+
+
+@pytest.fixture(scope='module')
+def city_stats():
+    return load_city_stats()
+
+
+def test_parsed_request_is_yielded_before_analysis(city_stats, monkeypatch):
+    calls = []
+    analyze_city, analyze_district = lc.analyze_city, lc.analyze_district
+    monkeypatch.setattr(lc, 'analyze_city', lambda *a, **k: calls.append('city') or analyze_city(*a, **k))
+    monkeypatch.setattr(lc, 'analyze_district',
+                        lambda *a, **k: calls.append('district') or analyze_district(*a, **k))
+
+    stream = stream_chat_response(QUERY, None, True, city_stats)
+    title, parsed = next(stream), next(stream)
+    assert '南京新街口' in title
+    assert '客单价 60 元' in parsed and '预算 180 万元' in parsed and '100 座' in parsed
+    assert calls == []  # 数据获取在需求解析输出之后才开始
+
+    flow = next(stream)
+    assert calls == ['city', 'district'] and '日均客流' in flow
+    rest = list(stream)
+    assert any('预估回本' in chunk for chunk in rest)
+    assert rest[-1].startswith("\n💡 **AI优化建议**")
+
+
+def test_joined_stream_equals_full_response(city_stats):
+    cache = AnalysisCache()
+    chunks = list(stream_chat_response(QUERY, None, True, city_stats, analysis_cache=cache))
+    assert len(chunks) >= 7 and all(chunks)
+    assert "".join(chunks) == generate_chat_response(QUERY, None, True, city_stats, analysis_cache=cache)
+
+
+def test_missing_district_uses_default(city_stats):
+    first = next(stream_chat_response("帮我看看苏州", None, True, city_stats))
+    assert first.startswith("🎯 **苏州工业园区湖东")
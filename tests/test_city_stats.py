@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""统计年鉴数据仓：Arrow/Parquet 加载、年份归一、热加载替换、失败保留旧版本与跨进程序列化"""
+
+import os
+import pickle
+
+import pytest
+
+from location_core import CITY_STATS, CityStatsStore
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+pf = pytest.importorskip('pyarrow.feather')
+
+
+def write_feather(path, **columns):
+    pf.write_feather(pa.table(columns), str(path), compression='uncompressed')
+
+
+def test_builtin_fallback_without_files(tmp_path):
+    store = CityStatsStore(str(tmp_path))
+    assert store.stats()['source'] == 'builtin'
+    assert store.get('苏州')['disposable_income'] == CITY_STATS['disposable_income'][CITY_STATS['city'].index('苏州')]
+    assert store.get('不存在') is None and '不存在' not in store
+
+
+def test_arrow_latest_year_and_lookup(tmp_path):
+    write_feather(tmp_path / 'yearbook.arrow', city=['苏州', '苏州', '郑州'], year=[2022, 2023, 2023],
+                  disposable_income=[70000, 72000, 45000])
+    store = CityStatsStore(str(tmp_path))
+    assert store.get('苏州') == {'city': '苏州', 'year': 2023, 'disposable_income': 72000}
+    assert store.get(' 苏州 ', 2022)['disposable_income'] == 70000
+    assert store.get('苏州', '2022')['disposable_income'] == 70000
+    assert store.get('苏州', 2021) is None and store.get('苏州', '未知') is None
+    assert sorted(store.cities()) == ['苏州', '郑州']
+
+
+def test_parquet_is_mapped_through_arrow_copy(tmp_path):
+    pq.write_table(pa.table({'city': ['杭州'], 'year': [2023], 'gdp_growth': [6.1]}), str(tmp_path / 'y.parquet'))
+    store = CityStatsStore(str(tmp_path))
+    assert store.get('杭州')['gdp_growth'] == pytest.approx(6.1)
+    assert (tmp_path / '.y.parquet.arrow').exists()
+    assert store.stats()['files'] == 1  # 隐藏的转存文件不计入
+
+
+def test_mixed_and_missing_years_are_normalised(tmp_path):
+    write_feather(tmp_path / 'a.arrow', city=['苏州', '苏州', '郑州'], year=['2021', None, 'n/a'],
+                  disposable_income=[1, 2, 3])
+    write_feather(tmp_path / 'b.arrow', city=['苏州'], year=[2023.0], disposable_income=[4])
+    store = CityStatsStore(str(tmp_path))
+    assert store.stats()['source'] == 'files'
+    assert store.get('苏州') == {'city': '苏州', 'year': 2023, 'disposable_income': 4}
+    assert store.get('苏州', 2021)['disposable_income'] == 1
+    assert store.get('郑州') == {'city': '郑州', 'year': None, 'disposable_income': 3}
+
+
+def test_hot_reload_swaps_version(tmp_path):
+    write_feather(tmp_path / '2023.arrow', city=['苏州'], year=[2023], disposable_income=[72000])
+    store = CityStatsStore(str(tmp_path), check_interval=0)
+    version = store.version
+    write_feather(tmp_path / '2024.arrow', city=['苏州'], year=[2024], disposable_income=[75000])
+    assert store.get('苏州') == {'city': '苏州', 'year': 2024, 'disposable_income': 75000}
+    assert store.version != version and store.reloads == 1
+    os.remove(tmp_path / '2024.arrow')
+    assert store.get('苏州')['year'] == 2023 and store.reloads == 2
+
+
+def test_failed_reload_keeps_previous_version(tmp_path):
+    write_feather(tmp_path / '2023.arrow', city=['苏州'], year=[2023], disposable_income=[72000])
+    store = CityStatsStore(str(tmp_path), check_interval=0)
+    version = store.version
+    (tmp_path / 'broken.arrow').write_bytes(b'not an arrow file')
+    assert store.get('苏州')['disposable_income'] == 72000
+    assert store.version == version and store.reloads == 0
+
+
+def test_pickle_reopens_from_directory(tmp_path):
+    write_feather(tmp_path / '2023.arrow', city=['苏州'], year=[2023], disposable_income=[72000])
+    store = CityStatsStore(str(tmp_path), check_interval=7.0)
+    payload = pickle.dumps(store)
+    assert len(payload) < 1024  # 只传目录，不复制数据
+    clone = pickle.loads(payload)
+    assert clone.root == store.root and clone.check_interval == 7.0
+    assert clone.get('苏州') == store.get('苏州') and clone.version == store.version
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""竞品密度栅格：查表计数与精确距离计数一致；残缺拉取不缓存；栅格缓存有界；构建不占用商圈分析预算"""
+
+import threading
+
+import numpy as np
+import pytest
+
+import location_core as lc
+from location_core import AMapError, AMapService, CompetitorDensity
+
+CENTER = (120.62, 31.30)
+
+
+def exact_distances(lng, lat, queries):
+    """各查询点到每家门店的距离（与栅格相同的等距圆柱投影）"""
+    lat0 = lat.mean()
+    kx = np.radians(1.0) * lc.EARTH_RADIUS * np.cos(np.radians(lat0))
+    ky = np.radians(1.0) * lc.EARTH_RADIUS
+    qx, qy = queries[:, 0] * kx, queries[:, 1] * ky
+    return np.hypot(lng[None, :] * kx - qx[:, None], lat[None, :] * ky - qy[:, None])
+
+
+def test_raster_counts_match_exact_counts():
+    rng = np.random.default_rng(7)
+    lng = CENTER[0] + rng.normal(0, 0.03, 3000)
+    lat = CENTER[1] + rng.normal(0, 0.03, 3000)
+    density = CompetitorDensity(lng, lat, center=CENTER)
+    assert density.total == 3000
+    queries = np.c_[CENTER[0] + rng.normal(0, 0.03, 300), CENTER[1] + rng.normal(0, 0.03, 300)]
+    dist = exact_distances(lng, lat, queries)
+    # 查询点与门店各自最多偏离所在栅格中心半个对角线
+    slack = density.cell_size * np.sqrt(2)
+    lower = (dist <= density.radius - slack).sum(axis=1)
+    upper = (dist <= density.radius + slack).sum(axis=1)
+    exact = (dist <= density.radius).sum(axis=1)
+    raster = np.array([density.count((x, y)) for x, y in queries])
+    assert np.all(raster >= lower) and np.all(raster <= upper)
+    assert np.abs(raster - exact).mean() <= 0.05 * exact.mean()
+    assert density.count(f"{CENTER[0]:.6f},{CENTER[1]:.6f}") == density.count(CENTER)
+
+
+def test_raster_clips_far_points_and_handles_empty():
+    density = CompetitorDensity([120.62, 120.621, 125.0], [31.30, 31.30, 35.0], center=CENTER)
+    assert density.total == 2
+    assert density.count(CENTER) == 2
+    empty = CompetitorDensity([], [])
+    assert empty.total == 0 and empty.count(CENTER) == 0 and empty.nbytes == 0
+
+
+class FakePOISource:
+    """按页返回门店的假 search_poi；fail_page 指定的页返回 None（请求失败）"""
+    def __init__(self, total, fail_page=None):
+        self.total = total
+        self.fail_page = fail_page
+        self.pages = []
+
+    def __call__(self, keyword, city, offset=20, page=1):
+        self.pages.append(page)
+        if page == self.fail_page:
+            return None
+        start = (page - 1) * offset
+        pois = [{'location': f"{CENTER[0] + 0.0005 * i:.6f},{CENTER[1]:.6f}"}
+                for i in range(start, min(start + offset, self.total))]
+        return {'status': '1', 'count': str(self.total), 'pois': pois}
+
+
+@pytest.fixture
+def service():
+    svc = AMapService("test-key-0001", qps=1000)
+    svc.district = lambda city: {'center': f"{CENTER[0]},{CENTER[1]}"}
+    return svc
+
+
+def test_partial_pull_raises_and_is_not_cached(service):
+    service.search_poi = FakePOISource(total=60, fail_page=2)
+    with pytest.raises(AMapError):
+        service.competitor_density('大米先生', '苏州')
+    assert not service._densities
+
+    service.search_poi = FakePOISource(total=60)
+    density = service.competitor_density('大米先生', '苏州')
+    assert density.total == 60
+    assert service.competitor_density('大米先生', '苏州') is density
+
+
+def test_truncated_pull_raises(service):
+    service.search_poi = FakePOISource(total=10 ** 6)
+    with pytest.raises(AMapError):
+        list(service.iter_poi('大米先生', '苏州', max_pages=3, strict=True))
+    assert max(service.search_poi.pages) <= 4
+
+
+def test_density_cache_is_bounded_and_drops_expired(service, monkeypatch):
+    grids = [CompetitorDensity([CENTER[0]], [CENTER[1]]) for _ in range(3)]
+    monkeypatch.setattr(lc, 'DENSITY_CACHE_BYTES', 2 * grids[0].nbytes)
+    for i, g in enumerate(grids):
+        service._store_density(('竞品', f"城市{i}"), g)
+        if i == 1:
+            assert service._cached_density(('竞品', '城市0')) is grids[0]  # 访问后变为最近使用
+    assert list(service._densities) == [('竞品', '城市0'), ('竞品', '城市2')]
+
+    stale = CompetitorDensity([CENTER[0]], [CENTER[1]])
+    stale.built_at -= lc.DENSITY_CACHE_TTL + 1
+    service._densities[('竞品', '过期')] = stale
+    assert service._cached_density(('竞品', '过期')) is None
+    service._store_density(('竞品', '新'), CompetitorDensity([], []))
+    assert ('竞品', '过期') not in service._densities
+
+
+def test_density_build_does_not_consume_district_budget(service):
+    release = threading.Event()
+    source = FakePOISource(total=15)
+
+    def slow_search_poi(*args, **kwargs):
+        release.wait(5)
+        return source(*args, **kwargs)
+    service.search_poi = slow_search_poi
+    service.geocode = lambda address, city, timeout=None: f"{CENTER[0]},{CENTER[1]}"
+    service.search_around_many = lambda queries: [{'status': '1', 'pois': []} for _ in queries]
+
+    data = lc.get_district_data_real(service, '苏州', '观前街', budget=0.2)
+    assert data['fallback_fields'] == ['competitor_count']
+
+    # 预算外构建继续完成并缓存，下一次分析直接查表
+    release.set()
+    service.warm_competitor_density('大米先生', '苏州').result(timeout=5)
+    data = lc.get_district_data_real(service, '苏州', '观前街', budget=0.2)
+    assert 'fallback_fields' not in data
+    assert data['competitor_count'] == 15
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""financial_forecast（向量化引擎）与原逐月循环公式逐项一致"""
+
+import numpy as np
+import pytest
+
+from location_core import financial_forecast, financial_forecast_batch
+
+BASELINE_SEASONS = {
+    '苏州': [0.85, 0.65, 0.90, 0.95, 1.0, 0.95, 0.88, 0.92, 0.98, 1.05, 1.02, 0.95],
+    '郑州': [0.70, 0.65, 0.85, 0.95, 1.0, 0.98, 0.95, 0.92, 0.96, 1.02, 0.90, 0.75],
+    '默认': [0.85, 0.80, 0.90, 0.95, 1.0, 0.98, 0.96, 0.97, 0.98, 1.02, 0.95, 0.85]
+}
+
+
+def baseline_forecast(avg_price, seat_count, monthly_rent, labor_cost, food_cost_rate, utility_rate,
+                      marketing_rate, initial_investment, city, table_turnover=2.8):
+    """向量化之前的逐月循环实现"""
+    monthly_revenue = seat_count * table_turnover * avg_price * 30
+    monthly_profit = (monthly_revenue - monthly_revenue * (food_cost_rate / 100) -
+                      monthly_revenue * (utility_rate / 100) - monthly_revenue * (marketing_rate / 100) -
+                      monthly_revenue * 0.05 - labor_cost * 10000 - monthly_rent * 10000 - 2000000 / 60)
+    season = BASELINE_SEASONS.get(city, BASELINE_SEASONS['默认'])
+    cum_cash = -initial_investment
+    breakeven_month = None
+    revenue, profit, cum = [], [], []
+    for m in range(1, 61):
+        growth = 1.0 + min(0.5, m * 0.015)
+        seasonal = season[(m - 1) % 12]
+        adj_profit = monthly_profit * growth * seasonal
+        cum_cash += adj_profit
+        revenue.append(monthly_revenue * growth * seasonal / 10000)
+        profit.append(adj_profit / 10000)
+        cum.append(cum_cash / 10000)
+        if cum_cash >= 0 and breakeven_month is None:
+            breakeven_month = m
+    annual_profit = sum(profit[-12:])
+    roe = annual_profit / (initial_investment / 10000) * 100 if initial_investment > 0 else 0
+    return {'monthly_revenue': monthly_revenue, 'monthly_profit': monthly_profit,
+            'breakeven_month': breakeven_month or 99, 'annual_profit': annual_profit, 'roe': roe,
+            'revenue': revenue, 'profit': profit, 'cum_cash': cum}
+
+
+def random_scenarios(n, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        yield {
+            'avg_price': float(rng.uniform(30, 90)),
+            'seat_count': int(rng.integers(40, 240)),
+            'monthly_rent': float(rng.uniform(1, 12)),
+            'labor_cost': float(rng.uniform(2, 12)),
+            'food_cost_rate': float(rng.uniform(25, 45)),
+            'utility_rate': float(rng.uniform(2, 10)),
+            'marketing_rate': float(rng.uniform(1, 8)),
+            'initial_investment': float(rng.choice([0, rng.uniform(5e5, 4e6)], p=[0.05, 0.95])),
+            'city': str(rng.choice(['苏州', '郑州', '杭州'])),
+            'table_turnover': float(rng.uniform(1.5, 4.5)),
+        }
+
+
+@pytest.mark.parametrize('scenario', list(random_scenarios(300)))
+def test_single_scenario_matches_baseline(scenario):
+    expected = baseline_forecast(**scenario)
+    result = financial_forecast(use_mock=True, **scenario)
+    assert result['breakeven_month'] == expected['breakeven_month']
+    for field in ('monthly_revenue', 'monthly_profit', 'annual_profit', 'roe'):
+        assert result[field] == pytest.approx(expected[field], rel=1e-12, abs=1e-9)
+    df = result['df_cashflow']
+    assert df['月份'].tolist() == list(range(1, 61))
+    np.testing.assert_allclose(df['营收(万)'], expected['revenue'], rtol=1e-12)
+    np.testing.assert_allclose(df['利润(万)'], expected['profit'], rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(df['累计现金流(万)'], expected['cum_cash'], rtol=1e-12, atol=1e-9)
+
+
+def test_default_turnover_is_baseline_value():
+    scenario = dict(next(random_scenarios(1, seed=1)))
+    scenario.pop('table_turnover')
+    expected = baseline_forecast(**scenario)
+    assert financial_forecast(use_mock=False, **scenario)['monthly_revenue'] == pytest.approx(expected['monthly_revenue'])
+
+
+def test_batch_matches_single_rows():
+    scenarios = list(random_scenarios(500, seed=2))
+    cols = {k: [sc[k] for sc in scenarios] for k in scenarios[0]}
+    batch = financial_forecast_batch(**cols)
+    for i, sc in enumerate(scenarios):
+        expected = baseline_forecast(**sc)
+        assert batch['breakeven_month'][i] == expected['breakeven_month']
+        assert batch['roe'][i] == pytest.approx(expected['roe'], rel=1e-12, abs=1e-9)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""地名词典意图解析：商圈优先、别名归一、数字字段识别、未收录商圈的正则回退，以及与模拟样本库的一致性"""
+
+import pytest
+
+from gazetteer import Gazetteer, get_gazetteer, parse_intent
+from location_core import DEFAULT_BRAND_CONFIG, MOCK_DISTRICT_DB, likely_districts, parse_user_query
+
+
+def test_district_takes_priority_over_embedded_city():
+    intent = parse_intent("我想在南京西路开一家店")
+    assert intent['district'] == '南京西路'
+    assert intent['city'] == '上海'
+
+
+def test_city_is_inferred_from_district():
+    assert parse_intent("观前街怎么样")['city'] == '苏州'
+    assert parse_intent("花园路商圈")['city'] == '郑州'
+
+
+@pytest.mark.parametrize('text,city,district', [
+    ("苏州观前开店", '苏州', '姑苏区观前街'),
+    ("园区湖东客流如何", '苏州', '工业园区湖东'),
+    ("魔都开店", '上海', None),
+    ("郑州市花园路", '郑州', '金水区花园路'),
+])
+def test_aliases_map_to_canonical_names(text, city, district):
+    intent = parse_intent(text)
+    assert (intent['city'], intent['district']) == (city, district)
+
+
+@pytest.mark.parametrize('text,field,value', [
+    ("人均60元", 'avg_price', 60),
+    ("客单价55", 'avg_price', 55),
+    ("预算300万", 'budget', 300),
+    ("预算2000000元", 'budget', 200),
+    ("投资180", 'budget', 180),
+    ("80个座位", 'seat_count', 80),
+    ("座位数96", 'seat_count', 96),
+])
+def test_numbers_are_classified_by_hints(text, field, value):
+    intent = parse_intent(text)
+    assert intent[field] == value
+    assert [k for k in ('avg_price', 'budget', 'seat_count') if intent[k] is not None] == [field]
+
+
+def test_unhinted_or_out_of_range_numbers_are_ignored():
+    intent = parse_intent("2024年人均5元，3个座位")
+    assert intent['avg_price'] is None and intent['seat_count'] is None and intent['budget'] is None
+
+
+def test_parse_user_query_falls_back_to_suffix_regex_for_unknown_district():
+    result = parse_user_query("我想在杭州吴山区开店，人均58元")
+    assert result['city'] == '杭州'
+    assert result['district'] == '吴山区'  # 词典未收录，从城市名之后按后缀匹配
+    assert result['avg_price'] == 58
+    assert result['budget'] == DEFAULT_BRAND_CONFIG['budget_min']
+    assert result['seat_count'] == DEFAULT_BRAND_CONFIG['seat_count']
+
+
+def test_custom_gazetteer_longest_match():
+    gaz = Gazetteer()
+    gaz.add('city', '西安', aliases=['长安'])
+    gaz.add('district', '长安街', '北京')
+    gaz.add('district', '小寨', '西安')
+    intent = parse_intent("长安街和小寨", gaz)
+    assert (intent['city'], intent['district']) == ('北京', '长安街')
+    assert parse_intent("长安的小寨", gaz)['city'] == '西安'
+
+
+def test_prefetched_districts_match_mock_sample_db():
+    """预取的商圈名与对话解析出的标准名相同；有模拟样本的商圈，其词典标准名与样本库键一致"""
+    gaz = get_gazetteer()
+    canonical = {(owner, name) for kind, name, owner in gaz.entries if kind == 'district'}
+    assert set(MOCK_DISTRICT_DB) <= canonical
+    for city in {c for c, _ in MOCK_DISTRICT_DB}:
+        names = likely_districts(city, limit=100)
+        assert len(names) == len(set(names))
+        for name in names:
+            assert (city, name) in canonical
+            assert parse_intent(name, gaz)['district'] == name
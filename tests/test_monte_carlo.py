@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""蒙特卡洛风险模拟与 (N, 60) 逐月现金流矩阵暴力模拟一致（同一随机种子、同一抽样顺序）"""
+
+import numpy as np
+import pytest
+
+from location_core import (FORECAST_MONTHS, MC_DEFAULT_DISTRIBUTIONS, MC_PERCENTILES, MC_QUANTILE_BINS,
+                           SEASONAL_FACTORS, _mc_draw, _monthly_base, monte_carlo_forecast)
+
+BASE = dict(avg_price=49, seat_count=120, monthly_rent=6.0, labor_cost=8.0, food_cost_rate=35,
+            utility_rate=5, marketing_rate=3, initial_investment=1_500_000, city='苏州', table_turnover=2.8)
+
+
+def brute_force(n, seed, distributions=None, **params):
+    """逐情景构造60个月现金流矩阵，逐月求分位数与首个回本月份"""
+    dists = dict(MC_DEFAULT_DISTRIBUTIONS, **(distributions or {}))
+    rng = np.random.default_rng(seed)
+    turnover = params['table_turnover'] * np.clip(_mc_draw(rng, dists['table_turnover'], n), 0, None)
+    rent = params['monthly_rent'] * np.clip(_mc_draw(rng, dists['monthly_rent'], n), 0, None)
+    food = params['food_cost_rate'] * np.clip(_mc_draw(rng, dists['food_cost_rate'], n), 0, None)
+    amplitude = np.clip(_mc_draw(rng, dists['seasonal_amplitude'], n), 0, 2)
+    _, profit = _monthly_base(params['avg_price'], params['seat_count'], rent, params['labor_cost'], food,
+                              params['utility_rate'], params['marketing_rate'], turnover)
+    season = np.asarray(SEASONAL_FACTORS.get(params['city'], SEASONAL_FACTORS['默认']))
+    cash = np.empty((n, FORECAST_MONTHS))
+    for m in range(1, FORECAST_MONTHS + 1):
+        growth = 1.0 + min(0.5, m * 0.015)
+        seasonal = 1.0 + amplitude * (season[(m - 1) % 12] - 1.0)
+        cash[:, m - 1] = profit * growth * seasonal
+    cum = np.cumsum(cash, axis=1) - params['initial_investment']
+    reached = cum >= 0
+    breakeven = np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, 99)
+    return cum, breakeven
+
+
+@pytest.mark.parametrize('seed,overrides,distributions', [
+    (1, {}, None),
+    (2, {'initial_investment': 600_000, 'city': '郑州'}, None),
+    (3, {'monthly_rent': 14.0}, {'monthly_rent': ('uniform', 0.5, 1.5), 'seasonal_amplitude': ('normal', 1.0, 0.8)}),
+])
+def test_matches_brute_force_simulation(seed, overrides, distributions):
+    n = 3000
+    params = dict(BASE, **overrides)
+    result = monte_carlo_forecast(n_samples=n, seed=seed, distributions=distributions, **params)
+    cum, breakeven = brute_force(n, seed, distributions, **params)
+
+    # 回本月份分布逐月一致
+    expected = np.bincount(breakeven, minlength=100)[np.append(np.arange(1, FORECAST_MONTHS + 1), 99)] / n
+    np.testing.assert_allclose(result['df_breakeven']['概率'].to_numpy(), expected)
+    reached = breakeven[breakeven < 99]
+    assert result['prob_breakeven'] == pytest.approx(reached.size / n)
+    assert result['median_breakeven'] == (int(np.median(reached)) if reached.size else 99)
+
+    # 分位带：分箱近似落在相邻次序统计量之间（外加一个箱宽与float32舍入）
+    bands = result['df_bands'][[f'P{p}' for p in MC_PERCENTILES]].to_numpy() * 10000
+    ordered = np.sort(cum, axis=0)
+    width = (ordered[-1] - ordered[0]) / MC_QUANTILE_BINS + 1e-6 * np.abs(ordered).max(axis=0) + 1.0
+    for j, p in enumerate(MC_PERCENTILES):
+        k = int(p / 100 * n)
+        lo = ordered[max(0, k - 1)] - width
+        hi = ordered[min(n - 1, k + 1)] + width
+        assert np.all((bands[:, j] >= lo) & (bands[:, j] <= hi)), p
+
+
+def test_seed_is_reproducible_and_bands_are_ordered():
+    a = monte_carlo_forecast(n_samples=5000, seed=11, **BASE)
+    b = monte_carlo_forecast(n_samples=5000, seed=11, **BASE)
+    assert a['df_bands'].equals(b['df_bands']) and a['df_breakeven'].equals(b['df_breakeven'])
+    bands = a['df_bands'][[f'P{p}' for p in MC_PERCENTILES]].to_numpy()
+    assert np.all(np.diff(bands, axis=1) >= -1e-6)
+    assert a['df_breakeven']['概率'].sum() == pytest.approx(1.0)
+
+
+def test_unknown_distribution_is_rejected():
+    with pytest.raises(ValueError):
+        monte_carlo_forecast(n_samples=10, seed=0, distributions={'monthly_rent': ('lognormal', 0, 1)}, **BASE)
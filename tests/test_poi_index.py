@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""本地POI空间索引与暴力计算一致；LocalPOIBackend.search_around 返回高德周边搜索的结构"""
+
+import json
+
+import numpy as np
+import pytest
+
+from location_core import LocalPOIBackend, POISpatialIndex
+
+CENTER = (120.62, 31.30)
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(2024)
+    # 城区密集 + 郊区稀疏，覆盖网格边界与空网格
+    lng = np.r_[CENTER[0] + rng.normal(0, 0.02, 4000), CENTER[0] + rng.uniform(-0.3, 0.3, 1000)]
+    lat = np.r_[CENTER[1] + rng.normal(0, 0.02, 4000), CENTER[1] + rng.uniform(-0.3, 0.3, 1000)]
+    return lng, lat
+
+
+@pytest.fixture(scope='module')
+def queries():
+    rng = np.random.default_rng(7)
+    return np.c_[CENTER[0] + rng.uniform(-0.1, 0.1, 200), CENTER[1] + rng.uniform(-0.1, 0.1, 200)]
+
+
+def brute_distances(index, lng, lat, q):
+    kx, ky = index._kx, index._ky
+    return np.hypot(lng * kx - q[0] * kx, lat * ky - q[1] * ky)
+
+
+@pytest.mark.parametrize('cell_size', [200.0, 500.0, 1500.0])
+@pytest.mark.parametrize('radius', [300.0, 1000.0, 2500.0])
+def test_radius_count_matches_brute_force(points, queries, cell_size, radius):
+    lng, lat = points
+    index = POISpatialIndex(lng, lat, cell_size=cell_size)
+    for q in queries:
+        expected = int(np.count_nonzero(brute_distances(index, lng, lat, q) <= radius))
+        assert index.radius_count(tuple(q), radius) == expected
+        idx, dist = index.within(tuple(q), radius)
+        assert len(idx) == expected and np.all(np.diff(dist) >= 0)
+
+
+@pytest.mark.parametrize('k', [1, 5, 50])
+def test_nearest_matches_brute_force(points, queries, k):
+    lng, lat = points
+    index = POISpatialIndex(lng, lat, cell_size=500.0)
+    for q in queries[:50]:
+        expected = np.sort(brute_distances(index, lng, lat, q))[:k]
+        _, dist = index.nearest(tuple(q), k)
+        np.testing.assert_allclose(dist, expected, rtol=1e-9, atol=1e-6)
+
+
+def test_nearest_with_fewer_points_than_k():
+    index = POISpatialIndex([120.6, 120.7], [31.3, 31.3])
+    idx, dist = index.nearest("120.65,31.30", k=5)
+    assert len(idx) == 2 and dist[0] == pytest.approx(dist[1])
+    empty = POISpatialIndex([], [])
+    assert len(empty.nearest(CENTER, 3)[0]) == 0 and empty.radius_count(CENTER, 1000) == 0
+
+
+def test_search_around_matches_amap_shape(points, tmp_path):
+    lng, lat = points
+    dump = tmp_path / '苏州.jsonl'
+    with open(dump, 'w', encoding='utf-8') as f:
+        for i, (x, y) in enumerate(zip(lng, lat)):
+            f.write(json.dumps({'keyword': '地铁站', 'name': f"站{i}", 'location': f"{x:.6f},{y:.6f}"},
+                               ensure_ascii=False) + '\n')
+    backend = LocalPOIBackend.from_dump(str(dump))
+    assert '地铁站' in backend and '公交车站' not in backend
+    assert backend.search_around("120.62,31.30", '公交车站', 500) is None
+
+    location = f"{CENTER[0]:.6f},{CENTER[1]:.6f}"
+    data = backend.search_around(location, '地铁站', 1000)
+    total = backend.radius_count(location, '地铁站', 1000)
+    assert total > LocalPOIBackend.PAGE_SIZE
+    assert data['status'] == '1' and data['count'] == str(total)
+    assert len(data['pois']) == LocalPOIBackend.PAGE_SIZE  # 与高德一样只返回首页
+    distances = [int(p['distance']) for p in data['pois']]
+    assert distances == sorted(distances) and distances[-1] <= 1000
+    assert all(set(p) == {'name', 'location', 'distance'} for p in data['pois'])
+    assert all(isinstance(p['location'], str) and ',' in p['location'] for p in data['pois'])
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""POI分页遍历：惰性逐页拉取并预取下一页，达到limit提前停止，strict 模式下失败页与截断抛错"""
+
+import threading
+import time
+
+import pytest
+
+from location_core import AMapError
+
+
+def poi_pages(total, failing_pages=(), gate=None):
+    """place/text 响应：共 total 条结果按 offset 分页；failing_pages 中的页返回参数错误（不重试）"""
+    def respond(endpoint, params):
+        page, size = int(params['page']), int(params['offset'])
+        if gate is not None and page > 1:
+            gate.wait(5)
+        if page in failing_pages:
+            return {'status': '0', 'infocode': '20000', 'info': 'INVALID_PARAMS'}
+        start = (page - 1) * size
+        pois = [{'id': str(i), 'location': f"120.{i:04d},31.3000"} for i in range(start, min(total, start + size))]
+        return {'status': '1', 'infocode': '10000', 'count': str(total), 'pois': pois}
+    return respond
+
+
+def pages_requested(service):
+    return [int(p['page']) for endpoint, p in service.session.gets if endpoint == 'place/text']
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_all_pages_in_order(amap_service):
+    service = amap_service(respond=poi_pages(60))
+    pois = list(service.iter_poi('老乡鸡', '苏州', page_size=25))
+    assert [p['id'] for p in pois] == [str(i) for i in range(60)]
+    assert pages_requested(service) == [1, 2, 3]
+
+
+def test_pages_are_fetched_lazily_with_one_page_prefetch(amap_service):
+    gate = threading.Event()
+    service = amap_service(respond=poi_pages(100, gate=gate))
+    it = service.iter_poi('老乡鸡', '苏州', page_size=25)
+    assert pages_requested(service) == []  # 生成器创建时不发请求
+    assert next(it)['id'] == '0'
+    # 消费第1页时第2页已在后台请求，第3页尚未请求
+    wait_until(lambda: pages_requested(service) == [1, 2])
+    gate.set()
+    for _ in range(24):
+        next(it)
+    assert next(it)['id'] == '25'
+    wait_until(lambda: pages_requested(service) == [1, 2, 3])
+    it.close()
+
+
+def test_limit_stops_early(amap_service):
+    service = amap_service(respond=poi_pages(1000))
+    pois = list(service.iter_poi('老乡鸡', '苏州', page_size=25, limit=30))
+    assert len(pois) == 30
+    assert pages_requested(service) == [1, 2]
+    assert list(service.iter_poi('老乡鸡', '苏州', limit=0)) == []
+
+
+def test_non_strict_ends_silently_on_failed_page(amap_service):
+    service = amap_service(respond=poi_pages(60, failing_pages={2}))
+    pois = list(service.iter_poi('老乡鸡', '苏州', page_size=25))
+    assert [p['id'] for p in pois] == [str(i) for i in range(25)]
+
+
+def test_strict_raises_on_failed_page(amap_service):
+    service = amap_service(respond=poi_pages(60, failing_pages={2}))
+    it = service.iter_poi('老乡鸡', '苏州', page_size=25, strict=True)
+    assert len([next(it) for _ in range(25)]) == 25
+    with pytest.raises(AMapError, match='第2页'):
+        next(it)
+
+
+def test_max_pages_truncation(amap_service):
+    service = amap_service(respond=poi_pages(100))
+    assert len(list(service.iter_poi('老乡鸡', '苏州', page_size=25, max_pages=2))) == 50
+    with pytest.raises(AMapError, match='页上限'):
+        list(service.iter_poi('老乡鸡', '苏州', page_size=25, max_pages=2, strict=True))
+    # 恰好在上限内取完时 strict 不报错
+    assert len(list(service.iter_poi('老乡鸡', '苏州', page_size=25, max_pages=4, strict=True))) == 100
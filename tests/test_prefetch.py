@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""商圈预取：切换城市取消本会话未开始的任务，跨会话去重，配额不足或强制刷新时不预取"""
+
+import threading
+import time
+
+import pytest
+
+import location_core as lc
+from location_core import AnalysisCache, DistrictPrefetcher
+
+
+class BlockingAnalyze:
+    """替代 analyze_district：记录调用，直到 release 后才返回（并写入分析缓存）"""
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+
+    def __call__(self, city, district, client, use_mock, poi_backend=None, competitor='大米先生', cache=None):
+        self.started.append((city, district))
+        self.release.wait(5)
+        mode = 'mock' if use_mock or client is None else 'real'
+        return cache.get_or_compute('district', city, district, mode, lambda: {'district': district},
+                                    extra=(competitor,))
+
+
+class FakeClient:
+    def __init__(self, quota_remaining=None, bypass_cache=False):
+        self.quota_remaining = quota_remaining
+        self.bypass_cache = bypass_cache
+        self.warmed = []
+
+    def pool_stats(self):
+        return {'quota_remaining': self.quota_remaining}
+
+    def warm_competitor_density(self, keyword, city):
+        self.warmed.append((keyword, city))
+
+
+@pytest.fixture
+def analyze(monkeypatch):
+    fake = BlockingAnalyze()
+    monkeypatch.setattr(lc, 'analyze_district', fake)
+    yield fake
+    fake.release.set()
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_switching_city_cancels_pending_tasks_of_that_session(analyze):
+    prefetcher = DistrictPrefetcher(AnalysisCache(), max_workers=1)
+    assert prefetcher.prefetch('s1', '苏州', ['a', 'b', 'c']) == 3
+    wait_until(lambda: analyze.started == [('苏州', 'a')])
+    assert prefetcher.prefetch('s1', '郑州', ['x']) == 1
+    assert prefetcher.stats()['cancelled'] == 2  # 正在执行的 a 不取消
+    analyze.release.set()
+    wait_until(lambda: prefetcher.stats()['pending'] == 0)
+    assert analyze.started == [('苏州', 'a'), ('郑州', 'x')]
+    assert prefetcher.stats()['completed'] == 2
+    # 被取消的商圈回到该城市时可以重新预取；已缓存的跳过
+    assert prefetcher.prefetch('s1', '苏州', ['a', 'b']) == 1
+
+
+def test_tasks_are_shared_across_sessions(analyze):
+    prefetcher = DistrictPrefetcher(AnalysisCache(), max_workers=1)
+    assert prefetcher.prefetch('s1', '苏州', ['a', 'b', 'c']) == 3
+    assert prefetcher.prefetch('s2', '苏州', ['b', 'c', 'd']) == 1
+    wait_until(lambda: len(analyze.started) == 1)
+    # s2 切走时，s1 仍在等待的 b、c 不取消，只取消 s2 独有的 d
+    prefetcher.prefetch('s2', '郑州', [])
+    assert prefetcher.stats()['cancelled'] == 1
+    analyze.release.set()
+    wait_until(lambda: prefetcher.stats()['pending'] == 0)
+    assert sorted(d for _, d in analyze.started) == ['a', 'b', 'c']
+
+
+def test_failed_prefetch_is_not_retried_immediately(monkeypatch):
+    def failing(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(lc, 'analyze_district', failing)
+    prefetcher = DistrictPrefetcher(AnalysisCache(), max_workers=1)
+    assert prefetcher.prefetch('s1', '苏州', ['a']) == 1
+    wait_until(lambda: prefetcher.stats()['failed'] == 1)
+    assert prefetcher.prefetch('s1', '苏州', ['a']) == 0
+
+
+def test_quota_guard_and_density_warmup(analyze):
+    analyze.release.set()
+    prefetcher = DistrictPrefetcher(AnalysisCache(), max_workers=1)
+    low = FakeClient(quota_remaining=lc.PREFETCH_MIN_QUOTA - 1)
+    assert prefetcher.prefetch('s1', '苏州', ['a'], low, use_mock=False) == 0
+    assert low.warmed == [] and analyze.started == []
+
+    ok = FakeClient(quota_remaining=lc.PREFETCH_MIN_QUOTA)
+    assert prefetcher.prefetch('s1', '苏州', ['a'], ok, use_mock=False, competitor='老乡鸡') == 1
+    assert ok.warmed == [('老乡鸡', '苏州')]
+
+
+def test_bypassing_client_does_not_prefetch(analyze):
+    prefetcher = DistrictPrefetcher(AnalysisCache(), max_workers=1)
+    client = FakeClient(bypass_cache=True)
+    assert prefetcher.prefetch('s1', '苏州', ['a'], client, use_mock=False) == 0
+    assert client.warmed == [] and analyze.started == []
+    # 模拟数据模式不使用客户端，不受影响
+    assert prefetcher.prefetch('s1', '苏州', ['a'], client, use_mock=True) == 1
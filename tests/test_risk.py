@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""risk_assessment_frame 与逐行 risk_assessment 完全一致"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from location_core import DEFAULT_BRAND_CONFIG, risk_assessment, risk_assessment_frame
+
+CITY_FIELDS = {'growth_potential': (60, 100), 'logistics_score': (60, 100), 'policy_score': (50, 100)}
+DISTRICT_FIELDS = {'competitor_count': (0, 15), 'avg_rent': (80, 400), 'visibility_score': (40, 100)}
+
+
+def random_rows(n, seed=0):
+    """随机特征行，部分字段缺失（对应标量版 .get 的默认值）"""
+    rng = np.random.default_rng(seed)
+    city, district, fin = [], [], []
+    for _ in range(n):
+        city.append({k: int(rng.integers(lo, hi)) for k, (lo, hi) in CITY_FIELDS.items() if rng.random() > 0.15})
+        district.append({k: int(rng.integers(lo, hi)) for k, (lo, hi) in DISTRICT_FIELDS.items()
+                         if rng.random() > 0.15})
+        fin.append({'breakeven_month': int(rng.choice([12, 18, 19, 24, 25, 40, 99])),
+                    'monthly_profit': float(rng.uniform(-50000, 150000))})
+    return city, district, fin
+
+
+@pytest.mark.parametrize('brand_config', [
+    DEFAULT_BRAND_CONFIG,
+    dict(DEFAULT_BRAND_CONFIG, avg_price=68, budget_max=300),
+])
+def test_frame_matches_scalar(brand_config):
+    city, district, fin = random_rows(2000)
+    frame = risk_assessment_frame(pd.DataFrame(city), pd.DataFrame(district), pd.DataFrame(fin), brand_config)
+    assert len(frame) == 2000
+    for i in range(len(frame)):
+        risks, total = risk_assessment(city[i], district[i], fin[i], brand_config)
+        for category, items in risks.items():
+            for item, value in items.items():
+                assert frame.at[i, f'{category}_{item}'] == value, (i, category, item)
+        assert frame.at[i, 'total_risk'] == total
+
+
+def test_frame_accepts_array_dicts_and_missing_columns():
+    fin = {'breakeven_month': np.array([20, 30]), 'monthly_profit': np.array([60000.0, 10000.0])}
+    frame = risk_assessment_frame({}, {'avg_rent': [300, 100]}, fin, DEFAULT_BRAND_CONFIG)
+    for i in range(2):
+        _, total = risk_assessment({}, {'avg_rent': [300, 100][i]},
+                                   {k: v[i] for k, v in fin.items()}, DEFAULT_BRAND_CONFIG)
+        assert frame.at[i, 'total_risk'] == total
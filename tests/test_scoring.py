@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""多进程评分与后台任务的排名与串行 score_candidates 一致（模拟数据模式）"""
+
+import pandas as pd
+import pytest
+
+import location_core as lc
+from location_core import DEFAULT_BRAND_CONFIG, score_candidates, score_candidates_parallel
+from location_jobs import JobQueue, city_scan_candidates, scan_cities
+
+KEY_COLUMNS = ['rank', 'city', 'district', 'avg_price', 'match_score']
+
+
+@pytest.fixture(scope='module')
+def candidates():
+    """全部词典城市的全城扫描候选（多档客单价，含大量同分行以检验稳定排序）"""
+    frames = [city_scan_candidates(city, [39, 49, 59]) for city in scan_cities()]
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def serial(candidates):
+    return score_candidates(candidates, DEFAULT_BRAND_CONFIG)
+
+
+def assert_same_ranking(result, expected):
+    pd.testing.assert_frame_equal(result[KEY_COLUMNS].reset_index(drop=True),
+                                  expected[KEY_COLUMNS].reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize('workers,chunk_size', [(1, 7), (2, 13), (3, 1000)])
+def test_parallel_matches_serial(candidates, serial, workers, chunk_size):
+    result = score_candidates_parallel(candidates, DEFAULT_BRAND_CONFIG, workers=workers, chunk_size=chunk_size)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), serial.reset_index(drop=True))
+
+
+def test_in_process_scoring_leaves_worker_global_untouched(candidates, monkeypatch):
+    sentinel = {'brand_config': {'name': '其他任务'}, 'context_key': 'abc'}
+    monkeypatch.setattr(lc, '_score_worker', dict(sentinel))
+    score_candidates_parallel(candidates.head(20), DEFAULT_BRAND_CONFIG, workers=1, chunk_size=7)
+    assert lc._score_worker == sentinel
+
+
+def test_job_matches_serial(tmp_path, candidates, serial):
+    queue = JobQueue(root=str(tmp_path), workers=2, chunk_size=11)
+    job_id = queue.create(candidates, DEFAULT_BRAND_CONFIG)
+    assert queue.run(job_id) == 'done'
+    assert_same_ranking(queue.result(job_id), serial)
+
+
+def test_resumed_job_matches_serial(tmp_path, candidates, serial):
+    queue = JobQueue(root=str(tmp_path), workers=2, chunk_size=11)
+    job_id = queue.create(candidates, DEFAULT_BRAND_CONFIG)
+    assert queue.run(job_id) == 'done'
+    # 丢弃最终结果与部分分块，续跑只补算缺失的块
+    parts_dir = tmp_path / job_id / 'parts'
+    parts = sorted(parts_dir.iterdir())
+    assert len(parts) > 2
+    for part in parts[::2]:
+        part.unlink()
+    for result in tmp_path.joinpath(job_id).glob('result.*'):
+        result.unlink()
+    assert queue.run(job_id) == 'done'
+    assert_same_ranking(queue.result(job_id), serial)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""敏感性分析记忆化：扩大扫描范围只计算新增格点；请求超过记忆上限时结果仍完整正确"""
+
+import numpy as np
+import pytest
+
+from location_core import (SENSITIVITY_PARAMS, SensitivityMemo, financial_forecast_batch, sensitivity_grid,
+                           sensitivity_values, tornado_analysis)
+
+BASE = dict(avg_price=49, seat_count=120, monthly_rent=6.0, labor_cost=8.0, food_cost_rate=35, utility_rate=5,
+            marketing_rate=3, initial_investment=1_500_000, city='苏州', table_turnover=2.8)
+
+
+def direct(scenarios):
+    cols = {p: [sc[p] for sc in scenarios] for p in list(SENSITIVITY_PARAMS) + ['city']}
+    res = financial_forecast_batch(**cols, return_cashflow=False)
+    return res['breakeven_month'], res['roe']
+
+
+def grid_scenarios(x_param, x_values, y_param, y_values):
+    return [dict(BASE, **{x_param: x, y_param: y}) for y in y_values for x in x_values]
+
+
+def test_values_keep_existing_points_when_range_widens():
+    narrow = sensitivity_values(6.0, 20, 5)
+    wide = sensitivity_values(6.0, 40, 5)
+    assert len(narrow) == 9 and len(wide) == 17
+    assert set(narrow) <= set(wide)
+
+
+def test_widening_range_reuses_existing_grid_points():
+    memo = SensitivityMemo()
+    xs, ys = sensitivity_values(6.0, 20, 5), sensitivity_values(2.8, 20, 5)
+    first = sensitivity_grid(BASE, 'monthly_rent', xs, 'table_turnover', ys, memo)
+    assert memo.computed == 81 and memo.reused == 0
+
+    wide_x, wide_y = sensitivity_values(6.0, 40, 5), sensitivity_values(2.8, 40, 5)
+    second = sensitivity_grid(BASE, 'monthly_rent', wide_x, 'table_turnover', wide_y, memo)
+    assert memo.computed == 17 * 17 and memo.reused == 81
+
+    breakeven, roe = direct(grid_scenarios('monthly_rent', wide_x, 'table_turnover', wide_y))
+    np.testing.assert_array_equal(second['breakeven'].ravel(), breakeven)
+    np.testing.assert_allclose(second['roe'].ravel(), roe)
+    inner = np.ix_([wide_y.index(y) for y in ys], [wide_x.index(x) for x in xs])
+    np.testing.assert_allclose(second['roe'][inner], first['roe'])
+
+
+def test_request_larger_than_cap_is_complete():
+    memo = SensitivityMemo(max_entries=50)
+    xs, ys = sensitivity_values(49, 50, 5), sensitivity_values(120, 50, 5)  # 21×21 = 441 个情景
+    result = sensitivity_grid(BASE, 'avg_price', xs, 'seat_count', ys, memo)
+    breakeven, roe = direct(grid_scenarios('avg_price', xs, 'seat_count', ys))
+    np.testing.assert_array_equal(result['breakeven'].ravel(), breakeven)
+    np.testing.assert_allclose(result['roe'].ravel(), roe)
+    assert len(memo._memo) == 50
+
+    # 重复请求：淘汰掉的格点重新计算，结果不变
+    again = sensitivity_grid(BASE, 'avg_price', xs, 'seat_count', ys, memo)
+    np.testing.assert_allclose(again['roe'], result['roe'])
+    assert len(memo._memo) == 50
+
+
+def test_duplicate_scenarios_in_one_request_compute_once():
+    memo = SensitivityMemo()
+    breakeven, roe = memo.evaluate([BASE, dict(BASE), dict(BASE, avg_price=59)])
+    assert memo.computed == 2 and memo.reused == 1
+    assert breakeven[0] == breakeven[1] and roe[0] == roe[1]
+
+
+def test_city_is_part_of_the_key():
+    memo = SensitivityMemo()
+    _, roe = memo.evaluate([BASE, dict(BASE, city='郑州')])
+    assert memo.computed == 2 and roe[0] != roe[1]
+
+
+def test_tornado_matches_direct_swings():
+    memo = SensitivityMemo()
+    df = tornado_analysis(BASE, memo, swing_pct=20)
+    assert len(df) == len(SENSITIVITY_PARAMS)
+    assert list(df['影响幅度']) == sorted(df['影响幅度'])
+    rent = df[df['参数'] == SENSITIVITY_PARAMS['monthly_rent']].iloc[0]
+    _, roe = direct([dict(BASE, monthly_rent=6.0 * 0.8), dict(BASE, monthly_rent=6.0 * 1.2)])
+    assert rent['下调ROE'] == pytest.approx(roe[0]) and rent['上调ROE'] == pytest.approx(roe[1])
+    computed = memo.computed
+    tornado_analysis(BASE, memo, swing_pct=20)
+    assert memo.computed == computed